@@ -74,6 +74,16 @@ export const SettingsTab: React.FC = observer(() => {
           path="fast"
           defaultValue={false}
         />
+        <VarSlider
+          label="Converted model cache size"
+          path="stateCacheSize"
+          defaultValue={0}
+          min={0}
+          max={256}
+          step={1}
+          unit="GB"
+          showInput
+        />
         <VarString label="Extra arguments" path="extraArgs" defaultValue="" />
       </VarCategoryScope>
     </TabPanel>
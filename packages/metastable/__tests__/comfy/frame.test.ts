@@ -0,0 +1,33 @@
+import {
+  encodeFrame,
+  FrameDecoder,
+  RPCFrame,
+} from '../../src/comfy/rpc/frame.js';
+
+describe('frame', () => {
+  it('should decode frames split across chunks', async () => {
+    const data = Buffer.concat([
+      ...encodeFrame('{"a":1}', [Buffer.from('\x1ebinary'), Buffer.alloc(0)]),
+      ...encodeFrame('{"b":2}'),
+    ]);
+
+    const decoder = new FrameDecoder();
+    const frames: RPCFrame[] = [];
+    decoder.on('data', frame => frames.push(frame));
+
+    for (let i = 0; i < data.byteLength; i += 3) {
+      decoder.write(data.subarray(i, i + 3));
+    }
+    await new Promise<void>(resolve => decoder.end(() => resolve()));
+
+    expect(frames.map(frame => frame.header.toString())).toEqual([
+      '{"a":1}',
+      '{"b":2}',
+    ]);
+    expect(frames[0].buffers.map(buffer => buffer.toString())).toEqual([
+      '\x1ebinary',
+      '',
+    ]);
+    expect(frames[1].buffers).toEqual([]);
+  });
+});
@@ -7,6 +7,7 @@ import { fileURLToPath } from 'url';
 import { BackendStatus, LogItem } from '@metastable/types';
 
 import type { PythonInstance } from '../python/index.js';
+import { getSharedDir } from './rpc/helpers.js';
 import { RPC } from './rpc/rpc.js';
 
 const baseDir = path.join(
@@ -19,7 +20,7 @@ type BackendEvents = {
   log: [item: LogItem];
   reset: [];
   status: [status: BackendStatus];
-  modelCacheChange: [];
+  modelCacheChange: [data?: { reason?: string; paths?: string[] }];
 };
 
 export class Comfy extends EventEmitter<BackendEvents> {
@@ -35,13 +36,13 @@ export class Comfy extends EventEmitter<BackendEvents> {
   ) {
     super();
 
-    this.rpc.on('event', (eventName: string) => {
+    this.rpc.on('event', (eventName: string, eventData: any) => {
       switch (eventName) {
         case 'ready':
           this.setStatus('ready');
           break;
         case 'model_cache_change':
-          this.emit('modelCacheChange');
+          this.emit('modelCacheChange', eventData);
           break;
       }
     });
@@ -68,6 +69,7 @@ export class Comfy extends EventEmitter<BackendEvents> {
     const proc = await this.python.spawn([this.mainPath, ...args], {
       ...this.env,
       PYTORCH_MPS_HIGH_WATERMARK_RATIO: '0.0',
+      METASTABLE_SHM_DIR: await getSharedDir(),
     });
 
     proc.on('spawn', () => this.setStatus('starting'));
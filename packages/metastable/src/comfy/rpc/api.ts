@@ -7,8 +7,41 @@ export function getApi(rpc: RPC) {
       destroy(): Promise<void> {
         return rpc.invoke(undefined, 'session:destroy') as any;
       },
-      start(): Promise<string> {
-        return rpc.invoke(undefined, 'session:start') as any;
+      release(args: { refs: number[]; force?: boolean }): Promise<number> {
+        return rpc.invoke(undefined, 'session:release', {
+          refs: args.refs,
+          force: args.force,
+        }) as any;
+      },
+      releaseShared(args: { names: string[] }): Promise<void> {
+        return rpc.invoke(undefined, 'session:release_shared', {
+          names: args.names,
+        }) as any;
+      },
+      start(args: { ttl?: number }): Promise<string> {
+        return rpc.invoke(undefined, 'session:start', {
+          ttl: args.ttl,
+        }) as any;
+      },
+      stats(): Promise<{
+        references: {
+          ref: number;
+          type: string;
+          size: number;
+          device?: string;
+          count: number;
+          idle: number;
+        }[];
+        size: number;
+      }> {
+        return rpc.invoke(undefined, 'session:stats') as any;
+      },
+    },
+    rpc: {
+      cancel(args: { requestId: string }): Promise<void> {
+        return rpc.invoke(undefined, 'rpc:cancel', {
+          request_id: args.requestId,
+        }) as any;
       },
     },
     instance: {
@@ -19,9 +52,11 @@ export function getApi(rpc: RPC) {
           config_path?: string;
           model_type?: string;
         }[];
+        memoryRequired?: number;
       }): Promise<void> {
         return rpc.invoke(undefined, 'instance:cleanup_models', {
           except_for: args.exceptFor,
+          memory_required: args.memoryRequired,
         }) as any;
       },
       info(): Promise<{
@@ -45,10 +80,101 @@ export function getApi(rpc: RPC) {
       }> {
         return rpc.invoke(undefined, 'instance:info') as any;
       },
+      inspect(args: { paths: string[] }): Promise<
+        {
+          path: string;
+          format: string;
+          type?: string;
+          architecture?: string;
+          image_model?: string;
+          latent_type?: string;
+          parameters?: number;
+          dtype?: string;
+          has_vae?: boolean;
+          error?: string;
+        }[]
+      > {
+        return rpc.invoke(undefined, 'instance:inspect', {
+          paths: args.paths,
+        }) as any;
+      },
+      prefetch(args: {
+        models: {
+          path: string;
+          embeddings_path?: string;
+          config_path?: string;
+          model_type?: string;
+          loader: string;
+        }[];
+      }): Promise<string[]> {
+        return rpc.invoke(undefined, 'instance:prefetch', {
+          models: args.models,
+        }) as any;
+      },
+      configureCache(args: {
+        ramBudget?: number;
+        vramBudget?: number;
+        policy?: string;
+      }): Promise<void> {
+        return rpc.invoke(undefined, 'instance:configure_cache', {
+          ram_budget: args.ramBudget,
+          vram_budget: args.vramBudget,
+          policy: args.policy,
+        }) as any;
+      },
+      importProfile(args: { limit?: number } = {}): Promise<{
+        phases: Record<string, number>;
+        packages: { package: string; time: number; modules: number }[];
+        modules: { module: string; self: number; total: number }[];
+      }> {
+        return rpc.invoke(undefined, 'instance:import_profile', {
+          limit: args.limit,
+        }) as any;
+      },
+      cacheStats(): Promise<{
+        entries: {
+          path: string;
+          cached: boolean;
+          hits: number;
+          misses: number;
+          load_time: number;
+          last_load_time: number;
+          phases: Record<string, number>;
+          ram: number;
+          vram: number;
+          last_used?: number;
+          evictions: number;
+          last_eviction_reason?: string;
+        }[];
+        hits: number;
+        misses: number;
+        ram: number;
+        vram: number;
+        ram_budget?: number;
+        vram_budget?: number;
+        policy: string;
+      }> {
+        return rpc.invoke(undefined, 'instance:cache_stats') as any;
+      },
+      stateCacheStats(): Promise<{
+        entries: number;
+        size: number;
+        budget?: number;
+        hits: number;
+        misses: number;
+        writes: number;
+      }> {
+        return rpc.invoke(undefined, 'instance:state_cache_stats') as any;
+      },
+      clearStateCache(): Promise<void> {
+        return rpc.invoke(undefined, 'instance:clear_state_cache') as any;
+      },
       loadedModels(): Promise<
         {
           path: string;
           size?: number;
+          ram?: number;
+          vram?: number;
         }[]
       > {
         return rpc.invoke(undefined, 'instance:loaded_models') as any;
@@ -62,8 +188,41 @@ export function getSessionApi(session: RPCSession) {
       destroy(): Promise<void> {
         return session.invoke('session:destroy') as any;
       },
-      start(): Promise<string> {
-        return session.invoke('session:start') as any;
+      release(args: { refs: number[]; force?: boolean }): Promise<number> {
+        return session.invoke('session:release', {
+          refs: args.refs,
+          force: args.force,
+        }) as any;
+      },
+      releaseShared(args: { names: string[] }): Promise<void> {
+        return session.invoke('session:release_shared', {
+          names: args.names,
+        }) as any;
+      },
+      start(args: { ttl?: number }): Promise<string> {
+        return session.invoke('session:start', {
+          ttl: args.ttl,
+        }) as any;
+      },
+      stats(): Promise<{
+        references: {
+          ref: number;
+          type: string;
+          size: number;
+          device?: string;
+          count: number;
+          idle: number;
+        }[];
+        size: number;
+      }> {
+        return session.invoke('session:stats') as any;
+      },
+    },
+    rpc: {
+      cancel(args: { requestId: string }): Promise<void> {
+        return session.invoke('rpc:cancel', {
+          request_id: args.requestId,
+        }) as any;
       },
     },
     checkpoint: {
@@ -128,9 +287,11 @@ export function getSessionApi(session: RPCSession) {
           config_path?: string;
           model_type?: string;
         }[];
+        memoryRequired?: number;
       }): Promise<void> {
         return session.invoke('instance:cleanup_models', {
           except_for: args.exceptFor,
+          memory_required: args.memoryRequired,
         }) as any;
       },
       info(): Promise<{
@@ -154,10 +315,101 @@ export function getSessionApi(session: RPCSession) {
       }> {
         return session.invoke('instance:info') as any;
       },
+      inspect(args: { paths: string[] }): Promise<
+        {
+          path: string;
+          format: string;
+          type?: string;
+          architecture?: string;
+          image_model?: string;
+          latent_type?: string;
+          parameters?: number;
+          dtype?: string;
+          has_vae?: boolean;
+          error?: string;
+        }[]
+      > {
+        return session.invoke('instance:inspect', {
+          paths: args.paths,
+        }) as any;
+      },
+      prefetch(args: {
+        models: {
+          path: string;
+          embeddings_path?: string;
+          config_path?: string;
+          model_type?: string;
+          loader: string;
+        }[];
+      }): Promise<string[]> {
+        return session.invoke('instance:prefetch', {
+          models: args.models,
+        }) as any;
+      },
+      configureCache(args: {
+        ramBudget?: number;
+        vramBudget?: number;
+        policy?: string;
+      }): Promise<void> {
+        return session.invoke('instance:configure_cache', {
+          ram_budget: args.ramBudget,
+          vram_budget: args.vramBudget,
+          policy: args.policy,
+        }) as any;
+      },
+      importProfile(args: { limit?: number } = {}): Promise<{
+        phases: Record<string, number>;
+        packages: { package: string; time: number; modules: number }[];
+        modules: { module: string; self: number; total: number }[];
+      }> {
+        return session.invoke('instance:import_profile', {
+          limit: args.limit,
+        }) as any;
+      },
+      cacheStats(): Promise<{
+        entries: {
+          path: string;
+          cached: boolean;
+          hits: number;
+          misses: number;
+          load_time: number;
+          last_load_time: number;
+          phases: Record<string, number>;
+          ram: number;
+          vram: number;
+          last_used?: number;
+          evictions: number;
+          last_eviction_reason?: string;
+        }[];
+        hits: number;
+        misses: number;
+        ram: number;
+        vram: number;
+        ram_budget?: number;
+        vram_budget?: number;
+        policy: string;
+      }> {
+        return session.invoke('instance:cache_stats') as any;
+      },
+      stateCacheStats(): Promise<{
+        entries: number;
+        size: number;
+        budget?: number;
+        hits: number;
+        misses: number;
+        writes: number;
+      }> {
+        return session.invoke('instance:state_cache_stats') as any;
+      },
+      clearStateCache(): Promise<void> {
+        return session.invoke('instance:clear_state_cache') as any;
+      },
       loadedModels(): Promise<
         {
           path: string;
           size?: number;
+          ram?: number;
+          vram?: number;
         }[]
       > {
         return session.invoke('instance:loaded_models') as any;
@@ -233,9 +485,13 @@ export function getSessionApi(session: RPCSession) {
           denoise: args.denoise,
         }) as any;
       },
-      randomNoise(args: { seed: number }): Promise<RPCRef<'Noise'>> {
+      randomNoise(args: {
+        seed: number;
+        mode?: 'cpu' | 'philox';
+      }): Promise<RPCRef<'Noise'>> {
         return session.invoke('sampling:random_noise', {
           seed: args.seed,
+          mode: args.mode,
         }) as any;
       },
       sample(args: {
@@ -254,6 +510,8 @@ export function getSessionApi(session: RPCSession) {
         seed: number;
         isCircular?: boolean;
         preview?: any;
+        noiseMode?: 'cpu' | 'philox';
+        stepCache?: RPCRef<'StepCache'>;
       }): Promise<RPCRef<'LatentTensor'>> {
         return session.invoke('sampling:sample', {
           diffusion_model: args.diffusionModel,
@@ -268,6 +526,8 @@ export function getSessionApi(session: RPCSession) {
           seed: args.seed,
           is_circular: args.isCircular,
           preview: args.preview,
+          noise_mode: args.noiseMode,
+          step_cache: args.stepCache,
         }) as any;
       },
       sampleCustom(args: {
@@ -280,6 +540,7 @@ export function getSessionApi(session: RPCSession) {
           noiseMask?: RPCRef<'LatentTensor'>;
         };
         preview?: any;
+        stepCache?: RPCRef<'StepCache'>;
       }): Promise<RPCRef<'LatentTensor'>> {
         return session.invoke('sampling:sample_custom', {
           noise: args.noise,
@@ -288,10 +549,45 @@ export function getSessionApi(session: RPCSession) {
           sigmas: args.sigmas,
           latent: args.latent,
           preview: args.preview,
+          step_cache: args.stepCache,
+        }) as any;
+      },
+      stepCache(args: { threshold?: number } = {}): Promise<RPCRef<'StepCache'>> {
+        return session.invoke('sampling:step_cache', {
+          threshold: args.threshold,
+        }) as any;
+      },
+      stepCacheStats(args: { stepCache: RPCRef<'StepCache'> }): Promise<{
+        model?: string;
+        calls: number;
+        skipped: number;
+      }> {
+        return session.invoke('sampling:step_cache_stats', {
+          step_cache: args.stepCache,
         }) as any;
       },
     },
     textEncoder: {
+      cacheStats(): Promise<{
+        entries: number;
+        size: number;
+        budget: number;
+        disk_budget?: number;
+        hits: number;
+        disk_hits: number;
+        misses: number;
+      }> {
+        return session.invoke('text_encoder:cache_stats') as any;
+      },
+      configureCache(args: {
+        budget?: number;
+        diskBudget?: number;
+      }): Promise<void> {
+        return session.invoke('text_encoder:configure_cache', {
+          budget: args.budget,
+          disk_budget: args.diskBudget,
+        }) as any;
+      },
       encode(args: {
         textEncoder: RPCRef<'TextEncoder'>;
         text: string;
@@ -301,6 +597,15 @@ export function getSessionApi(session: RPCSession) {
           text: args.text,
         }) as any;
       },
+      encodeBatch(args: {
+        textEncoder: RPCRef<'TextEncoder'>;
+        texts: string[];
+      }): Promise<RPCRef<'Conditioning'>[]> {
+        return session.invoke('text_encoder:encode_batch', {
+          text_encoder: args.textEncoder,
+          texts: args.texts,
+        }) as any;
+      },
       load(args: {
         paths: string[];
         type: string;
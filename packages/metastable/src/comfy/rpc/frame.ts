@@ -0,0 +1,113 @@
+import { Transform, TransformCallback } from 'stream';
+
+// Frame layout (little endian):
+//   u32 header length, u32 buffer count, u64 length for each buffer,
+//   followed by the JSON header and the raw buffers.
+const PREFIX_SIZE = 8;
+const BUFFER_LENGTH_SIZE = 8;
+
+export interface RPCFrame {
+  header: Buffer;
+  buffers: Buffer[];
+}
+
+export function encodeFrame(header: string, buffers: Buffer[] = []): Buffer[] {
+  const headerBuffer = Buffer.from(header, 'utf-8');
+  const prefix = Buffer.alloc(
+    PREFIX_SIZE + BUFFER_LENGTH_SIZE * buffers.length,
+  );
+  prefix.writeUInt32LE(headerBuffer.byteLength, 0);
+  prefix.writeUInt32LE(buffers.length, 4);
+  buffers.forEach((buffer, i) => {
+    prefix.writeBigUInt64LE(
+      BigInt(buffer.byteLength),
+      PREFIX_SIZE + BUFFER_LENGTH_SIZE * i,
+    );
+  });
+
+  return [prefix, headerBuffer, ...buffers];
+}
+
+export class FrameDecoder extends Transform {
+  private chunks: Buffer[] = [];
+  private length = 0;
+
+  constructor() {
+    super({ readableObjectMode: true });
+  }
+
+  _transform(
+    chunk: Buffer,
+    _encoding: BufferEncoding,
+    callback: TransformCallback,
+  ) {
+    this.chunks.push(chunk);
+    this.length += chunk.byteLength;
+
+    try {
+      let frame: RPCFrame | undefined;
+      while ((frame = this.readFrame())) {
+        this.push(frame);
+      }
+      callback();
+    } catch (e) {
+      callback(e as Error);
+    }
+  }
+
+  private peek(size: number) {
+    if (this.chunks[0].byteLength < size) {
+      this.chunks = [Buffer.concat(this.chunks, this.length)];
+    }
+
+    return this.chunks[0].subarray(0, size);
+  }
+
+  private readFrame(): RPCFrame | undefined {
+    if (this.length < PREFIX_SIZE) {
+      return undefined;
+    }
+
+    let data = this.peek(PREFIX_SIZE);
+    const headerLength = data.readUInt32LE(0);
+    const bufferCount = data.readUInt32LE(4);
+    const lengthsSize = BUFFER_LENGTH_SIZE * bufferCount;
+    if (this.length < PREFIX_SIZE + lengthsSize) {
+      return undefined;
+    }
+
+    data = this.peek(PREFIX_SIZE + lengthsSize);
+    const bufferLengths: number[] = [];
+    for (let i = 0; i < bufferCount; i++) {
+      bufferLengths.push(
+        Number(data.readBigUInt64LE(PREFIX_SIZE + BUFFER_LENGTH_SIZE * i)),
+      );
+    }
+
+    const frameSize =
+      PREFIX_SIZE +
+      lengthsSize +
+      headerLength +
+      bufferLengths.reduce((a, b) => a + b, 0);
+    if (this.length < frameSize) {
+      return undefined;
+    }
+
+    data = this.peek(frameSize);
+    let offset = PREFIX_SIZE + lengthsSize;
+    const header = data.subarray(offset, offset + headerLength);
+    offset += headerLength;
+
+    const buffers: Buffer[] = [];
+    for (const length of bufferLengths) {
+      buffers.push(data.subarray(offset, offset + length));
+      offset += length;
+    }
+
+    const rest = this.chunks[0].subarray(frameSize);
+    this.chunks = rest.byteLength ? [rest] : [];
+    this.length = rest.byteLength;
+
+    return { header, buffers };
+  }
+}
@@ -1,4 +1,8 @@
-import { RPCBytes } from './types.js';
+import fs from 'fs/promises';
+import os from 'os';
+import path from 'path';
+
+import { RPCBatchResult, RPCBytes, RPCShared } from './types.js';
 
 export function bufferToRpcBytes(buffer: Buffer): RPCBytes {
   return {
@@ -6,33 +10,43 @@ export function bufferToRpcBytes(buffer: Buffer): RPCBytes {
   };
 }
 
-export function deserializeObject<T>(object: T): T {
+export function batchResult(
+  index: number,
+  ...path: (string | number)[]
+): RPCBatchResult {
+  return { $result: index, path };
+}
+
+export function deserializeObject<T>(object: T, buffers: Buffer[] = []): T {
   if (object === null || typeof object !== 'object') {
     return object;
   }
 
   const obj = object as any;
-  if (obj['$bytes']) {
+  if (typeof obj['$bytes'] === 'number') {
+    return buffers[obj['$bytes']] as any;
+  } else if (obj['$bytes']) {
     return Buffer.from(obj['$bytes'], 'base64') as any;
   }
 
   for (const key of Object.keys(obj)) {
     if (typeof obj[key] === 'object') {
-      obj[key] = deserializeObject(obj[key]);
+      obj[key] = deserializeObject(obj[key], buffers);
     }
   }
 
   return obj;
 }
 
-export function serializeObject<T>(object: T): T {
+export function serializeObject<T>(object: T, buffers: Buffer[] = []): T {
   if (object === null || typeof object !== 'object') {
     return object;
   }
 
   if (object instanceof Buffer) {
+    buffers.push(object);
     return {
-      $bytes: object.toString('base64'),
+      $bytes: buffers.length - 1,
     } as any;
   }
 
@@ -40,9 +54,32 @@ export function serializeObject<T>(object: T): T {
 
   for (const key of Object.keys(obj)) {
     if (typeof obj[key] === 'object') {
-      obj[key] = serializeObject(obj[key]);
+      obj[key] = serializeObject(obj[key], buffers);
     }
   }
 
   return obj;
 }
+
+export async function getSharedDir() {
+  const base = (await fs.stat('/dev/shm').catch(() => undefined))?.isDirectory()
+    ? '/dev/shm'
+    : os.tmpdir();
+  return path.join(base, 'metastable');
+}
+
+export async function readShared(
+  shared: RPCShared,
+  sharedDir?: string,
+): Promise<Buffer> {
+  sharedDir ??= await getSharedDir();
+  const file = await fs.open(path.join(sharedDir, path.basename(shared.$shm)));
+
+  try {
+    const buffer = Buffer.alloc(shared.size);
+    await file.read(buffer, 0, shared.size, shared.offset);
+    return buffer;
+  } finally {
+    await file.close();
+  }
+}
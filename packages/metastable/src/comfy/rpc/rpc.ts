@@ -2,13 +2,20 @@ import { EventEmitter } from 'events';
 import { Readable, Writable } from 'stream';
 
 import { LogItem } from '@metastable/types';
-import es from 'event-stream';
 import { nanoid } from 'nanoid/non-secure';
 
 import { getApi } from './api.js';
+import { encodeFrame, FrameDecoder, RPCFrame } from './frame.js';
 import { deserializeObject, serializeObject } from './helpers.js';
 import { RPCSession } from './session.js';
-import { RPCRequest, RPCResponse } from './types.js';
+import {
+  RPCBatchCall,
+  RPCBatchRequest,
+  RPCChunk,
+  RPCInvokeOptions,
+  RPCRequest,
+  RPCResponse,
+} from './types.js';
 
 type RPCEvents = {
   log: [item: LogItem];
@@ -26,6 +33,7 @@ export class RPC extends EventEmitter<RPCEvents> {
     {
       resolve: (result: unknown) => void;
       reject: (error: any) => void;
+      onChunk?: (result: any, index: number) => void;
     }
   > = new Map();
 
@@ -50,10 +58,9 @@ export class RPC extends EventEmitter<RPCEvents> {
     this._readable = value;
 
     if (this._readable) {
-      this._readable.setEncoding('utf-8');
-      this._readable.pipe(es.split('\x1e')).on('data', data => {
+      this._readable.pipe(new FrameDecoder()).on('data', (frame: RPCFrame) => {
         try {
-          this.handleJson(JSON.parse(data));
+          this.handleFrame(frame);
         } catch {}
       });
     }
@@ -72,22 +79,76 @@ export class RPC extends EventEmitter<RPCEvents> {
     sessionId: string | undefined,
     method: string,
     params?: Record<string, any>,
+    options?: RPCInvokeOptions,
   ): Promise<unknown> {
     const id = nanoid();
-    this.write({
-      type: 'rpc',
-      method,
-      params: serializeObject(params),
-      id,
-      session: sessionId,
-    } as RPCRequest);
+    const buffers: Buffer[] = [];
+    return this.request(
+      {
+        type: 'rpc',
+        method,
+        params: serializeObject(params, buffers),
+        id,
+        session: sessionId,
+        shm: options?.shm,
+        stream: !!options?.onChunk,
+      } as RPCRequest,
+      buffers,
+      options,
+    );
+  }
+
+  /**
+   * Runs calls in order within a single request, later calls can refer to
+   * earlier results with batchResult().
+   */
+  batch(
+    sessionId: string | undefined,
+    calls: RPCBatchCall[],
+    options?: RPCInvokeOptions,
+  ): Promise<unknown[]> {
+    const id = nanoid();
+    const buffers: Buffer[] = [];
+    return this.request(
+      {
+        type: 'batch',
+        calls: calls.map(call => ({
+          method: call.method,
+          params: serializeObject(call.params, buffers),
+        })),
+        id,
+        session: sessionId,
+        shm: options?.shm,
+      } as RPCBatchRequest,
+      buffers,
+      options,
+    ) as Promise<unknown[]>;
+  }
+
+  private request(
+    data: RPCRequest | RPCBatchRequest,
+    buffers: Buffer[],
+    options?: RPCInvokeOptions,
+  ): Promise<unknown> {
+    const id = data.id;
+    this.write(data, buffers);
+
+    options?.signal?.addEventListener(
+      'abort',
+      () => {
+        if (this.rpcCallbacks.has(id)) {
+          this.api.rpc.cancel({ requestId: id }).catch(() => {});
+        }
+      },
+      { once: true },
+    );
 
     return new Promise((resolve, reject) => {
-      this.rpcCallbacks.set(id, { resolve, reject });
+      this.rpcCallbacks.set(id, { resolve, reject, onChunk: options?.onChunk });
     });
   }
 
-  handleRPC(response: RPCResponse) {
+  handleRPC(response: RPCResponse, buffers: Buffer[] = []) {
     const callbacks = this.rpcCallbacks.get(response.id);
     if (!callbacks) {
       console.log('Unhandled RPC response', response);
@@ -97,7 +158,7 @@ export class RPC extends EventEmitter<RPCEvents> {
     if (response.error) {
       callbacks.reject(new Error(response.error.message));
     } else {
-      callbacks.resolve(deserializeObject(response.result));
+      callbacks.resolve(deserializeObject(response.result, buffers));
     }
 
     this.rpcCallbacks.delete(response.id);
@@ -108,7 +169,7 @@ export class RPC extends EventEmitter<RPCEvents> {
       | ((session: RPCSession) => Promise<T>)
       | ((session: RPCSession) => T),
   ): Promise<T> {
-    const sessionId = await this.api.session.start();
+    const sessionId = await this.api.session.start({});
     const session = new RPCSession(this, sessionId);
     this.sessions[sessionId] = session;
 
@@ -120,9 +181,22 @@ export class RPC extends EventEmitter<RPCEvents> {
     return result;
   }
 
-  handleJson(e: any) {
+  handleChunk(chunk: RPCChunk, buffers: Buffer[] = []) {
+    this.rpcCallbacks
+      .get(chunk.id)
+      ?.onChunk?.(deserializeObject(chunk.result, buffers), chunk.index);
+  }
+
+  handleFrame(frame: RPCFrame) {
+    this.handleJson(JSON.parse(frame.header.toString('utf-8')), frame.buffers);
+  }
+
+  handleJson(e: any, buffers: Buffer[] = []) {
     if (e.type === 'rpc') {
-      this.handleRPC(e);
+      this.handleRPC(e, buffers);
+      return;
+    } else if (e.type === 'rpc.chunk') {
+      this.handleChunk(e, buffers);
       return;
     }
 
@@ -131,7 +205,7 @@ export class RPC extends EventEmitter<RPCEvents> {
         this.sessions[e.data.sessionId]?.emit('progress', {
           max: e.data.max,
           value: e.data.value,
-          preview: e.data.preview,
+          preview: deserializeObject(e.data.preview, buffers),
         });
         break;
       case 'rpc.log':
@@ -162,7 +236,9 @@ export class RPC extends EventEmitter<RPCEvents> {
     this.rpcCallbacks.clear();
   }
 
-  write(data: any) {
-    this._writable?.write(JSON.stringify(data) + '\n');
+  write(data: any, buffers: Buffer[] = []) {
+    for (const chunk of encodeFrame(JSON.stringify(data), buffers)) {
+      this._writable?.write(chunk);
+    }
   }
 }
@@ -2,7 +2,12 @@ import { EventEmitter } from 'events';
 
 import { getSessionApi } from './api.js';
 import type { RPC } from './rpc.js';
-import { RPCSessionLogEvent, RPCSessionProgressEvent } from './types.js';
+import {
+  RPCBatchCall,
+  RPCInvokeOptions,
+  RPCSessionLogEvent,
+  RPCSessionProgressEvent,
+} from './types.js';
 
 export type RPCSessionEvents = {
   progress: [event: RPCSessionProgressEvent];
@@ -20,8 +25,19 @@ export class RPCSession extends EventEmitter<RPCSessionEvents> {
     this.api = getSessionApi(this);
   }
 
-  invoke(method: string, params?: Record<string, any>): Promise<unknown> {
-    return this.rpc.invoke(this.id, method, params);
+  invoke(
+    method: string,
+    params?: Record<string, any>,
+    options?: RPCInvokeOptions,
+  ): Promise<unknown> {
+    return this.rpc.invoke(this.id, method, params, options);
+  }
+
+  batch(
+    calls: RPCBatchCall[],
+    options?: RPCInvokeOptions,
+  ): Promise<unknown[]> {
+    return this.rpc.batch(this.id, calls, options);
   }
 
   async destroy() {
@@ -1,7 +1,15 @@
+export interface RPCRawPreview {
+  format: 'raw';
+  width: number;
+  height: number;
+  data: Buffer;
+}
+
 export interface RPCSessionProgressEvent {
-  value: number;
-  max: number;
-  preview?: string;
+  // Missing from preview-only events.
+  value?: number;
+  max?: number;
+  preview?: string | RPCRawPreview;
 }
 
 export interface RPCSessionLogEvent {
@@ -15,7 +23,35 @@ export interface RPCRef<T = undefined> {
 }
 
 export interface RPCBytes {
-  $bytes: string;
+  /**
+   * Index of the buffer attached to the frame, or a base64 string.
+   */
+  $bytes: number | string;
+}
+
+export interface RPCShared {
+  $shm: string;
+  offset: number;
+  size: number;
+  dtype?: string;
+  shape?: number[];
+}
+
+export interface RPCInvokeOptions {
+  /**
+   * Return tensors and binary values as shared memory references.
+   */
+  shm?: boolean;
+
+  /**
+   * Cancels the request on the backend when aborted.
+   */
+  signal?: AbortSignal;
+
+  /**
+   * Receives items of generator methods as they're produced.
+   */
+  onChunk?: (result: any, index: number) => void;
 }
 
 export interface RPCRequest {
@@ -24,6 +60,36 @@ export interface RPCRequest {
   params?: Record<string, any>;
   id: string;
   session: string;
+  shm?: boolean;
+  stream?: boolean;
+}
+
+export interface RPCChunk {
+  type: 'rpc.chunk';
+  id: string;
+  index: number;
+  result: any;
+}
+
+/**
+ * Refers to the result of an earlier call in the same batch.
+ */
+export interface RPCBatchResult {
+  $result: number;
+  path?: (string | number)[];
+}
+
+export interface RPCBatchCall {
+  method: string;
+  params?: Record<string, any>;
+}
+
+export interface RPCBatchRequest {
+  type: 'batch';
+  calls: RPCBatchCall[];
+  id: string;
+  session: string;
+  shm?: boolean;
 }
 
 export interface RPCResponse {
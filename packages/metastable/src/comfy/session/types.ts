@@ -1,6 +1,8 @@
 export interface ComfyPreviewSettings {
   method: string;
   taesd?: any;
+  format?: 'jpeg' | 'webp' | 'raw';
+  max_fps?: number;
 }
 
 export interface ComfyCheckpointPaths {
@@ -15,6 +15,7 @@ import {
   TaskState,
 } from '@metastable/types';
 
+import { encodeRawPreview } from '#helpers/image.js';
 import { Metastable } from '#metastable';
 import { ProjectEntity } from '../../data/project.js';
 import { BaseTask } from '../../tasks/task.js';
@@ -191,14 +192,33 @@ export class BaseComfyTask<
   async execute() {
     try {
       await Metastable.instance.comfy!.rpc.session(async ctx => {
-        ctx.on('progress', e => {
-          this.progress = e.value / e.max;
-          this.data = {
-            ...this.data,
-            stepValue: e.value,
-            stepMax: e.max,
-            preview: e.preview,
-          };
+        let previewIndex = 0;
+        ctx.on('progress', async e => {
+          if (typeof e.value === 'number' && typeof e.max === 'number') {
+            this.progress = e.value / e.max;
+            this.data = {
+              ...this.data,
+              stepValue: e.value,
+              stepMax: e.max,
+            };
+          }
+
+          // Previews arrive separately from step updates.
+          if (typeof e.preview === 'string') {
+            previewIndex++;
+            this.data = { ...this.data, preview: e.preview };
+          } else if (e.preview?.format === 'raw') {
+            const index = ++previewIndex;
+            try {
+              const preview = await encodeRawPreview(e.preview);
+              // Skip previews encoded after a newer one arrived.
+              if (index === previewIndex) {
+                this.data = { ...this.data, preview };
+              }
+            } catch {
+              // Previews are best effort.
+            }
+          }
         });
 
         this.session = ctx;
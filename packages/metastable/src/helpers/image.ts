@@ -39,6 +39,21 @@ export async function generateThumbnail(filePath: string, force = false) {
   }
 }
 
+export async function encodeRawPreview(
+  preview: { width: number; height: number; data: Buffer },
+  format: 'jpeg' | 'webp' = 'jpeg',
+) {
+  const { default: sharp } = await import('sharp');
+  const image = sharp(preview.data, {
+    raw: { width: preview.width, height: preview.height, channels: 3 },
+  });
+  const buffer = await (format === 'webp'
+    ? image.webp({ quality: 70 })
+    : image.jpeg({ quality: 70 })
+  ).toBuffer();
+  return `data:image/${format};base64,${buffer.toString('base64')}`;
+}
+
 export const SHARP_FIT_MAP: Record<ProjectImageMode, keyof FitEnum> = {
   cover: 'cover',
   contain: 'contain',
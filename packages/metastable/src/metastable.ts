@@ -336,6 +336,9 @@ export class Metastable extends EventEmitter<MetastableEvents> {
     const config = await this.config.all();
 
     const args: string[] = [];
+    const env: Record<string, string> = {
+      METASTABLE_STATE_CACHE_DIR: path.join(this.internalPath, 'state_cache'),
+    };
 
     if (this.settings.comfyArgs) {
       args.push(...this.settings.comfyArgs);
@@ -352,6 +355,7 @@ export class Metastable extends EventEmitter<MetastableEvents> {
         extraArgs,
         cpuVae = false,
         fast = false,
+        stateCacheSize = 0,
       } = config.comfy;
 
       if (vramMode !== 'auto') {
@@ -373,6 +377,10 @@ export class Metastable extends EventEmitter<MetastableEvents> {
       if (fast) {
         args.push('--fast');
       }
+
+      if (stateCacheSize > 0) {
+        env.METASTABLE_STATE_CACHE_BUDGET = `${Math.round(stateCacheSize * 1024 ** 3)}`;
+      }
     }
 
     if (this.python) {
@@ -399,7 +407,13 @@ export class Metastable extends EventEmitter<MetastableEvents> {
       }
     }
 
-    return { args, env: config.comfy?.env };
+    return {
+      args,
+      env: {
+        ...env,
+        ...config.comfy?.env,
+      },
+    };
   }
 
   async restartComfy() {
@@ -0,0 +1,53 @@
+"""
+Compares safetensors read throughput of the available loading paths:
+
+    python benchmark_load.py model.safetensors --threads 1 4 8 16
+
+Every tensor is fully read in each run. The page cache is not dropped
+between runs, so either use files larger than RAM or drop it manually
+(echo 3 > /proc/sys/vm/drop_caches) to measure cold reads.
+"""
+
+import os
+import time
+import argparse
+
+import torch
+import safetensors
+
+from comfy.lazy_state_dict import LazyStateDict, read_parallel
+
+def load_safe_open(path):
+    with safetensors.safe_open(path, framework="pt", device="cpu") as f:
+        return { k: f.get_tensor(k) for k in f.keys() }
+
+def load_mmap(path):
+    sd = LazyStateDict(path)
+    # Views don't read anything until they're used.
+    return { k: v.clone() for k, v in sd.items() }
+
+def measure(name, path, load, repeat):
+    size = os.path.getsize(path)
+    for i in range(repeat):
+        start = time.perf_counter()
+        sd = load(path)
+        elapsed = time.perf_counter() - start
+        del sd
+        print(f"{name:<16} run {i + 1}: {elapsed:.2f}s, {size / elapsed / 1024 ** 3:.2f} GiB/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="safetensors load throughput benchmark")
+    parser.add_argument("path", type=str)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+
+    measure("safe_open", args.path, load_safe_open, args.repeat)
+    measure("mmap", args.path, load_mmap, args.repeat)
+    for threads in args.threads:
+        measure(f"parallel x{threads}", args.path, lambda path: read_parallel(path, threads)[0], args.repeat)
+
+if __name__ == "__main__":
+    main()
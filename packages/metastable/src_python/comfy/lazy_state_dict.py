@@ -0,0 +1,198 @@
+import json
+import mmap
+import struct
+import threading
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+if hasattr(torch, "float8_e4m3fn"):
+    SAFETENSORS_DTYPES["F8_E4M3"] = torch.float8_e4m3fn
+if hasattr(torch, "float8_e5m2"):
+    SAFETENSORS_DTYPES["F8_E5M2"] = torch.float8_e5m2
+
+READ_CHUNK_SIZE = 64 * 1024 * 1024
+
+class TensorInfo:
+    __slots__ = ("dtype", "shape", "start", "end")
+
+    def __init__(self, dtype, shape, start, end):
+        self.dtype = dtype
+        self.shape = shape
+        self.start = start
+        self.end = end
+
+def read_safetensors_header(path):
+    """
+    Returns (tensors, metadata, data_offset), with tensor offsets relative to
+    the start of the data section.
+    """
+    with open(path, "rb") as f:
+        length = f.read(8)
+        if len(length) < 8:
+            raise ValueError("MetadataIncompleteBuffer")
+        header_size = struct.unpack("<Q", length)[0]
+        if header_size > 100 * 1024 * 1024:
+            raise ValueError("HeaderTooLarge")
+        header = f.read(header_size)
+        if len(header) < header_size:
+            raise ValueError("MetadataIncompleteBuffer")
+
+    header = json.loads(header)
+    metadata = header.pop("__metadata__", None)
+    tensors = {}
+    for k, v in header.items():
+        if v["dtype"] not in SAFETENSORS_DTYPES:
+            raise ValueError("Unsupported safetensors dtype {} for {}".format(v["dtype"], k))
+        start, end = v["data_offsets"]
+        tensors[k] = TensorInfo(SAFETENSORS_DTYPES[v["dtype"]], v["shape"], start, end)
+
+    return tensors, metadata, 8 + header_size
+
+class LazyStateDict(MutableMapping):
+    """
+    State dict backed by a memory-mapped safetensors file. Tensors are
+    created on access as views of the mapping, so only the parts of the file
+    that are actually used get read. Assigned values are stored as-is.
+    """
+
+    def __init__(self, path=None, source=None):
+        self.entries = {}
+        if source is not None:
+            self.mmap = source.mmap
+            self.data_offset = source.data_offset
+            self.metadata = source.metadata
+            return
+
+        tensors, self.metadata, self.data_offset = read_safetensors_header(path)
+        with open(path, "rb") as f:
+            # Copy-on-write, in case anything modifies the loaded tensors in place.
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if len(tensors) > 0 else None
+        self.entries.update(tensors)
+
+    def empty(self):
+        return LazyStateDict(source=self)
+
+    def materialize(self, info):
+        start = self.data_offset + info.start
+        size = info.end - info.start
+        element_size = torch.empty((), dtype=info.dtype).element_size()
+        if size == 0:
+            return torch.empty(info.shape, dtype=info.dtype)
+
+        if start % element_size != 0:
+            # Misaligned tensors can't be viewed directly.
+            return torch.frombuffer(bytearray(self.mmap[start:start + size]), dtype=info.dtype).reshape(info.shape)
+
+        return torch.frombuffer(self.mmap, dtype=info.dtype, count=size // element_size, offset=start).reshape(info.shape)
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        if isinstance(value, TensorInfo):
+            return self.materialize(value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def pop_raw(self, key):
+        return self.entries.pop(key)
+
+    def set_raw(self, key, value):
+        self.entries[key] = value
+
+    def copy(self):
+        out = self.empty()
+        out.entries.update(self.entries)
+        return out
+
+    def nbytes(self, key):
+        value = self.entries[key]
+        if isinstance(value, TensorInfo):
+            return value.end - value.start
+        return value.nelement() * value.element_size()
+
+def move_key(source, target, key, new_key):
+    """
+    Moves a value between state dicts without reading it, if both are lazy.
+    """
+    if isinstance(source, LazyStateDict) and isinstance(target, LazyStateDict) and source.mmap is target.mmap:
+        target.set_raw(new_key, source.pop_raw(key))
+    else:
+        target[new_key] = source.pop(key)
+
+def read_parallel(path, threads, chunk_size=READ_CHUNK_SIZE):
+    """
+    Reads the whole data section of a safetensors file into memory using
+    several threads, each reading large chunk aligned ranges with its own
+    file handle. Returns (state_dict, metadata).
+    """
+    tensors, metadata, data_offset = read_safetensors_header(path)
+    data_size = max((info.end for info in tensors.values()), default=0)
+    data = torch.empty(data_size, dtype=torch.uint8)
+    view = memoryview(data.numpy())
+
+    local = threading.local()
+    files = []
+    files_lock = threading.Lock()
+
+    def read_chunk(offset):
+        f = getattr(local, "file", None)
+        if f is None:
+            f = local.file = open(path, "rb", buffering=0)
+            with files_lock:
+                files.append(f)
+
+        end = min(offset + chunk_size, data_size)
+        f.seek(data_offset + offset)
+        while offset < end:
+            read = f.readinto(view[offset:end])
+            if not read:
+                raise ValueError("MetadataIncompleteBuffer")
+            offset += read
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="safetensors-read") as executor:
+            list(executor.map(read_chunk, range(0, data_size, chunk_size)))
+    finally:
+        for f in files:
+            f.close()
+
+    sd = {}
+    for k, info in tensors.items():
+        element_size = torch.empty((), dtype=info.dtype).element_size()
+        t = data[info.start:info.end]
+        if info.start % element_size != 0:
+            t = t.clone()
+        sd[k] = t.view(info.dtype).reshape(info.shape)
+
+    return sd, metadata
@@ -118,8 +118,18 @@ class Flux(nn.Module):
         ids = torch.cat((txt_ids, img_ids), dim=1)
         pe = self.pe_embedder(ids)
 
+        #metastable: reuses the output of the blocks when their input barely changed, see StepCache
+        double_blocks, single_blocks = self.double_blocks, self.single_blocks
+        step_cache = transformer_options.get("step_cache")
+        if step_cache is not None:
+            img_mod1, _ = self.double_blocks[0].img_mod(vec)
+            modulated = (1 + img_mod1.scale) * self.double_blocks[0].img_norm1(img) + img_mod1.shift
+            cached = step_cache.check("flux", modulated, img, transformer_options)
+            if cached is not None:
+                img, double_blocks, single_blocks = cached, [], []
+
         blocks_replace = patches_replace.get("dit", {})
-        for i, block in enumerate(self.double_blocks):
+        for i, block in enumerate(double_blocks):
             if ("double_block", i) in blocks_replace:
                 def block_wrap(args):
                     out = {}
@@ -154,7 +164,7 @@ class Flux(nn.Module):
 
         img = torch.cat((txt, img), 1)
 
-        for i, block in enumerate(self.single_blocks):
+        for i, block in enumerate(single_blocks):
             if ("single_block", i) in blocks_replace:
                 def block_wrap(args):
                     out = {}
@@ -182,6 +192,9 @@ class Flux(nn.Module):
 
         img = img[:, txt.shape[1] :, ...]
 
+        if step_cache is not None:
+            step_cache.store(img)
+
         img = self.final_layer(img, vec)  # (N, T, patch_size ** 2 * out_channels)
         return img
 
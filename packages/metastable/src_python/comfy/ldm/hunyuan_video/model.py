@@ -259,8 +259,18 @@ class HunyuanVideo(nn.Module):
         else:
             attn_mask = None
 
+        #metastable: reuses the output of the blocks when their input barely changed, see StepCache
+        double_blocks, single_blocks = self.double_blocks, self.single_blocks
+        step_cache = transformer_options.get("step_cache")
+        if step_cache is not None:
+            img_mod1, _ = self.double_blocks[0].img_mod(vec)
+            modulated = (1 + img_mod1.scale) * self.double_blocks[0].img_norm1(img) + img_mod1.shift
+            cached = step_cache.check("hunyuan_video", modulated, img, transformer_options)
+            if cached is not None:
+                img, double_blocks, single_blocks = cached, [], []
+
         blocks_replace = patches_replace.get("dit", {})
-        for i, block in enumerate(self.double_blocks):
+        for i, block in enumerate(double_blocks):
             if ("double_block", i) in blocks_replace:
                 def block_wrap(args):
                     out = {}
@@ -282,7 +292,7 @@ class HunyuanVideo(nn.Module):
 
         img = torch.cat((img, txt), 1)
 
-        for i, block in enumerate(self.single_blocks):
+        for i, block in enumerate(single_blocks):
             if ("single_block", i) in blocks_replace:
                 def block_wrap(args):
                     out = {}
@@ -303,6 +313,9 @@ class HunyuanVideo(nn.Module):
 
         img = img[:, : img_len]
 
+        if step_cache is not None:
+            step_cache.store(img)
+
         img = self.final_layer(img, vec)  # (N, T, patch_size ** 2 * out_channels)
 
         shape = initial_shape[-3:]
@@ -467,8 +467,19 @@ class LTXVModel(torch.nn.Module):
                 batch_size, -1, x.shape[-1]
             )
 
+        #metastable: reuses the output of the blocks when their input barely changed, see StepCache
+        transformer_blocks = self.transformer_blocks
+        step_cache = transformer_options.get("step_cache")
+        if step_cache is not None:
+            first_block = self.transformer_blocks[0]
+            shift_msa, scale_msa = (first_block.scale_shift_table[None, None].to(device=x.device, dtype=x.dtype) + timestep.reshape(x.shape[0], timestep.shape[1], first_block.scale_shift_table.shape[0], -1)).unbind(dim=2)[:2]
+            modulated = comfy.ldm.common_dit.rms_norm(x) * (1 + scale_msa) + shift_msa
+            cached = step_cache.check("ltxv", modulated, x, transformer_options)
+            if cached is not None:
+                x, transformer_blocks = cached, []
+
         blocks_replace = patches_replace.get("dit", {})
-        for i, block in enumerate(self.transformer_blocks):
+        for i, block in enumerate(transformer_blocks):
             if ("double_block", i) in blocks_replace:
                 def block_wrap(args):
                     out = {}
@@ -486,6 +497,9 @@ class LTXVModel(torch.nn.Module):
                     pe=pe
                 )
 
+        if step_cache is not None:
+            step_cache.store(x)
+
         # 3. Output
         scale_shift_values = (
             self.scale_shift_table[None, None].to(device=x.device, dtype=x.dtype) + embedded_timestep[:, :, None]
@@ -384,6 +384,7 @@ class WanModel(torch.nn.Module):
         context,
         clip_fea=None,
         freqs=None,
+        transformer_options={},
     ):
         r"""
         Forward pass through the diffusion model
@@ -429,9 +430,24 @@ class WanModel(torch.nn.Module):
             freqs=freqs,
             context=context)
 
-        for block in self.blocks:
+        #metastable: reuses the output of the blocks when their input barely changed, see StepCache
+        blocks = self.blocks
+        step_cache = transformer_options.get("step_cache")
+        if step_cache is not None:
+            if self.model_type == 'i2v':
+                model = "wan_i2v"
+            else:
+                model = "wan_t2v_14b" if self.dim >= 5120 else "wan_t2v_1.3b"
+            cached = step_cache.check(model, e, x, transformer_options)
+            if cached is not None:
+                x, blocks = cached, []
+
+        for block in blocks:
             x = block(x, **kwargs)
 
+        if step_cache is not None:
+            step_cache.store(x)
+
         # head
         x = self.head(x, e)
 
@@ -453,7 +469,7 @@ class WanModel(torch.nn.Module):
         img_ids = repeat(img_ids, "t h w c -> b (t h w) c", b=bs)
 
         freqs = self.rope_embedder(img_ids).movedim(1, 2)
-        return self.forward_orig(x, timestep, context, clip_fea=clip_fea, freqs=freqs)[:, :, :t, :h, :w]
+        return self.forward_orig(x, timestep, context, clip_fea=clip_fea, freqs=freqs, transformer_options=kwargs.get("transformer_options", {}))[:, :, :t, :h, :w]
 
     def unpatchify(self, x, grid_sizes):
         r"""
@@ -20,11 +20,13 @@ import psutil
 import logging
 from enum import Enum
 from comfy.cli_args import args, PerformanceFeature
+from comfy.pinned_memory import PinnedMemoryPool
 import torch
 import sys
 import platform
 import weakref
 import gc
+import time
 
 class VRAMState(Enum):
     DISABLED = 0    #No vram present: no need to move models to vram
@@ -406,7 +408,12 @@ class LoadedModel:
         use_more_vram = lowvram_model_memory
         if use_more_vram == 0:
             use_more_vram = 1e32
+        loaded_before = self.model.loaded_size()
+        start = time.perf_counter()
         self.model_use_more_vram(use_more_vram, force_patch_weights=force_patch_weights)
+        if pinned_memory_pool.has_pinned():
+            synchronize_device(self.device)
+        record_transfer(self.model, "load", self.model.loaded_size() - loaded_before, time.perf_counter() - start)
         real_model = self.model.model
 
         if is_intel_xpu() and not args.disable_ipex_optimize and 'ipex' in globals() and real_model is not None:
@@ -425,10 +432,15 @@ class LoadedModel:
     def model_unload(self, memory_to_free=None, unpatch_weights=True):
         if memory_to_free is not None:
             if memory_to_free < self.model.loaded_size():
+                start = time.perf_counter()
                 freed = self.model.partially_unload(self.model.offload_device, memory_to_free)
+                record_transfer(self.model, "offload", freed, time.perf_counter() - start)
                 if freed >= memory_to_free:
                     return False
+        loaded = self.model.loaded_size()
+        start = time.perf_counter()
         self.model.detach(unpatch_weights)
+        record_transfer(self.model, "offload", loaded, time.perf_counter() - start)
         self.model_finalizer.detach()
         self.model_finalizer = None
         self.real_model = None
@@ -918,6 +930,35 @@ def cast_to_device(tensor, device, dtype, copy=False):
     non_blocking = device_supports_non_blocking(device)
     return cast_to(tensor, dtype=dtype, device=device, non_blocking=non_blocking, copy=copy)
 
+def pinned_memory_supported():
+    return cpu_state == CPUState.GPU and (is_nvidia() or is_amd()) and not directml_enabled
+
+pinned_memory_pool = PinnedMemoryPool(int(getattr(args, "pinned_memory_budget", 0) * (1024 ** 3)), supported=pinned_memory_supported)
+
+def synchronize_device(device):
+    if is_device_cuda(device):
+        torch.cuda.synchronize(device)
+
+def module_to(module, device):
+    """
+    Like module.to(device), offloads into pinned memory when it's enabled.
+    """
+    if is_device_cpu(device) and pinned_memory_pool.enabled():
+        return module._apply(lambda t: pinned_memory_pool.to_host(t))
+    return module.to(device)
+
+transfer_callbacks = []
+
+def record_transfer(model, direction, size, elapsed):
+    if size <= 0:
+        return
+
+    bandwidth = size / max(elapsed, 1e-9)
+    logging.debug("{} {} {:.2f} MB in {:.3f}s ({:.2f} GB/s)".format(direction, model.model.__class__.__name__, size / (1024 * 1024), elapsed, bandwidth / (1024 ** 3)))
+    stats = {"direction": direction, "model": model.model.__class__.__name__, "size": size, "time": elapsed, "bandwidth": bandwidth, "pinned": pinned_memory_pool.stats()}
+    for callback in transfer_callbacks:
+        callback(stats)
+
 def sage_attention_enabled():
     return args.use_sage_attention
 
@@ -1213,6 +1254,37 @@ def soft_empty_cache(force=False):
 def unload_all_models():
     free_memory(1e30, get_torch_device())
 
+def unload_models(models, memory_required=None, device=None):
+    #metastable: only unloads models built on top of the given patchers, largest first
+    if device is None:
+        device = get_torch_device()
+
+    targets = set(id(m.model) for m in models if getattr(m, "model", None) is not None)
+    candidates = []
+    for i in range(len(current_loaded_models)):
+        loaded = current_loaded_models[i]
+        if loaded.device == device and loaded.model is not None and id(loaded.model.model) in targets:
+            candidates.append((-loaded.model_loaded_memory(), i))
+
+    unloaded_model = []
+    for x in sorted(candidates):
+        i = x[-1]
+        memory_to_free = None
+        if memory_required is not None:
+            free_mem = get_free_memory(device)
+            if free_mem > memory_required:
+                break
+            memory_to_free = memory_required - free_mem
+        if current_loaded_models[i].model_unload(memory_to_free):
+            unloaded_model.append(i)
+
+    for i in sorted(unloaded_model, reverse=True):
+        current_loaded_models.pop(i)
+
+    if len(unloaded_model) > 0:
+        soft_empty_cache()
+    return len(unloaded_model)
+
 
 #TODO: might be cleaner to put this somewhere else
 import threading
@@ -731,7 +731,7 @@ class ModelPatcher:
             self.backup.clear()
 
             if device_to is not None:
-                self.model.to(device_to)
+                comfy.model_management.module_to(self.model, device_to)
                 self.model.device = device_to
             self.model.model_loaded_weight_memory = 0
 
@@ -780,7 +780,7 @@ class ModelPatcher:
                     bias_key = "{}.bias".format(n)
                     if move_weight:
                         cast_weight = self.force_cast_weights
-                        m.to(device_to)
+                        comfy.model_management.module_to(m, device_to)
                         module_mem += move_weight_functions(m, device_to)
                         if lowvram_possible:
                             if weight_key in self.patches:
@@ -0,0 +1,107 @@
+import logging
+import threading
+
+import torch
+from torch.multiprocessing.reductions import StorageWeakRef
+
+class PinnedMemoryPool:
+    """
+    Copies offloaded weights into page-locked host memory, up to a budget in
+    bytes. Falls back to regular pageable memory when the budget is used up,
+    pinning fails or isn't supported. Memory is returned to the budget once
+    the storage of a pinned copy is freed, modules keep the storage alive
+    after the copied tensor itself is gone (param.data = out).
+    """
+    def __init__(self, budget=0, supported=None, allocate=None):
+        self.budget = budget
+        self.supported = supported
+        self.used = 0
+        self.pinned_count = 0
+        self.fallback_count = 0
+        self.allocations = []
+        self.lock = threading.Lock()
+        if allocate is not None:
+            self.allocate = allocate
+
+    def allocate(self, tensor):
+        return torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=True)
+
+    def enabled(self):
+        if self.budget <= 0:
+            return False
+        if callable(self.supported):
+            self.supported = self.supported()
+        return bool(self.supported)
+
+    def collect(self):
+        """
+        Returns the memory of freed pinned storages to the budget.
+        """
+        with self.lock:
+            self._collect()
+
+    def _collect(self):
+        alive = []
+        for storage, size in self.allocations:
+            if storage.expired():
+                self.used -= size
+                self.pinned_count -= 1
+            else:
+                alive.append((storage, size))
+        self.allocations = alive
+
+    def _reserve(self, size):
+        with self.lock:
+            if self.used + size > self.budget:
+                self._collect()
+            if self.used + size > self.budget:
+                self.fallback_count += 1
+                return False
+            self.used += size
+            self.pinned_count += 1
+            return True
+
+    def pin(self, tensor):
+        """
+        Pinned copy of tensor, None when it doesn't fit in the budget or can't be allocated.
+        """
+        size = tensor.nelement() * tensor.element_size()
+        if not self._reserve(size):
+            return None
+
+        try:
+            out = self.allocate(tensor)
+            out.copy_(tensor)
+        except RuntimeError as e:
+            logging.debug("Unable to allocate pinned memory, falling back to pageable memory: {}".format(e))
+            with self.lock:
+                self.used -= size
+                self.pinned_count -= 1
+                self.fallback_count += 1
+            return None
+
+        with self.lock:
+            self.allocations.append((StorageWeakRef(out.untyped_storage()), size))
+        return out
+
+    def to_host(self, tensor):
+        if tensor.device.type == "cpu" or not self.enabled():
+            return tensor.to("cpu")
+
+        out = self.pin(tensor)
+        if out is None:
+            return tensor.to("cpu")
+        return out
+
+    def has_pinned(self):
+        """
+        Whether any pinned storage is alive, copies from it may still be in flight after a load.
+        """
+        with self.lock:
+            self._collect()
+            return self.pinned_count > 0
+
+    def stats(self):
+        with self.lock:
+            self._collect()
+            return {"budget": self.budget, "used": self.used, "pinned": self.pinned_count, "fallbacks": self.fallback_count}
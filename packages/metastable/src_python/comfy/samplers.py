@@ -198,6 +198,13 @@ def finalize_default_conds(model: 'BaseModel', hooked_to_run: dict[comfy.hooks.H
             hooked_to_run.setdefault(p.hooks, list())
             hooked_to_run[p.hooks] += [(p, i)]
 
+#metastable: lets concurrent samplers merge their model calls, see set_apply_model_hook
+APPLY_MODEL_HOOK = None
+
+def set_apply_model_hook(hook):
+    global APPLY_MODEL_HOOK
+    APPLY_MODEL_HOOK = hook
+
 def calc_cond_batch(model: 'BaseModel', conds: list[list[dict]], x_in: torch.Tensor, timestep, model_options):
     executor = comfy.patcher_extension.WrapperExecutor.new_executor(
         _calc_cond_batch,
@@ -315,6 +322,8 @@ def _calc_cond_batch(model: 'BaseModel', conds: list[list[dict]], x_in: torch.Te
 
             if 'model_function_wrapper' in model_options:
                 output = model_options['model_function_wrapper'](model.apply_model, {"input": input_x, "timestep": timestep_, "c": c, "cond_or_uncond": cond_or_uncond}).chunk(batch_chunks)
+            elif APPLY_MODEL_HOOK is not None:
+                output = APPLY_MODEL_HOOK(model.apply_model, {"input": input_x, "timestep": timestep_, "c": c, "cond_or_uncond": cond_or_uncond}).chunk(batch_chunks)
             else:
                 output = model.apply_model(input_x, timestep_, **c).chunk(batch_chunks)
 
@@ -211,6 +211,7 @@ class CLIP:
             self.cond_stage_model.set_clip_options({"projected_pooled": False})
 
         self.load_model()
+        model_management.throw_exception_if_processing_interrupted() #metastable: also checks the request's cancellation token
         o = self.cond_stage_model.encode_token_weights(tokens)
         cond, pooled = o[:2]
         if return_dict:
@@ -885,34 +886,38 @@ def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, o
         raise RuntimeError("ERROR: Could not detect model type of: {}".format(ckpt_path))
     return out
 
-def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None):
+def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None, load_component=None):
+    if load_component is None: #allows sharing identical vae/clip models between checkpoints
+        load_component = lambda kind, component_sd, load: load()
+
     clip = None
     clipvision = None
     vae = None
     model = None
     model_patcher = None
 
-    diffusion_model_prefix = model_detection.unet_prefix_from_state_dict(sd)
-    parameters = comfy.utils.calculate_parameters(sd, diffusion_model_prefix)
-    weight_dtype = comfy.utils.weight_dtype(sd, diffusion_model_prefix)
-    load_device = model_management.get_torch_device()
+    with comfy.utils.span("detect"):
+        diffusion_model_prefix = model_detection.unet_prefix_from_state_dict(sd)
+        parameters = comfy.utils.calculate_parameters(sd, diffusion_model_prefix)
+        weight_dtype = comfy.utils.weight_dtype(sd, diffusion_model_prefix)
+        load_device = model_management.get_torch_device()
 
-    model_config = model_detection.model_config_from_unet(sd, diffusion_model_prefix, metadata=metadata)
-    if model_config is None:
-        return None
+        model_config = model_detection.model_config_from_unet(sd, diffusion_model_prefix, metadata=metadata)
+        if model_config is None:
+            return None
 
-    unet_weight_dtype = list(model_config.supported_inference_dtypes)
-    if model_config.scaled_fp8 is not None:
-        weight_dtype = None
+        unet_weight_dtype = list(model_config.supported_inference_dtypes)
+        if model_config.scaled_fp8 is not None:
+            weight_dtype = None
 
-    model_config.custom_operations = model_options.get("custom_operations", None)
-    unet_dtype = model_options.get("dtype", model_options.get("weight_dtype", None))
+        model_config.custom_operations = model_options.get("custom_operations", None)
+        unet_dtype = model_options.get("dtype", model_options.get("weight_dtype", None))
 
-    if unet_dtype is None:
-        unet_dtype = model_management.unet_dtype(model_params=parameters, supported_dtypes=unet_weight_dtype, weight_dtype=weight_dtype)
+        if unet_dtype is None:
+            unet_dtype = model_management.unet_dtype(model_params=parameters, supported_dtypes=unet_weight_dtype, weight_dtype=weight_dtype)
 
-    manual_cast_dtype = model_management.unet_manual_cast(unet_dtype, load_device, model_config.supported_inference_dtypes)
-    model_config.set_inference_dtype(unet_dtype, manual_cast_dtype)
+        manual_cast_dtype = model_management.unet_manual_cast(unet_dtype, load_device, model_config.supported_inference_dtypes)
+        model_config.set_inference_dtype(unet_dtype, manual_cast_dtype)
 
     if model_config.clip_vision_prefix is not None:
         if output_clipvision:
@@ -920,31 +925,42 @@ def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_c
 
     if output_model:
         inital_load_device = model_management.unet_inital_load_device(parameters, unet_dtype)
-        model = model_config.get_model(sd, diffusion_model_prefix, device=inital_load_device)
-        model.load_model_weights(sd, diffusion_model_prefix)
+        with comfy.utils.span("construct"):
+            model = model_config.get_model(sd, diffusion_model_prefix, device=inital_load_device)
+        with comfy.utils.span("cast"):
+            model.load_model_weights(sd, diffusion_model_prefix)
 
     if output_vae:
         vae_sd = comfy.utils.state_dict_prefix_replace(sd, {k: "" for k in model_config.vae_key_prefix}, filter_keys=True)
         vae_sd = model_config.process_vae_state_dict(vae_sd)
-        vae = VAE(sd=vae_sd, metadata=metadata)
+        def load_vae():
+            with comfy.utils.span("construct"):
+                return VAE(sd=vae_sd, metadata=metadata)
+        vae = load_component("vae", vae_sd, load_vae)
 
     if output_clip:
         clip_target = model_config.clip_target(state_dict=sd)
         if clip_target is not None:
             clip_sd = model_config.process_clip_state_dict(sd)
             if len(clip_sd) > 0:
-                parameters = comfy.utils.calculate_parameters(clip_sd)
-                clip = CLIP(clip_target, embedding_directory=embedding_directory, tokenizer_data=clip_sd, parameters=parameters, model_options=te_model_options)
-                m, u = clip.load_sd(clip_sd, full_model=True)
-                if len(m) > 0:
-                    m_filter = list(filter(lambda a: ".logit_scale" not in a and ".transformer.text_projection.weight" not in a, m))
-                    if len(m_filter) > 0:
-                        logging.warning("clip missing: {}".format(m))
-                    else:
-                        logging.debug("clip missing: {}".format(m))
-
-                if len(u) > 0:
-                    logging.debug("clip unexpected {}:".format(u))
+                def load_clip():
+                    parameters = comfy.utils.calculate_parameters(clip_sd)
+                    with comfy.utils.span("construct"):
+                        clip = CLIP(clip_target, embedding_directory=embedding_directory, tokenizer_data=clip_sd, parameters=parameters, model_options=te_model_options)
+                    with comfy.utils.span("cast"):
+                        m, u = clip.load_sd(clip_sd, full_model=True)
+                    if len(m) > 0:
+                        m_filter = list(filter(lambda a: ".logit_scale" not in a and ".transformer.text_projection.weight" not in a, m))
+                        if len(m_filter) > 0:
+                            logging.warning("clip missing: {}".format(m))
+                        else:
+                            logging.debug("clip missing: {}".format(m))
+
+                    if len(u) > 0:
+                        logging.debug("clip unexpected {}:".format(u))
+                    return clip
+
+                clip = load_component("clip", clip_sd, load_clip)
             else:
                 logging.warning("no CLIP/text encoder weights in checkpoint, the text encoder model will not be loaded.")
 
@@ -974,7 +990,8 @@ def load_diffusion_model_state_dict(sd, model_options={}): #load unet in diffuse
     weight_dtype = comfy.utils.weight_dtype(sd)
 
     load_device = model_management.get_torch_device()
-    model_config = model_detection.model_config_from_unet(sd, "")
+    with comfy.utils.span("detect"):
+        model_config = model_detection.model_config_from_unet(sd, "")
 
     if model_config is not None:
         new_sd = sd
@@ -1014,9 +1031,11 @@ def load_diffusion_model_state_dict(sd, model_options={}): #load unet in diffuse
     if model_options.get("fp8_optimizations", False):
         model_config.optimizations["fp8"] = True
 
-    model = model_config.get_model(new_sd, "")
-    model = model.to(offload_device)
-    model.load_model_weights(new_sd, "")
+    with comfy.utils.span("construct"):
+        model = model_config.get_model(new_sd, "")
+        model = model.to(offload_device)
+    with comfy.utils.span("cast"):
+        model.load_model_weights(new_sd, "")
     left_over = sd.keys()
     if len(left_over) > 0:
         logging.info("left over keys in unet: {}".format(left_over))
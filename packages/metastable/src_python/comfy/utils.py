@@ -17,19 +17,27 @@
 """
 
 
+import os
 import torch
 import math
 import struct
 import comfy.checkpoint_pickle
+import comfy.model_management
+from comfy.lazy_state_dict import LazyStateDict, move_key, read_parallel
+from comfy.cli_args import args
 import safetensors.torch
 import numpy as np
 from PIL import Image
 import logging
 import itertools
+import contextlib
 from torch.nn.functional import interpolate
 from einops import rearrange
 
 ALWAYS_SAFE_LOAD = False
+#memory map safetensors files loaded to the cpu, reading tensors on access
+#not on windows, where mapped files can't be deleted or moved while the model is cached
+LAZY_SAFETENSORS = os.name != "nt"
 if hasattr(torch.serialization, "add_safe_globals"):  # TODO: this was added in pytorch 2.4, the unsafe path should be removed once earlier versions are deprecated
     class ModelCheckpoint:
         pass
@@ -46,18 +54,43 @@ if hasattr(torch.serialization, "add_safe_globals"):  # TODO: this was added in
 else:
     logging.info("Warning, you are using an old pytorch version and some ckpt/pt files might be loaded unsafely. Upgrading to 2.4 or above is recommended.")
 
+SPAN_HOOK = None
+def set_span_hook(function):
+    global SPAN_HOOK
+    SPAN_HOOK = function
+
+def span(name): #times a phase of model loading
+    if SPAN_HOOK is None:
+        return contextlib.nullcontext()
+    return SPAN_HOOK(name)
+
 def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
+    with span("read"):
+        return _load_torch_file(ckpt, safe_load=safe_load, device=device, return_metadata=return_metadata)
+
+def _load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
     if device is None:
         device = torch.device("cpu")
     metadata = None
     if ckpt.lower().endswith(".safetensors") or ckpt.lower().endswith(".sft"):
         try:
-            with safetensors.safe_open(ckpt, framework="pt", device=device.type) as f:
-                sd = {}
-                for k in f.keys():
-                    sd[k] = f.get_tensor(k)
-                if return_metadata:
-                    metadata = f.metadata()
+            sd = None
+            if args.load_threads > 0 and device.type == "cpu":
+                sd, metadata = read_parallel(ckpt, args.load_threads)
+            elif LAZY_SAFETENSORS and device.type == "cpu":
+                try:
+                    sd = LazyStateDict(ckpt)
+                    metadata = sd.metadata
+                except OSError as e: #mapping can fail, for example with strict overcommit
+                    logging.debug("Unable to memory map {}: {}".format(ckpt, e))
+
+            if sd is None:
+                with safetensors.safe_open(ckpt, framework="pt", device=device.type) as f:
+                    sd = {}
+                    for k in f.keys():
+                        sd[k] = f.get_tensor(k)
+                    if return_metadata:
+                        metadata = f.metadata()
         except Exception as e:
             if len(e.args) > 0:
                 message = e.args[0]
@@ -114,19 +147,18 @@ def weight_dtype(sd, prefix=""):
 def state_dict_key_replace(state_dict, keys_to_replace):
     for x in keys_to_replace:
         if x in state_dict:
-            state_dict[keys_to_replace[x]] = state_dict.pop(x)
+            move_key(state_dict, state_dict, x, keys_to_replace[x])
     return state_dict
 
 def state_dict_prefix_replace(state_dict, replace_prefix, filter_keys=False):
     if filter_keys:
-        out = {}
+        out = state_dict.empty() if isinstance(state_dict, LazyStateDict) else {}
     else:
         out = state_dict
     for rp in replace_prefix:
         replace = list(map(lambda a: (a, "{}{}".format(replace_prefix[rp], a[len(rp):])), filter(lambda a: a.startswith(rp), state_dict.keys())))
         for x in replace:
-            w = state_dict.pop(x[0])
-            out[x[1]] = w
+            move_key(state_dict, out, x[0], x[1])
     return out
 
 
@@ -927,6 +959,7 @@ def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_am
     output = torch.empty([samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:]), device=output_device)
 
     for b in range(samples.shape[0]):
+        comfy.model_management.throw_exception_if_processing_interrupted()
         s = samples[b:b+1]
 
         # handle entire input fitting in a single tile
@@ -942,6 +975,7 @@ def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_am
         positions = [range(0, s.shape[d+2] - overlap[d], tile[d] - overlap[d]) if s.shape[d+2] > tile[d] else [0] for d in range(dims)]
 
         for it in itertools.product(*positions):
+            comfy.model_management.throw_exception_if_processing_interrupted()
             s_in = s
             upscaled = []
 
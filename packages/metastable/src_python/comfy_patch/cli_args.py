@@ -82,6 +82,10 @@ parser.add_argument("--namespace", action="append", help="Add extra namespace",
 parser.add_argument("--zluda-path", type=str, help="ZLUDA path", required=False)
 parser.add_argument("--hip-path", type=str, help="HIP SDK path", required=False)
 parser.add_argument("--hip-version", type=str, help="HIP SDK version", required=False)
+parser.add_argument("--load-threads", type=int, default=0, help="Read safetensors files with this many threads instead of memory mapping them.")
+parser.add_argument("--pinned-memory-budget", type=float, default=0, help="Keep up to this many GB of offloaded weights in pinned memory for faster transfers to the GPU.")
+parser.add_argument("--eager-namespaces", action="store_true", help="Import every namespace at startup instead of on the first call.")
+parser.add_argument("--profile-imports", action="store_true", help="Measure how long each module takes to import and print a report.")
 
 args = parser.parse_args()
 
@@ -0,0 +1,276 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, TypedDict
+
+import comfy.utils
+
+import state_cache
+from model_cache import parse_budget
+
+DEFAULT_BUDGET = 256 * 1024 * 1024
+# Patch states of text encoders, only the most recent ones are needed.
+MAX_DESCRIPTIONS = 4096
+
+class ConditioningCacheStats(TypedDict):
+    entries: int
+    size: int
+    budget: int
+    disk_budget: int | None
+    hits: int
+    disk_hits: int
+    misses: int
+
+def tensors_size(tensors: tuple) -> int:
+    return sum(t.nelement() * t.element_size() for t in tensors if t is not None)
+
+def clone(tensors: tuple) -> tuple:
+    # Callers may modify the conditioning in place, cached values must not change.
+    return tuple(t.clone() if t is not None else None for t in tensors)
+
+def get_budget() -> int:
+    return parse_budget(os.environ.get("METASTABLE_CONDITIONING_CACHE_BUDGET")) or DEFAULT_BUDGET
+
+def get_disk_budget() -> int | None:
+    return parse_budget(os.environ.get("METASTABLE_CONDITIONING_CACHE_DISK_BUDGET"))
+
+class ConditioningCache:
+    """
+    LRU cache of text encoder outputs, keyed by a description of the text
+    encoder's weights (source files, applied patches), its options and the
+    prompt. Descriptions are tracked by the patcher's patches_uuid, which is
+    kept by clones and changes whenever patches are added, so encoders
+    patched in ways this cache doesn't know about are never cached.
+
+    Entries evicted from memory are written to disk if there's a disk budget.
+    """
+
+    def __init__(self):
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.descriptions: OrderedDict = OrderedDict()
+        self.size = 0
+        self.budget = get_budget()
+        self.disk_budget = get_disk_budget()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def configure(self, budget: int | None = None, disk_budget: int | None = None):
+        with self.lock:
+            self.budget = budget if budget is not None else get_budget()
+            self.disk_budget = disk_budget if disk_budget is not None else get_disk_budget()
+            evicted = self.evict()
+
+        for key, value in evicted:
+            self.spill(key, value)
+
+    def register(self, text_encoder, description: str):
+        patches_uuid = getattr(text_encoder.patcher, "patches_uuid", None)
+        if patches_uuid is None:
+            return
+
+        with self.lock:
+            self.descriptions[patches_uuid] = description
+            self.descriptions.move_to_end(patches_uuid)
+            while len(self.descriptions) > MAX_DESCRIPTIONS:
+                self.descriptions.popitem(last=False)
+
+    def register_patch(self, source, text_encoder, patch: str):
+        """
+        Describes text_encoder as source with one more patch applied.
+        """
+
+        description = self.describe(source)
+        if description is not None:
+            self.register(text_encoder, json.dumps([description, patch]))
+
+    def describe(self, text_encoder) -> str | None:
+        patches_uuid = getattr(text_encoder.patcher, "patches_uuid", None)
+        with self.lock:
+            return self.descriptions.get(patches_uuid)
+
+    def key(self, text_encoder, text: str) -> str | None:
+        description = self.describe(text_encoder)
+        if description is None or text_encoder.apply_hooks_to_conds is not None:
+            return None
+
+        options = {
+            "layer": text_encoder.layer_idx,
+            "clip_schedule": text_encoder.use_clip_schedule,
+            "device": str(text_encoder.patcher.load_device),
+            "dtypes": sorted(str(dtype) for dtype in getattr(text_encoder.cond_stage_model, "dtypes", [])),
+        }
+        data = json.dumps([state_cache.VERSION, description, options, text], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get_disk_path(self, key: str) -> str | None:
+        cache_dir = state_cache.get_cache_dir()
+        if cache_dir is None or not self.disk_budget:
+            return None
+
+        path = os.path.join(cache_dir, "conditioning")
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, key + ".safetensors")
+
+    def get(self, key: str) -> tuple | None:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        path = self.get_disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            sd = comfy.utils.load_torch_file(path, safe_load=True)
+            value = (sd["cond"].clone(), sd["pooled"].clone() if "pooled" in sd else None)
+        except Exception as e:
+            logging.warning("Invalid conditioning cache entry, removing: {}".format(e))
+            self.remove_file(path)
+            return None
+
+        os.utime(path)
+        with self.lock:
+            self.disk_hits += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value: tuple):
+        with self.lock:
+            if key in self.entries:
+                self.size -= tensors_size(self.entries[key])
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.size += tensors_size(value)
+            evicted = self.evict()
+
+        for evicted_key, evicted_value in evicted:
+            self.spill(evicted_key, evicted_value)
+
+    def evict(self) -> list[tuple[str, tuple]]:
+        evicted = []
+        while self.size > self.budget and len(self.entries) > 0:
+            key, value = self.entries.popitem(last=False)
+            self.size -= tensors_size(value)
+            evicted.append((key, value))
+        return evicted
+
+    def spill(self, key: str, value: tuple):
+        path = self.get_disk_path(key)
+        if path is None or os.path.exists(path):
+            return
+
+        cond, pooled = value
+        sd = { "cond": cond.contiguous() }
+        if pooled is not None:
+            sd["pooled"] = pooled.contiguous()
+
+        tmp_path = path + ".tmp"
+        try:
+            comfy.utils.save_torch_file(sd, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Unable to write conditioning cache entry: {}".format(e))
+            self.remove_file(tmp_path)
+            return
+
+        self.prune(os.path.dirname(path))
+
+    def prune(self, directory: str):
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".safetensors"):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_budget:
+                break
+            self.remove_file(path)
+            total -= size
+
+    def remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning("Unable to remove conditioning cache file {}: {}".format(path, e))
+
+    def encode(self, text_encoder, text: str, encode_function: Callable[[], tuple]) -> tuple:
+        """
+        Returns (cond, pooled) for the prompt, only running the text encoder
+        on a miss. The result is a copy, never the cached tensors.
+        """
+
+        key = self.key(text_encoder, text)
+        if key is not None:
+            value = self.get(key)
+            if value is not None:
+                return clone(value)
+
+        with self.lock:
+            self.misses += 1
+
+        value = encode_function()
+        if key is not None:
+            self.put(key, value)
+            return clone(value)
+        return value
+
+    def encode_batch(self, text_encoder, texts: list[str], encode_function: Callable[[list[str]], list[tuple]]) -> list[tuple]:
+        """
+        Same as encode for several prompts, the missing ones are encoded
+        together with a single call to encode_function.
+        """
+
+        keys = [self.key(text_encoder, text) for text in texts]
+        values = [self.get(key) if key is not None else None for key in keys]
+
+        missing = []
+        for text, value in zip(texts, values):
+            if value is None and text not in missing:
+                missing.append(text)
+
+        if len(missing) > 0:
+            with self.lock:
+                self.misses += len(missing)
+
+            encoded = dict(zip(missing, encode_function(missing)))
+            for i, text in enumerate(texts):
+                if values[i] is None:
+                    values[i] = encoded[text]
+                    if keys[i] is not None:
+                        self.put(keys[i], values[i])
+
+        # Repeated prompts share the same encoded value too.
+        return [clone(value) for value in values]
+
+    def stats(self) -> ConditioningCacheStats:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "size": self.size,
+                "budget": self.budget,
+                "disk_budget": self.disk_budget,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+conditioning_cache = ConditioningCache()
+
+def cache() -> ConditioningCache:
+    return conditioning_cache
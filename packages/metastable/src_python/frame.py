@@ -0,0 +1,77 @@
+import json
+import struct
+from io import BytesIO
+
+# Frame layout (little endian):
+#   u32 header length, u32 buffer count, u64 length for each buffer,
+#   followed by the JSON header and the raw buffers.
+# Inside the header, binary values are represented as { "$bytes": index }.
+PREFIX = struct.Struct("<II")
+BUFFER_LENGTH = struct.Struct("<Q")
+
+BINARY_TYPES = (BytesIO, bytes, bytearray, memoryview)
+
+def to_buffer(obj):
+    if isinstance(obj, BytesIO):
+        return obj.getbuffer()
+    return memoryview(obj)
+
+def encode(data) -> tuple[bytes, list[memoryview]]:
+    buffers = []
+
+    def default(obj):
+        if isinstance(obj, BINARY_TYPES):
+            buffers.append(to_buffer(obj))
+            return { "$bytes": len(buffers) - 1 }
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    header = json.dumps(data, default=default).encode("utf-8")
+    return header, buffers
+
+def decode(header: bytes, buffers: list[bytes]):
+    def object_hook(obj):
+        if "$bytes" in obj and isinstance(obj["$bytes"], int):
+            return BytesIO(buffers[obj["$bytes"]])
+        return obj
+
+    return json.loads(header, object_hook=object_hook)
+
+def write(stream, header: bytes, buffers: list[memoryview]):
+    stream.write(PREFIX.pack(len(header), len(buffers)))
+    for buffer in buffers:
+        stream.write(BUFFER_LENGTH.pack(buffer.nbytes))
+    stream.write(header)
+    for buffer in buffers:
+        stream.write(buffer)
+
+def read_exactly(stream, size: int) -> bytes | None:
+    data = stream.read(size)
+    if data is None or len(data) < size:
+        return None
+    return data
+
+def read(stream) -> tuple[bytes, list[bytes]] | None:
+    prefix = read_exactly(stream, PREFIX.size)
+    if prefix is None:
+        return None
+
+    header_length, buffer_count = PREFIX.unpack(prefix)
+    buffer_lengths = []
+    for _ in range(buffer_count):
+        length = read_exactly(stream, BUFFER_LENGTH.size)
+        if length is None:
+            return None
+        buffer_lengths.append(BUFFER_LENGTH.unpack(length)[0])
+
+    header = read_exactly(stream, header_length)
+    if header is None:
+        return None
+
+    buffers = []
+    for length in buffer_lengths:
+        buffer = read_exactly(stream, length)
+        if buffer is None:
+            return None
+        buffers.append(buffer)
+
+    return header, buffers
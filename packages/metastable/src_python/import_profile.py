@@ -0,0 +1,125 @@
+import sys
+import time
+import importlib.machinery
+import threading
+from contextlib import contextmanager
+from typing import TypedDict
+
+# Loaders created for a single module, so timing can be added per instance.
+TIMED_LOADERS = (importlib.machinery.SourceFileLoader, importlib.machinery.SourcelessFileLoader, importlib.machinery.ExtensionFileLoader)
+
+class ModuleImportTime(TypedDict):
+    module: str
+    self: float
+    total: float
+
+class PackageImportTime(TypedDict):
+    package: str
+    time: float
+    modules: int
+
+class ImportProfile(TypedDict):
+    phases: dict[str, float]
+    packages: list[PackageImportTime]
+    modules: list[ModuleImportTime]
+
+class ImportProfiler:
+    """
+    Meta path finder measuring how long each module takes to execute, both
+    including (total) and excluding (self) the modules it imports.
+    Only timing is added, finding and loading is left to the other finders.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records: dict[str, list[float]] = {}
+        self.phases: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def install(self):
+        if self.enabled:
+            return
+
+        self.enabled = True
+        sys.meta_path.insert(0, self)
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self.local, "finding", False):
+            return None
+
+        self.local.finding = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self.local.finding = False
+
+        if spec is None or not isinstance(spec.loader, TIMED_LOADERS):
+            return spec
+
+        exec_module = spec.loader.exec_module
+        def timed_exec_module(module):
+            stack = self.local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                children = stack.pop()
+                if len(stack) > 0:
+                    stack[-1] += total
+                with self.lock:
+                    self.records[fullname] = [total - children, total]
+
+        spec.loader.exec_module = timed_exec_module
+        return spec
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def report(self, limit: int = 25) -> ImportProfile:
+        with self.lock:
+            records = dict(self.records)
+            phases = dict(self.phases)
+
+        packages = {}
+        for module, (self_time, _) in records.items():
+            package = module.split(".")[0]
+            time_spent, count = packages.get(package, (0.0, 0))
+            packages[package] = (time_spent + self_time, count + 1)
+
+        modules = sorted(records.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return {
+            "phases": phases,
+            "packages": [
+                { "package": package, "time": time_spent, "modules": count }
+                for package, (time_spent, count) in sorted(packages.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+            ],
+            "modules": [
+                { "module": module, "self": self_time, "total": total }
+                for module, (self_time, total) in modules
+            ],
+        }
+
+    def print_report(self, limit: int = 10):
+        profile = self.report(limit)
+        for name, elapsed in profile["phases"].items():
+            print(f"Startup phase {name}: {elapsed:.3f}s")
+        for package in profile["packages"]:
+            print(f"Import {package['package']}: {package['time']:.3f}s ({package['modules']} modules)")
+
+profiler = ImportProfiler()
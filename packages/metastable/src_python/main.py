@@ -6,6 +6,10 @@ import os
 import comfy_patch
 args = comfy_patch.get_args()
 
+from import_profile import profiler
+if args.profile_imports:
+    profiler.install()
+
 use_zluda = args.zluda_path and args.hip_path and args.hip_version
 if use_zluda:
     from zluda import enable_zluda
@@ -17,37 +21,57 @@ if __name__ == "__main__":
         os.environ['CUDA_VISIBLE_DEVICES'] = str(args.cuda_device)
         print("Set cuda device to:", args.cuda_device)
 
-import cuda_malloc
-
-import torch
-if  (
-    not torch.cuda.is_available() and
-    not args.directml and
-    not torch.backends.mps.is_available() and
-    not (hasattr(torch, "xpu") and torch.xpu.is_available())
-    ):
-    args.cpu = True
-
 # Main code
 import asyncio
-import json
-from concurrent.futures import ThreadPoolExecutor
-
-import comfy.samplers
-from rpc import RPC
-import importlib.util
+import threading
+import traceback
+from concurrent.futures import Future
+
+from scheduler import Scheduler
+import frame
+import namespace_loader
+
+def load_core(namespaces: list[str]):
+    """
+    Imports torch and comfy, which takes most of the startup time, so it runs
+    in the background after the worker reports it's ready. Namespaces are
+    imported on their first call.
+    """
+
+    import cuda_malloc
+
+    import torch
+    if  (
+        not torch.cuda.is_available() and
+        not args.directml and
+        not torch.backends.mps.is_available() and
+        not (hasattr(torch, "xpu") and torch.xpu.is_available())
+        ):
+        args.cpu = True
+
+    import comfy.samplers
+    from rpc import RPC
+    import rpc_hook
+
+    if os.name == "nt":
+        import logging
+        logging.getLogger("xformers").addFilter(lambda record: 'A matching Triton is not available' not in record.getMessage())
+
+    import comfy.utils
+    import comfy.model_management
 
-if os.name == "nt":
-    import logging
-    logging.getLogger("xformers").addFilter(lambda record: 'A matching Triton is not available' not in record.getMessage())
-
-import comfy.utils
-
-import comfy.model_management
+    rpc = RPC()
+    for namespace in namespaces:
+        namespace_loader.register(rpc, namespace, lazy=not args.eager_namespaces)
 
-torch_device_name = comfy.model_management.get_torch_device_name(comfy.model_management.get_torch_device())
+    cuda_malloc_warning()
+    rpc_hook.install()
+    return rpc
 
 def cuda_malloc_warning():
+    import cuda_malloc
+    import comfy.model_management
+
     device = comfy.model_management.get_torch_device()
     device_name = comfy.model_management.get_torch_device_name(device)
     cuda_malloc_warning = False
@@ -65,18 +89,29 @@ def handle(rpc, request):
     except:
         pass
 
-async def run(rpc):
+async def run(core: Future):
     loop = asyncio.get_event_loop()
-    executor = ThreadPoolExecutor(4)
+    scheduler = Scheduler()
+    rpc = None
 
     while True:
-        request_str = await loop.run_in_executor(None, sys.stdin.readline)
+        request_frame = await loop.run_in_executor(None, frame.read, sys.stdin.buffer)
 
-        if not request_str:
+        if not request_frame:
             break
 
+        if rpc is None:
+            # Requests sent during startup wait for the core modules.
+            rpc = await asyncio.wrap_future(core)
+
         try:
-            executor.submit(handle, rpc, json.loads(request_str))
+            request = frame.decode(*request_frame)
+            if rpc.is_valid_request(request):
+                rpc.track(request)
+                scheduler.submit(rpc.get_lane(request), handle, rpc, request, request_id=request["id"])
+            else:
+                # Answered with an error right away.
+                scheduler.submit("trivial", handle, rpc, request)
         except:
             pass
 
@@ -85,26 +120,31 @@ if __name__ == "__main__":
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    rpc = RPC()
 
     namespaces = ['base']
     if args.namespace:
         namespaces.extend(args.namespace)
 
-    namespaces_dir = os.path.join(os.path.dirname(__file__), 'namespaces')
-    for namespace in namespaces:
-        name = f'namespaces.{namespace}'
-        spec = importlib.util.spec_from_file_location(name, os.path.join(namespaces_dir, namespace, '__init__.py'))
-        mod = importlib.util.module_from_spec(spec)
-        sys.modules[name] = mod
-        spec.loader.exec_module(mod)
-        mod.insert_all(rpc)
+    core = Future()
+    def load():
+        try:
+            with profiler.phase("core"):
+                core.set_result(load_core(namespaces))
+        except BaseException as e:
+            core.set_exception(e)
+            # Exits the same way a failure before "Ready!" would.
+            traceback.print_exc()
+            os._exit(1)
 
-    cuda_malloc_warning()
+        if args.profile_imports:
+            profiler.print_report()
+            output.write_event("import_profile", profiler.report())
+
+    threading.Thread(target=load, name="core-loader", daemon=True).start()
 
     try:
         print("Ready!")
         output.write_event("ready")
-        loop.run_until_complete(run(rpc))
+        loop.run_until_complete(run(core))
     except KeyboardInterrupt:
         print("Stopped server")
@@ -1,6 +1,15 @@
+import os
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Callable, NotRequired, TypedDict
+import torch
 import comfy.model_sampling
 import comfy.sd
+import comfy.utils
 import comfy.model_management
 import comfy.model_patcher
 import rpc_types
@@ -40,7 +49,7 @@ def model_size(obj) -> int:
     size = 0
 
     for item in models:
-        if isinstance(item, dict):
+        if isinstance(item, Mapping):
             for k in item:
                 t = item[k]
                 size += t.nelement() * t.element_size()
@@ -51,35 +60,333 @@ def model_size(obj) -> int:
 
     return size
 
+def model_footprint(obj, seen: set[int] | None = None) -> tuple[int, int]:
+    """
+    Returns (ram, vram) bytes held by a cached object. Models already in seen
+    aren't counted again, so components shared between cached objects are
+    only counted once when the same set is passed for each of them.
+    """
+
+    models = get_models(obj)
+    ram = 0
+    vram = 0
+    if seen is None:
+        seen = set()
+
+    for item in models:
+        # Patcher clones share the underlying model.
+        identity = id(getattr(item, "model", item)) if isinstance(item, comfy.model_patcher.ModelPatcher) else id(item)
+        if identity in seen:
+            continue
+        seen.add(identity)
+
+        if isinstance(item, comfy.model_patcher.ModelPatcher):
+            total = item.model_size()
+            loaded = item.loaded_size() if item.load_device != item.offload_device else 0
+            vram += loaded
+            ram += max(total - loaded, 0)
+        elif isinstance(item, Mapping):
+            for k in item:
+                t = item[k]
+                if not isinstance(t, torch.Tensor):
+                    continue
+                size = t.nelement() * t.element_size()
+                if t.device.type == "cpu":
+                    ram += size
+                else:
+                    vram += size
+        else:
+            ram += model_size(item)
+
+    return ram, vram
+
+def parse_budget(value: str | None) -> int | None:
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
 class LoadedModelInfo(TypedDict):
     path: str
     size: NotRequired[int | None]
+    ram: NotRequired[int]
+    vram: NotRequired[int]
+
+class CacheEntry:
+    def __init__(self, load_time: float = 0, components: list[str] = []):
+        self.load_time = load_time
+        self.last_used = time.monotonic()
+        self.priority = 0.0
+        self.components = components
+
+class PathStats:
+    """
+    Counters kept per path, across evictions.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.last_load_time = 0.0
+        self.phases: dict[str, float] = {}
+        self.last_used: float | None = None
+        self.evictions = 0
+        self.last_eviction_reason: str | None = None
+
+class CacheEntryStats(TypedDict):
+    path: str
+    cached: bool
+    hits: int
+    misses: int
+    load_time: float
+    last_load_time: float
+    phases: dict[str, float]
+    ram: int
+    vram: int
+    last_used: NotRequired[float]
+    evictions: int
+    last_eviction_reason: NotRequired[str]
+
+class CacheStats(TypedDict):
+    entries: list[CacheEntryStats]
+    hits: int
+    misses: int
+    ram: int
+    vram: int
+    ram_budget: NotRequired[int]
+    vram_budget: NotRequired[int]
+    policy: str
+
+class SharedComponent:
+    def __init__(self, obj):
+        self.obj = obj
+        self.refs = 0
+
+CACHE_POLICIES = ("lru", "cost")
 
 class ModelCache:
+    """
+    Keeps loaded models keyed by path. When RAM or VRAM budgets are set,
+    entries are evicted once the cached models exceed them, either least
+    recently used first ("lru") or by reload cost per byte ("cost", using
+    GreedyDual-Size).
+    """
+
     info: dict[str, rpc_types.CachedModelInfo] = {}
     models: dict[str, any] = {}
 
+    def __init__(self):
+        self.entries: dict[str, CacheEntry] = {}
+        self.ram_budget = parse_budget(os.environ.get("METASTABLE_CACHE_RAM_BUDGET"))
+        self.vram_budget = parse_budget(os.environ.get("METASTABLE_CACHE_VRAM_BUDGET"))
+        self.policy = os.environ.get("METASTABLE_CACHE_POLICY", "lru")
+        if self.policy not in CACHE_POLICIES:
+            self.policy = "lru"
+        # GreedyDual-Size inflation value, raised to the priority of each evicted entry.
+        self.inflation = 0.0
+        self.loaders: dict[str, Callable[[rpc_types.CachedModelInfo], any]] = {}
+        self.in_flight: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        # Sub-models shared between entries, keyed by content hash.
+        self.components: dict[str, SharedComponent] = {}
+        self.component_loads: dict[str, Future] = {}
+        self.local = threading.local()
+        self.path_stats: dict[str, PathStats] = {}
+
+    def get_path_stats(self, path: str) -> PathStats:
+        if path not in self.path_stats:
+            self.path_stats[path] = PathStats()
+        return self.path_stats[path]
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Times a phase (read, detect, construct, cast) of the load running on
+        this thread, does nothing outside of load_cached.
+        """
+
+        phases = getattr(self.local, "phases", None)
+        if phases is None:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    def register_loader(self, name: str, loader: Callable[[rpc_types.CachedModelInfo], any]):
+        self.loaders[name] = loader
+
     def comfy_cleanup(self):
         comfy.model_management.cleanup_models()
 
-    def emit_event(self):
-        output.write_event("model_cache_change")
+    def emit_event(self, reason: str | None = None, paths: list[str] = []):
+        output.write_event("model_cache_change", { "reason": reason, "paths": paths })
+
+    def configure(self, ram_budget: int | None = None, vram_budget: int | None = None, policy: str | None = None):
+        self.ram_budget = ram_budget
+        self.vram_budget = vram_budget
+        if policy in CACHE_POLICIES:
+            self.policy = policy
+        self.enforce_budget()
+
+    def touch(self, path: str):
+        entry = self.entries.get(path)
+        if entry is None:
+            return
+
+        entry.last_used = time.monotonic()
+        if self.policy == "cost":
+            ram, vram = model_footprint(self.models[path])
+            entry.priority = self.inflation + entry.load_time / max(ram + vram, 1)
+
+    def load_component(self, key: str, load_function: Callable[[], any]):
+        """
+        Returns a sub-model shared by every entry loaded with the same key,
+        it's released when the last of these entries is removed.
+        """
+
+        with self.lock:
+            component = self.components.get(key)
+            if component is not None:
+                component.refs += 1
+            else:
+                future = self.component_loads.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self.component_loads[key] = future
+
+        if component is None:
+            if not owner:
+                # Another checkpoint sharing this component is loading it.
+                try:
+                    future.result()
+                except Exception:
+                    pass
+                return self.load_component(key, load_function)
+
+            try:
+                obj = load_function()
+            except BaseException as e:
+                with self.lock:
+                    self.component_loads.pop(key, None)
+                future.set_exception(e)
+                raise
+
+            with self.lock:
+                component = self.components.setdefault(key, SharedComponent(obj))
+                component.refs += 1
+                self.component_loads.pop(key, None)
+            future.set_result(component.obj)
+
+        acquired = getattr(self.local, "components", None)
+        if acquired is not None:
+            acquired.append(key)
+        return component.obj
+
+    def release_components(self, keys: list[str]):
+        with self.lock:
+            for key in keys:
+                component = self.components.get(key)
+                if component is None:
+                    continue
+
+                component.refs -= 1
+                if component.refs <= 0:
+                    del self.components[key]
 
-    def add(self, model, info: rpc_types.CachedModelInfo):
+    def add(self, model, info: rpc_types.CachedModelInfo, load_time: float = 0, components: list[str] = []):
         path = info["path"]
-        self.models[path] = model
-        self.info[path] = info
+        if path in self.entries:
+            self.release_components(self.entries[path].components)
+        with self.lock:
+            self.models[path] = model
+            self.info[path] = info
+            self.entries[path] = CacheEntry(load_time, components)
+        self.touch(path)
         self.comfy_cleanup()
-        self.emit_event()
+        self.emit_event("add", [path])
+        self.enforce_budget(keep=path)
 
-    def remove(self, path: str, cleanup: bool = True):
-        if path in self.info:
-            del self.info[path]
-        if path in self.models:
-            del self.models[path]
+    def remove(self, path: str, cleanup: bool = True, reason: str = "remove"):
+        with self.lock:
+            self.info.pop(path, None)
+            self.models.pop(path, None)
+            entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.release_components(entry.components)
+            stats = self.get_path_stats(path)
+            stats.evictions += 1
+            stats.last_eviction_reason = reason
         if cleanup:
             self.comfy_cleanup()
-        self.emit_event()
+        self.emit_event(reason, [path])
+
+    def snapshot(self) -> dict[str, any]:
+        """
+        Copy of the cached models, safe to iterate while prefetches add more.
+        """
+
+        with self.lock:
+            return dict(self.models)
+
+    def usage(self, models: dict[str, any] | None = None) -> tuple[int, int]:
+        if models is None:
+            models = self.snapshot()
+
+        ram = 0
+        vram = 0
+        seen = set()
+        for model in models.values():
+            model_ram, model_vram = model_footprint(model, seen)
+            ram += model_ram
+            vram += model_vram
+        return ram, vram
+
+    def over_budget(self) -> str | None:
+        if self.ram_budget is None and self.vram_budget is None:
+            return None
+
+        ram, vram = self.usage()
+        if self.vram_budget is not None and vram > self.vram_budget:
+            return "vram_budget"
+        if self.ram_budget is not None and ram > self.ram_budget:
+            return "ram_budget"
+        return None
+
+    def select_victim(self, keep: str | None = None) -> str | None:
+        with self.lock:
+            entries = {path: self.entries[path] for path in self.models.keys() if path != keep and path in self.entries}
+        if len(entries) == 0:
+            return None
+
+        if self.policy == "cost":
+            return min(entries.keys(), key=lambda path: (entries[path].priority, entries[path].last_used))
+        return min(entries.keys(), key=lambda path: entries[path].last_used)
+
+    def enforce_budget(self, keep: str | None = None):
+        evicted = False
+        while reason := self.over_budget():
+            path = self.select_victim(keep)
+            if path is None:
+                break
+
+            entry = self.entries.get(path)
+            if self.policy == "cost" and entry is not None:
+                self.inflation = entry.priority
+            self.remove(path, False, reason)
+            evicted = True
+
+        if evicted:
+            self.comfy_cleanup()
+            comfy.model_management.soft_empty_cache()
 
     def has(self, path: str):
         return path in self.info and path in self.models
@@ -96,48 +403,199 @@ class ModelCache:
     def get(self, info: rpc_types.CachedModelInfo):
         path = info["path"]
         if self.check(info):
+            self.touch(path)
+            self.get_path_stats(path).last_used = time.time()
             return self.models[path]
 
         return None
 
     def clear(self):
-        self.models = {}
-        self.info = {}
+        with self.lock:
+            paths = list(self.models.keys())
+            self.models = {}
+            self.info = {}
+            self.entries = {}
+            self.components = {}
+        for path in paths:
+            stats = self.get_path_stats(path)
+            stats.evictions += 1
+            stats.last_eviction_reason = "clear"
         comfy.model_management.unload_all_models()
-        self.emit_event()
+        self.emit_event("clear", paths)
+
+    def find_path(self, obj) -> str | None:
+        for path, model in self.snapshot().items():
+            if model is obj:
+                return path
+        return None
 
     def model_info(self, path: str) -> LoadedModelInfo | None:
-        model = self.models[path]
+        model = self.models.get(path)
         if not model:
             return None
 
+        ram, vram = model_footprint(model)
         return {
             "path": path,
-            "size": model_size(model)
+            "size": model_size(model),
+            "ram": ram,
+            "vram": vram,
         }
 
-    def remove_all_except_for(self, infos: list[rpc_types.CachedModelInfo]):
+    def remove_all_except_for(self, infos: list[rpc_types.CachedModelInfo], memory_required: int | None = None):
+        """
+        Removes entries that aren't in infos. Only the removed models are
+        unloaded from the device (if memory_required is set, only until that
+        much memory is free), kept models stay loaded.
+        """
+
         info_map = {}
         for info in infos:
             info_map[info["path"]] = info
 
+        dropped = []
         for key in self.info.copy().keys():
             if key not in info_map or not self.check(info_map[key]):
-                self.remove(key, False)
+                dropped += get_models(self.models.get(key))
+                self.remove(key, False, "cleanup")
 
-        comfy.model_management.unload_all_models()
-        self.emit_event()
+        # Shared text encoders and VAEs may still be used by a kept model.
+        kept = set()
+        for model in self.snapshot().values():
+            for item in get_models(model):
+                if getattr(item, "model", None) is not None:
+                    kept.add(id(item.model))
+        dropped = [item for item in dropped if id(getattr(item, "model", None)) not in kept]
+
+        comfy.model_management.unload_models(dropped, memory_required)
+        self.comfy_cleanup()
 
     def load_cached(self, info: rpc_types.CachedModelInfo, load_function: Callable[[], any]):
-        cached = self.get(info)
-        if cached:
-            return cached
+        path = info["path"]
+        with self.lock:
+            cached = self.get(info)
+            if cached:
+                self.get_path_stats(path).hits += 1
+                return cached
+
+            future = self.in_flight.get(path)
+            if future is None:
+                future = Future()
+                self.in_flight[path] = future
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # Another thread (usually a prefetch) is loading the same path.
+            try:
+                future.result()
+            except Exception:
+                pass
+            return self.load_cached(info, load_function)
+
+        previous_components = getattr(self.local, "components", None)
+        previous_phases = getattr(self.local, "phases", None)
+        self.local.components = []
+        self.local.phases = {}
+        stats = self.get_path_stats(path)
+        stats.misses += 1
+        try:
+            start = time.perf_counter()
+            model = load_function()
+            load_time = time.perf_counter() - start
+
+            stats.load_time += load_time
+            stats.last_load_time = load_time
+            stats.phases = self.local.phases
+            stats.last_used = time.time()
+
+            self.add(model, info, load_time, self.local.components)
+            future.set_result(model)
+            return model
+        except BaseException as e:
+            self.release_components(self.local.components)
+            future.set_exception(e)
+            raise
+        finally:
+            self.local.components = previous_components
+            self.local.phases = previous_phases
+            with self.lock:
+                self.in_flight.pop(path, None)
+
+    def stats(self) -> CacheStats:
+        entries = []
+        hits = 0
+        misses = 0
+
+        models = self.snapshot()
+        total_ram, total_vram = self.usage(models)
+        for path, stats in list(self.path_stats.items()):
+            cached = path in models
+            ram, vram = model_footprint(models[path]) if cached else (0, 0)
+            hits += stats.hits
+            misses += stats.misses
+
+            entry: CacheEntryStats = {
+                "path": path,
+                "cached": cached,
+                "hits": stats.hits,
+                "misses": stats.misses,
+                "load_time": stats.load_time,
+                "last_load_time": stats.last_load_time,
+                "phases": stats.phases,
+                "ram": ram,
+                "vram": vram,
+                "evictions": stats.evictions,
+            }
+            if stats.last_used is not None:
+                entry["last_used"] = stats.last_used
+            if stats.last_eviction_reason is not None:
+                entry["last_eviction_reason"] = stats.last_eviction_reason
+            entries.append(entry)
+
+        result: CacheStats = {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "ram": total_ram,
+            "vram": total_vram,
+            "policy": self.policy,
+        }
+        if self.ram_budget is not None:
+            result["ram_budget"] = self.ram_budget
+        if self.vram_budget is not None:
+            result["vram_budget"] = self.vram_budget
+        return result
+
+    def prefetch(self, info: rpc_types.CachedModelInfo, loader: str) -> bool:
+        """
+        Loads a model into the cache in the background, returns False if it
+        is already cached, being loaded or there's no such loader.
+        """
+
+        if loader not in self.loaders:
+            return False
+
+        path = info["path"]
+        with self.lock:
+            if path in self.in_flight or self.has(path):
+                return False
+
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+        def run():
+            try:
+                self.loaders[loader](info)
+            except Exception:
+                traceback.print_exc()
 
-        model = load_function()
-        self.add(model, info)
-        return model
+        self.executor.submit(run)
+        return True
 
 model_cache = ModelCache()
+comfy.utils.set_span_hook(model_cache.span)
 
 def cache() -> ModelCache:
     return model_cache
@@ -0,0 +1,133 @@
+import os
+import sys
+import ast
+import threading
+import importlib.util
+
+import import_profile
+
+NAMESPACES_DIR = os.path.join(os.path.dirname(__file__), 'namespaces')
+
+def decorator_call(decorator) -> tuple[str | None, list]:
+    """
+    Returns ("method", args) for @RPC.method(...) and similar decorators.
+    """
+
+    args = []
+    if isinstance(decorator, ast.Call):
+        args = decorator.args
+        decorator = decorator.func
+
+    if isinstance(decorator, ast.Attribute) and isinstance(decorator.value, ast.Name) and decorator.value.id == "RPC":
+        return decorator.attr, args
+    return None, args
+
+def constant(args: list, index: int = 0):
+    if len(args) > index and isinstance(args[index], ast.Constant):
+        return args[index].value
+    return None
+
+def scan_class(node: ast.ClassDef) -> dict[str, str | None]:
+    methods = {}
+    for item in node.body:
+        if not isinstance(item, ast.FunctionDef):
+            continue
+
+        name = None
+        lane = None
+        for decorator in item.decorator_list:
+            kind, args = decorator_call(decorator)
+            if kind == "method":
+                name = constant(args) or item.name
+            elif kind == "lane":
+                lane = constant(args)
+
+        if name is not None:
+            methods[name] = lane
+    return methods
+
+def scan(namespace: str) -> dict[str, dict[str, str | None]] | None:
+    """
+    Builds a manifest of the RPC namespaces a namespace package registers,
+    mapping each method to its lane, by parsing the source instead of
+    importing it. Returns None when the package can't be described this way.
+    """
+
+    package_dir = os.path.join(NAMESPACES_DIR, namespace)
+    try:
+        with open(os.path.join(package_dir, '__init__.py'), 'r', encoding='utf-8') as f:
+            init = ast.parse(f.read())
+    except (OSError, SyntaxError):
+        return None
+
+    # rpc.add_namespace('name', ClassName) calls, otherwise named after the module (base).
+    names = {}
+    for node in ast.walk(init):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "add_namespace":
+            if len(node.args) == 2 and isinstance(node.args[1], ast.Name) and isinstance(constant(node.args), str):
+                names[node.args[1].id] = constant(node.args)
+
+    manifest = {}
+    for module in sorted(os.listdir(package_dir)):
+        if module == '__init__.py' or not module.endswith('.py'):
+            continue
+
+        try:
+            with open(os.path.join(package_dir, module), 'r', encoding='utf-8') as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError):
+            return None
+
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name.endswith('Namespace'):
+                name = names.get(node.name, module[:-3] if len(names) == 0 else None)
+                if name is not None:
+                    manifest[name] = scan_class(node)
+
+    if len(manifest) == 0:
+        return None
+    return manifest
+
+class NamespacePackage:
+    """
+    Imports a namespace package on first use.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self, rpc):
+        with self.lock:
+            if self.loaded:
+                return
+
+            with import_profile.profiler.phase(f"namespace:{self.namespace}"):
+                name = f'namespaces.{self.namespace}'
+                spec = importlib.util.spec_from_file_location(name, os.path.join(NAMESPACES_DIR, self.namespace, '__init__.py'))
+                mod = importlib.util.module_from_spec(spec)
+                sys.modules[name] = mod
+                try:
+                    spec.loader.exec_module(mod)
+                except:
+                    # Retried on the next call.
+                    del sys.modules[name]
+                    raise
+                mod.insert_all(rpc)
+
+            self.loaded = True
+
+def register(rpc, namespace: str, lazy: bool = True):
+    """
+    Registers a namespace package, lazily if its manifest can be built.
+    """
+
+    package = NamespacePackage(namespace)
+    manifest = scan(namespace) if lazy else None
+    if manifest is None:
+        package.load(rpc)
+        return
+
+    for name, methods in manifest.items():
+        rpc.add_lazy_namespace(name, methods, package.load)
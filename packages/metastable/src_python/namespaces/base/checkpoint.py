@@ -14,6 +14,8 @@ from .utils.checkpoint import get_latent_type
 from rpc import RPC
 import rpc_types
 from model_cache import cache
+import state_cache
+import conditioning_cache
 
 def apply_config(checkpoint, config_path):
     try:
@@ -37,6 +39,8 @@ def apply_config(checkpoint, config_path):
             if "params" in clip_config and "layer_idx" in clip_config["params"]:
                 layer_idx = clip_config["params"]["layer_idx"]
                 if layer_idx is not None:
+                    # The text encoder can be shared with other checkpoints.
+                    clip = clip.clone()
                     clip.clip_layer(layer_idx)
 
         return (model, clip, vae, clipvision)
@@ -50,8 +54,18 @@ def load_checkpoint(path, embeddings_path=None, config_path=None):
         "config_path": config_path,
     }
   
+    def load_component(kind, sd, load):
+        with cache().span("fingerprint"):
+            key = f"{kind}:{state_cache.component_hash(path, kind, sd)}"
+        if kind == "clip":
+            key += f":{embeddings_path}"
+        component = cache().load_component(key, load)
+        if kind == "clip" and component is not None:
+            conditioning_cache.cache().register(component, key)
+        return component
+
     def load():
-        checkpoint = comfy.sd.load_checkpoint_guess_config(path, output_vae=True, output_clip=True, embedding_directory=embeddings_path)
+        checkpoint = state_cache.load_checkpoint(path, embedding_directory=embeddings_path, load_component=load_component)
 
         if config_path is not None:
             checkpoint = apply_config(checkpoint, config_path)
@@ -60,6 +74,8 @@ def load_checkpoint(path, embeddings_path=None, config_path=None):
     
     return cache().load_cached(info, load)
 
+cache().register_loader("checkpoint", lambda info: load_checkpoint(info["path"], info.get("embeddings_path"), info.get("config_path")))
+
 class CheckpointLoadResult(TypedDict):
     diffusion_model: rpc_types.DiffusionModel
     text_encoder: NotRequired[rpc_types.TextEncoder]
@@ -67,6 +83,7 @@ class CheckpointLoadResult(TypedDict):
     latent_type: str
 
 class CheckpointNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str, embeddings_path: str = None, config_path: str = None) -> CheckpointLoadResult:
@@ -4,6 +4,7 @@ from rpc import RPC
 import rpc_types
 
 class CLIPVisionNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.ClipVisionModel:
@@ -11,6 +11,7 @@ from .utils.checkpoint import get_latent_type
 from rpc import RPC
 import rpc_types
 from model_cache import cache
+import state_cache
 
 def load_diffusion_model(path, model_options={}):
     info = {
@@ -25,15 +26,18 @@ def load_diffusion_model(path, model_options={}):
             except ImportError as e:
                 raise ValueError(f"Missing GGUF support.")
         else:
-            return comfy.sd.load_diffusion_model(path, model_options=model_options)
+            return state_cache.load_diffusion_model(path, model_options=model_options)
     
     return cache().load_cached(info, load)
 
+cache().register_loader("diffusion_model", lambda info: load_diffusion_model(info["path"]))
+
 class DiffusionModelLoadResult(TypedDict):
     diffusion_model: rpc_types.DiffusionModel
     latent_type: str
 
 class DiffusionModelNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> DiffusionModelLoadResult:
@@ -12,6 +12,7 @@ class ImageLoadResult(TypedDict):
     mask: rpc_types.ImageTensor
 
 class ImageNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(data: BytesIO) -> ImageLoadResult:
@@ -32,6 +33,7 @@ class ImageNamespace:
             "mask": mask
         }
 
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def dump(image: rpc_types.ImageTensor, format: str = "PNG") -> BytesIO:
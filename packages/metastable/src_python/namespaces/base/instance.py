@@ -5,10 +5,14 @@ import torch
 from comfy.model_management import get_torch_device, get_total_memory, vae_dtype, is_intel_xpu
 import comfy.samplers
 from .utils import custom
+from .utils.model_info import model_index, ModelInspectInfo
 
 from rpc import RPC
 import rpc_types
-from model_cache import cache, LoadedModelInfo
+from model_cache import cache, LoadedModelInfo, CacheStats
+from import_profile import profiler, ImportProfile
+import state_cache
+from state_cache import StateCacheStats
 
 class TorchDeviceInfo(TypedDict):
     type: str
@@ -78,6 +82,7 @@ class InstanceInfo(TypedDict):
     schedulers: list[str]
 
 class InstanceNamespace:
+    @RPC.lane("trivial")
     @RPC.method
     def info() -> InstanceInfo:
         return {
@@ -86,13 +91,56 @@ class InstanceNamespace:
             "schedulers": comfy.samplers.KSampler.SCHEDULERS + list(custom.get_custom_schedulers().keys())
         }
 
+    @RPC.lane("gpu")
     @RPC.method
-    def cleanup_models(except_for: list[rpc_types.CachedModelInfo] = []) -> None:
+    def cleanup_models(except_for: list[rpc_types.CachedModelInfo] = [], memory_required: int | None = None) -> None:
         if len(except_for) > 0:
-            cache().remove_all_except_for(except_for)
+            cache().remove_all_except_for(except_for, memory_required)
         else:
             cache().clear()
 
+    @RPC.lane("cpu")
+    @RPC.method
+    def inspect(paths: list[str]) -> list[ModelInspectInfo]:
+        return model_index.inspect(paths)
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def prefetch(models: list[rpc_types.PrefetchModelInfo]) -> list[str]:
+        prefetched = []
+        for model in models:
+            info = { key: value for key, value in model.items() if key != "loader" }
+            if cache().prefetch(info, model["loader"]):
+                prefetched.append(info["path"])
+
+        return prefetched
+
+    @RPC.lane("gpu")
+    @RPC.method
+    def configure_cache(ram_budget: int | None = None, vram_budget: int | None = None, policy: str = "lru") -> None:
+        cache().configure(ram_budget, vram_budget, policy)
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def import_profile(limit: int = 25) -> ImportProfile:
+        return profiler.report(limit)
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def cache_stats() -> CacheStats:
+        return cache().stats()
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def state_cache_stats() -> StateCacheStats:
+        return state_cache.stats()
+
+    @RPC.lane("cpu")
+    @RPC.method
+    def clear_state_cache() -> None:
+        state_cache.clear()
+
+    @RPC.lane("trivial")
     @RPC.method
     def loaded_models() -> list[LoadedModelInfo]:
-        return [cache().model_info(k) for k in cache().models.keys()]
+        return [cache().model_info(k) for k in cache().snapshot().keys()]
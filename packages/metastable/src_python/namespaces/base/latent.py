@@ -5,6 +5,7 @@ from rpc import RPC
 import rpc_types
 
 class LatentNamespace:
+    @RPC.lane("trivial")
     @RPC.autoref
     @RPC.method
     def empty(width: int, height: int, length: int = 1, batch_size: int = 1, latent_type: str = "default") -> rpc_types.Latent:
@@ -1,12 +1,16 @@
+import copy
 import comfy.model_patcher
 import comfy.samplers
 import comfy.sample
 import torch
 import node_helpers
-from .utils import custom, latent_preview
+from .utils import batching, custom, latent_preview
+from .utils.noise import prepare_noise, NOISE_MODE_CPU
+from .utils.step_cache import StepCache, StepCacheStats, apply as apply_step_cache
 
 from rpc import RPC
 import rpc_types
+import rpc_hook
 
 def model_set_circular(model, is_circular=False):
     if isinstance(model, torch.nn.Conv2d):
@@ -20,12 +24,14 @@ def get_callback(diffusion_model, steps, preview_config=None, x0_output=None):
             if "taesd" in preview_config and taesd_decoder_name in preview_config["taesd"]:
                 taesd_decoder_path = preview_config["taesd"][taesd_decoder_name]
 
+        rpc_hook.configure_preview(preview_config.get("format"))
         return latent_preview.prepare_callback(
             model=diffusion_model, 
             method=preview_config["method"],
             steps=steps,
             x0_output_dict=x0_output,
             taesd_decoder_path=taesd_decoder_path,
+            max_fps=preview_config.get("max_fps", latent_preview.DEFAULT_PREVIEW_FPS),
         )
     else:
         return latent_preview.prepare_callback(
@@ -36,71 +42,31 @@ def get_callback(diffusion_model, steps, preview_config=None, x0_output=None):
         )
 
 class Noise_RandomNoise:
-    def __init__(self, seed):
+    def __init__(self, seed, mode=NOISE_MODE_CPU):
         self.seed = seed
+        self.mode = mode
 
-    def generate_noise(self, input_latent):
+    def generate_noise(self, input_latent, device=None):
         latent_image = input_latent["samples"]
         batch_inds = input_latent["batch_index"] if "batch_index" in input_latent else None
-        return comfy.sample.prepare_noise(latent_image, self.seed, batch_inds)
+        return prepare_noise(latent_image, self.seed, batch_inds, self.mode, device)
 
 class Guider_Basic(comfy.samplers.CFGGuider):
     def set_conds(self, positive):
         self.inner_set_conds({"positive": positive})
 
-class SamplingNamespace:
-    @RPC.autoref
-    @RPC.method
-    def get_sampler(sampler_name: str) -> rpc_types.Sampler:
-        return comfy.samplers.sampler_object(sampler_name)
-    
-    @RPC.autoref
-    @RPC.method
-    def get_sigmas(diffusion_model: rpc_types.DiffusionModel, scheduler_name: str, steps: int, denoise: float = 1) -> rpc_types.Sigmas:
-        total_steps = steps
-        if denoise < 1.0:
-            if denoise <= 0.0:
-                return (torch.FloatTensor([]),)
-            total_steps = int(steps/denoise)
+def run_sample(diffusion_model, latent, positive, negative, sampler_name, scheduler_name, steps, denoise, cfg, seed, is_circular, preview, noise_mode=NOISE_MODE_CPU, step_cache=None):
+    model_set_circular(diffusion_model, is_circular)
+    if step_cache is not None:
+        step_cache.acquire()
 
-        custom_schedulers = custom.get_custom_schedulers()
-        sigmas = None
-        if scheduler_name not in custom_schedulers:
-            sigmas = comfy.samplers.calculate_sigmas(diffusion_model.get_model_object("model_sampling"), scheduler_name, total_steps).cpu()
-        else:
-            scheduler = custom_schedulers[scheduler_name]
-            sigmas = scheduler(diffusion_model, steps, denoise)
-        
-        sigmas = sigmas[-(steps + 1):]
-        return sigmas
-    
-    @RPC.autoref
-    @RPC.method
-    def flux_guidance(conditioning: rpc_types.Conditioning, guidance: float) -> rpc_types.Conditioning:
-        return node_helpers.conditioning_set_values(conditioning, {"guidance": guidance})
-    
-    @RPC.autoref
-    @RPC.method
-    def basic_guider(diffusion_model: rpc_types.DiffusionModel, conditioning: rpc_types.Conditioning) -> rpc_types.Guider:
-        guider = Guider_Basic(diffusion_model)
-        guider.set_conds(conditioning)
-        return guider
-    
-    @RPC.autoref
-    @RPC.method
-    def cfg_guider(diffusion_model: rpc_types.DiffusionModel, positive: rpc_types.Conditioning, negative: rpc_types.Conditioning, cfg: float) -> rpc_types.Guider:
-        guider = comfy.samplers.CFGGuider(diffusion_model)
-        guider.set_conds(positive, negative)
-        guider.set_cfg(cfg)
-        return guider
-    
-    @RPC.autoref
-    @RPC.method
-    def sample(diffusion_model: rpc_types.DiffusionModel, latent: rpc_types.Latent, positive: rpc_types.Conditioning, negative: rpc_types.Conditioning, sampler_name: str, scheduler_name: str, steps: int, denoise: float, cfg: float, seed: int, is_circular: bool = False, preview = None) -> rpc_types.LatentTensor:
-        model_set_circular(diffusion_model, is_circular)
+    try:
+        if step_cache is not None:
+            diffusion_model = diffusion_model.clone()
+            diffusion_model.model_options = apply_step_cache(diffusion_model.model_options, step_cache)
 
         latent_image = comfy.sample.fix_empty_latent_channels(diffusion_model, latent["samples"])
-        noise = comfy.sample.prepare_noise(latent_image, seed, None)
+        noise = prepare_noise(latent_image, seed, None, noise_mode, diffusion_model.load_device)
 
         noise_mask = None
         if "noise_mask" in latent:
@@ -148,15 +114,19 @@ class SamplingNamespace:
                 disable_pbar=True,
                 seed=seed
             )
-    
-    @RPC.autoref
-    @RPC.method
-    def random_noise(seed: int) -> rpc_types.Noise:
-        return Noise_RandomNoise(seed)
+    finally:
+        if step_cache is not None:
+            step_cache.release()
+
+def run_sample_custom(noise, guider, sampler, sigmas, latent, preview, step_cache=None):
+    if step_cache is not None:
+        step_cache.acquire()
+
+    try:
+        if step_cache is not None:
+            guider = copy.copy(guider)
+            guider.model_options = apply_step_cache(guider.model_options, step_cache)
 
-    @RPC.autoref
-    @RPC.method
-    def sample_custom(noise: rpc_types.Noise, guider: rpc_types.Guider, sampler: rpc_types.Sampler, sigmas: rpc_types.Sigmas, latent: rpc_types.Latent, preview=None) -> rpc_types.LatentTensor:
         latent["samples"] = comfy.sample.fix_empty_latent_channels(guider.model_patcher, latent["samples"])
 
         noise_mask = None
@@ -172,7 +142,7 @@ class SamplingNamespace:
         )
 
         samples = guider.sample(
-            noise.generate_noise(latent),
+            noise.generate_noise(latent, guider.model_patcher.load_device),
             latent["samples"],
             sampler,
             sigmas,
@@ -183,4 +153,90 @@ class SamplingNamespace:
         )
         samples = samples.to(comfy.model_management.intermediate_device())
 
-        return samples
\ No newline at end of file
+        return samples
+    finally:
+        if step_cache is not None:
+            step_cache.release()
+
+class SamplingNamespace:
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def get_sampler(sampler_name: str) -> rpc_types.Sampler:
+        return comfy.samplers.sampler_object(sampler_name)
+    
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def get_sigmas(diffusion_model: rpc_types.DiffusionModel, scheduler_name: str, steps: int, denoise: float = 1) -> rpc_types.Sigmas:
+        total_steps = steps
+        if denoise < 1.0:
+            if denoise <= 0.0:
+                return (torch.FloatTensor([]),)
+            total_steps = int(steps/denoise)
+
+        custom_schedulers = custom.get_custom_schedulers()
+        sigmas = None
+        if scheduler_name not in custom_schedulers:
+            sigmas = comfy.samplers.calculate_sigmas(diffusion_model.get_model_object("model_sampling"), scheduler_name, total_steps).cpu()
+        else:
+            scheduler = custom_schedulers[scheduler_name]
+            sigmas = scheduler(diffusion_model, steps, denoise)
+        
+        sigmas = sigmas[-(steps + 1):]
+        return sigmas
+    
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def flux_guidance(conditioning: rpc_types.Conditioning, guidance: float) -> rpc_types.Conditioning:
+        return node_helpers.conditioning_set_values(conditioning, {"guidance": guidance})
+    
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def basic_guider(diffusion_model: rpc_types.DiffusionModel, conditioning: rpc_types.Conditioning) -> rpc_types.Guider:
+        guider = Guider_Basic(diffusion_model)
+        guider.set_conds(conditioning)
+        return guider
+    
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def cfg_guider(diffusion_model: rpc_types.DiffusionModel, positive: rpc_types.Conditioning, negative: rpc_types.Conditioning, cfg: float) -> rpc_types.Guider:
+        guider = comfy.samplers.CFGGuider(diffusion_model)
+        guider.set_conds(positive, negative)
+        guider.set_cfg(cfg)
+        return guider
+    
+    @RPC.lane("sampling")
+    @RPC.autoref
+    @RPC.method
+    def sample(diffusion_model: rpc_types.DiffusionModel, latent: rpc_types.Latent, positive: rpc_types.Conditioning, negative: rpc_types.Conditioning, sampler_name: str, scheduler_name: str, steps: int, denoise: float, cfg: float, seed: int, is_circular: bool = False, preview = None, noise_mode: str = NOISE_MODE_CPU, step_cache: rpc_types.StepCache = None) -> rpc_types.LatentTensor:
+        with batching.engine.job(diffusion_model):
+            return run_sample(diffusion_model, latent, positive, negative, sampler_name, scheduler_name, steps, denoise, cfg, seed, is_circular, preview, noise_mode, step_cache)
+
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def random_noise(seed: int, mode: str = NOISE_MODE_CPU) -> rpc_types.Noise:
+        return Noise_RandomNoise(seed, mode)
+
+    @RPC.lane("sampling")
+    @RPC.autoref
+    @RPC.method
+    def sample_custom(noise: rpc_types.Noise, guider: rpc_types.Guider, sampler: rpc_types.Sampler, sigmas: rpc_types.Sigmas, latent: rpc_types.Latent, preview=None, step_cache: rpc_types.StepCache = None) -> rpc_types.LatentTensor:
+        with batching.engine.job(guider.model_patcher):
+            return run_sample_custom(noise, guider, sampler, sigmas, latent, preview, step_cache)
+
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def step_cache(threshold: float | None = None) -> rpc_types.StepCache:
+        return StepCache(threshold)
+
+    @RPC.lane("trivial")
+    @RPC.autoref
+    @RPC.method
+    def step_cache_stats(step_cache: rpc_types.StepCache) -> StepCacheStats:
+        return step_cache.stats()
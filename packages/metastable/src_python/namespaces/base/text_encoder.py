@@ -1,8 +1,13 @@
+import json
 import comfy.sd
 
 from rpc import RPC
 import rpc_types
 from model_cache import cache
+from .utils.text_encoding import encode_from_tokens_batch
+import conditioning_cache
+import state_cache
+from conditioning_cache import ConditioningCacheStats
 
 TYPE_MAP = {
     "stable_cascade": comfy.sd.CLIPType.STABLE_CASCADE,
@@ -31,24 +36,58 @@ def load_text_encoder(paths: list[str], type: str, embeddings_path: str = None):
         
         return comfy.sd.load_clip(ckpt_paths=paths, embedding_directory=embeddings_path, clip_type=text_encoder_type)
     
-    return cache().load_cached(info, load)
+    text_encoder = cache().load_cached(info, load)
+    description = json.dumps(["text_encoder", [state_cache.file_key(path) for path in paths], type, embeddings_path])
+    conditioning_cache.cache().register(text_encoder, description)
+    return text_encoder
+
+cache().register_loader("text_encoder", lambda info: load_text_encoder(info["path"].split(';'), info.get("type") or info.get("model_type"), info.get("embeddings_path")))
 
 class TextEncoderNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(paths: list[str], type: str, embeddings_path: str = None) -> rpc_types.TextEncoder:
         return load_text_encoder(paths, type, embeddings_path)
     
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def encode(text_encoder: rpc_types.TextEncoder, text: str) -> rpc_types.Conditioning:
-        tokens = text_encoder.tokenize(text)
-        cond, pooled = text_encoder.encode_from_tokens(tokens, return_pooled=True)
+        def encode_text():
+            tokens = text_encoder.tokenize(text)
+            return text_encoder.encode_from_tokens(tokens, return_pooled=True)
+
+        # Repeated prompts don't load the text encoder at all.
+        cond, pooled = conditioning_cache.cache().encode(text_encoder, text, encode_text)
         return [[cond, {"pooled_output": pooled}]]
+
+    @RPC.lane("gpu")
+    @RPC.autoref
+    @RPC.method
+    def encode_batch(text_encoder: rpc_types.TextEncoder, texts: list[str]) -> list[rpc_types.Conditioning]:
+        def encode_texts(texts: list[str]):
+            return encode_from_tokens_batch(text_encoder, [text_encoder.tokenize(text) for text in texts])
+
+        values = conditioning_cache.cache().encode_batch(text_encoder, texts, encode_texts)
+        return [[[cond, {"pooled_output": pooled}]] for cond, pooled in values]
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def configure_cache(budget: int | None = None, disk_budget: int | None = None) -> None:
+        conditioning_cache.cache().configure(budget, disk_budget)
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def cache_stats() -> ConditioningCacheStats:
+        return conditioning_cache.cache().stats()
     
+    @RPC.lane("trivial")
     @RPC.autoref
     @RPC.method
     def set_layer(text_encoder: rpc_types.TextEncoder, layer: int) -> rpc_types.TextEncoder:
+        # Cached text encoders can be shared between checkpoints.
+        text_encoder = text_encoder.clone()
         if layer == None or layer == 0:
             text_encoder.clip_layer(None)
         else:
@@ -0,0 +1,274 @@
+import threading
+from contextlib import contextmanager
+
+import torch
+import comfy.samplers
+import comfy.model_management
+
+# Set by each call, everything else in transformer_options has to match.
+PER_CALL_OPTIONS = ("cond_or_uncond", "uuids", "sigmas")
+# Patches read cond_or_uncond and sigmas assuming the layout of a single call,
+# step caches keep state for the calls of a single job.
+UNMERGEABLE_OPTIONS = ("patches", "patches_replace", "step_cache")
+
+class Ticket:
+    def __init__(self, patcher):
+        self.patcher = patcher
+
+class ForwardRequest:
+    def __init__(self, apply_model, args):
+        self.apply_model = apply_model
+        self.args = args
+        self.key = batch_key(apply_model, args)
+        self.output = None
+        self.error = None
+        self.done = False
+
+def batch_key(apply_model, args):
+    """
+    Calls with equal keys can be concatenated along the batch dimension,
+    None if the call has to run on its own.
+    """
+
+    input_x = args["input"]
+    batch_size = input_x.shape[0]
+    key = [id(getattr(apply_model, "__self__", apply_model)), tuple(input_x.shape[1:]), input_x.dtype, input_x.device]
+
+    for name in sorted(args["c"].keys()):
+        value = args["c"][name]
+        if name == "transformer_options":
+            if any(option in value for option in UNMERGEABLE_OPTIONS):
+                return None
+        elif isinstance(value, torch.Tensor):
+            if value.ndim == 0 or value.shape[0] != batch_size:
+                return None
+            key.append((name, tuple(value.shape[1:]), value.dtype, value.device))
+        else:
+            try:
+                key.append((name, hash(value), value))
+            except TypeError:
+                return None
+
+    return tuple(key)
+
+def options_equal(a: dict, b: dict) -> bool:
+    if a.keys() != b.keys():
+        return False
+
+    for name in a.keys():
+        if name in PER_CALL_OPTIONS or a[name] is b[name]:
+            continue
+        try:
+            if not bool(a[name] == b[name]):
+                return False
+        except Exception:
+            return False
+    return True
+
+def merge_options(requests: list[ForwardRequest]) -> dict:
+    options = dict(requests[0].args["c"]["transformer_options"])
+    all_options = [request.args["c"]["transformer_options"] for request in requests]
+    if all("cond_or_uncond" in o for o in all_options):
+        options["cond_or_uncond"] = [x for o in all_options for x in o["cond_or_uncond"]]
+    if all("uuids" in o for o in all_options):
+        options["uuids"] = [x for o in all_options for x in o["uuids"]]
+    if all(isinstance(o.get("sigmas"), torch.Tensor) for o in all_options):
+        options["sigmas"] = torch.cat([o["sigmas"] for o in all_options])
+    return options
+
+def run_merged(requests: list[ForwardRequest]):
+    first = requests[0]
+    sizes = [request.args["input"].shape[0] for request in requests]
+    c = {}
+    for name, value in first.args["c"].items():
+        if name == "transformer_options":
+            c[name] = merge_options(requests)
+        elif isinstance(value, torch.Tensor):
+            c[name] = torch.cat([request.args["c"][name] for request in requests])
+        else:
+            c[name] = value
+
+    input_x = torch.cat([request.args["input"] for request in requests])
+    timestep = torch.cat([request.args["timestep"] for request in requests])
+    outputs = first.apply_model(input_x, timestep, **c).split(sizes)
+    for request, output in zip(requests, outputs):
+        request.output = output
+
+def split_by_memory(requests: list[ForwardRequest]) -> list[list[ForwardRequest]]:
+    """
+    Splits a group into batches small enough to fit, the same way
+    calc_cond_batch limits its batches.
+    """
+
+    first = requests[0]
+    model = getattr(first.apply_model, "__self__", None)
+    if len(requests) == 1:
+        return [requests]
+    if model is None or not hasattr(model, "memory_required"):
+        return [[request] for request in requests]
+
+    free_memory = comfy.model_management.get_free_memory(first.args["input"].device)
+    batches = []
+    batch = []
+    batch_size = 0
+    for request in requests:
+        size = request.args["input"].shape[0]
+        input_shape = [batch_size + size] + list(request.args["input"].shape[1:])
+        if len(batch) > 0 and model.memory_required(input_shape) * 1.5 >= free_memory:
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+        batch.append(request)
+        batch_size += size
+
+    batches.append(batch)
+    return batches
+
+class BatchEngine:
+    """
+    Runs concurrent sampling jobs of the same model in lockstep, merging the
+    model calls they make at the same time into one batched call.
+
+    Jobs take turns on a baton, one of them runs at a time just like on the
+    gpu lane, and give it up only while waiting for their model call. Once
+    every active job is waiting, the last one runs the merged call for all
+    of them. Jobs join and leave between model calls, so they don't need the
+    same sampler, step count or schedule, each keeps its own CFG, seed,
+    conditioning and callbacks.
+    """
+
+    def __init__(self, max_wait: float = 0.1):
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.baton = threading.Lock()
+        self.local = threading.local()
+        self.patcher = None
+        self.active = 0
+        self.waiting: list[Ticket] = []
+        self.pending: list[ForwardRequest] = []
+
+    @contextmanager
+    def job(self, patcher):
+        """
+        Runs a sampling job as part of the current batch. Only jobs sampling
+        the same patcher run together, others wait for them to finish.
+        """
+
+        ticket = Ticket(patcher)
+        with self.condition:
+            self.waiting.append(ticket)
+            while not self.can_enter(ticket):
+                self.condition.wait()
+            self.waiting.remove(ticket)
+            self.patcher = patcher
+            self.active += 1
+            self.condition.notify_all()
+
+        self.baton.acquire()
+        self.local.active = True
+        try:
+            yield
+        finally:
+            self.local.active = False
+            with self.condition:
+                self.active -= 1
+                if self.active == 0:
+                    self.patcher = None
+                ready = self.take_ready()
+            # Jobs left waiting for this one can go ahead.
+            self.execute(ready)
+            self.baton.release()
+            with self.condition:
+                self.condition.notify_all()
+
+    def can_enter(self, ticket) -> bool:
+        for waiting in self.waiting:
+            if waiting is ticket:
+                break
+            if waiting.patcher is not ticket.patcher:
+                # First come, first served between models.
+                return False
+        return self.patcher is None or self.patcher is ticket.patcher
+
+    def take_ready(self, force: bool = False) -> list[ForwardRequest]:
+        if len(self.pending) == 0 or (not force and len(self.pending) < self.active):
+            return []
+
+        ready = self.pending
+        self.pending = []
+        return ready
+
+    def execute(self, requests: list[ForwardRequest]):
+        try:
+            groups: list[list[ForwardRequest]] = []
+            for request in requests:
+                for group in groups:
+                    if request.key is not None and group[0].key == request.key and options_equal(group[0].args["c"]["transformer_options"], request.args["c"]["transformer_options"]):
+                        group.append(request)
+                        break
+                else:
+                    groups.append([request])
+
+            for group in groups:
+                for batch in split_by_memory(group):
+                    self.run(batch)
+        except Exception as e:
+            for request in requests:
+                if request.output is None and request.error is None:
+                    request.error = e
+        finally:
+            # Jobs waiting for any of these requests must wake up, whatever happened.
+            with self.condition:
+                for request in requests:
+                    request.done = True
+                self.condition.notify_all()
+
+    def run(self, batch: list[ForwardRequest]):
+        if len(batch) > 1:
+            try:
+                run_merged(batch)
+                return
+            except Exception as e:
+                # Retried one by one below, each request gets its own error.
+                if isinstance(e, comfy.model_management.OOM_EXCEPTION):
+                    comfy.model_management.soft_empty_cache()
+
+        for request in batch:
+            try:
+                request.output = request.apply_model(request.args["input"], request.args["timestep"], **request.args["c"])
+            except Exception as e:
+                request.error = e
+
+    def forward(self, apply_model, args):
+        if not getattr(self.local, "active", False):
+            return apply_model(args["input"], args["timestep"], **args["c"])
+
+        request = ForwardRequest(apply_model, args)
+        with self.condition:
+            self.pending.append(request)
+            ready = self.take_ready()
+        self.execute(ready)
+
+        if not request.done:
+            self.baton.release()
+            try:
+                with self.condition:
+                    while not request.done:
+                        if not self.condition.wait(self.max_wait):
+                            break
+            finally:
+                self.baton.acquire()
+
+            # Nobody else runs while the baton is held, so the request is
+            # either done or still pending.
+            if not request.done:
+                with self.condition:
+                    ready = self.take_ready(force=True)
+                self.execute(ready)
+
+        if request.error is not None:
+            raise request.error
+        return request.output
+
+engine = BatchEngine()
+comfy.samplers.set_apply_model_hook(engine.forward)
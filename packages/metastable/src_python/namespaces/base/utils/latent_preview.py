@@ -1,9 +1,12 @@
+import time
 import torch
 from PIL import Image
 from comfy.taesd.taesd import TAESD
 import comfy.utils
+import comfy.model_management
 
 MAX_PREVIEW_RESOLUTION = 512
+DEFAULT_PREVIEW_FPS = 15
 
 def preview_to_image(latent_image):
         latents_ubyte = (((latent_image + 1.0) / 2.0).clamp(0, 1)  # change scale from -1..1 to 0..1
@@ -70,16 +73,24 @@ def get_previewer(device, method, latent_format, taesd_decoder_path):
                 previewer = Latent2RGBPreviewer(latent_format.latent_rgb_factors)
     return previewer
 
-def prepare_callback(model, method, steps, x0_output_dict=None, taesd_decoder_path=None):
+def prepare_callback(model, method, steps, x0_output_dict=None, taesd_decoder_path=None, max_fps=DEFAULT_PREVIEW_FPS):
     previewer = get_previewer(model.load_device, method, model.model.latent_format, taesd_decoder_path)
+    min_interval = 1.0 / max_fps if max_fps else 0
+    last_preview = None
 
     pbar = comfy.utils.ProgressBar(steps)
     def callback(step, x0, x, total_steps):
+        nonlocal last_preview
+        comfy.model_management.throw_exception_if_processing_interrupted()
         if x0_output_dict is not None:
             x0_output_dict["x0"] = x0
 
         preview_bytes = None
-        if previewer:
+        # Skip decoding previews that would exceed the frame rate limit,
+        # except for the last one.
+        now = time.monotonic()
+        if previewer and (last_preview is None or now - last_preview >= min_interval or step >= total_steps - 1):
+            last_preview = now
             preview_bytes = previewer.decode_latent_to_preview(x0)
         pbar.update_absolute(step + 1, total_steps, preview_bytes)
     return callback
@@ -0,0 +1,168 @@
+import os
+import math
+import json
+import logging
+import threading
+from typing import NotRequired, TypedDict
+
+import comfy.model_detection
+from comfy.lazy_state_dict import LazyStateDict
+from .checkpoint import latent_type_from_config
+
+import state_cache
+
+# Bump when the detected fields change, so older index entries are ignored.
+VERSION = 1
+
+class ModelInspectInfo(TypedDict):
+    path: str
+    format: str
+    type: NotRequired[str]
+    architecture: NotRequired[str]
+    image_model: NotRequired[str]
+    latent_type: NotRequired[str]
+    parameters: NotRequired[int]
+    dtype: NotRequired[str]
+    has_vae: NotRequired[bool]
+    error: NotRequired[str]
+
+def read_state_dict(path: str):
+    """
+    Returns (state_dict, metadata, format) without reading the weights,
+    tensors are only views of memory-mapped files.
+    """
+
+    lower = path.lower()
+    if lower.endswith(".gguf"):
+        from .gguf.loader import gguf_sd_loader
+        return gguf_sd_loader(path), None, "gguf"
+    elif lower.endswith(".safetensors") or lower.endswith(".sft"):
+        sd = LazyStateDict(path)
+        return sd, sd.metadata, "safetensors"
+
+    raise ValueError("Unsupported file format.")
+
+def detect(path: str) -> ModelInspectInfo:
+    sd, metadata, format = read_state_dict(path)
+    info: ModelInspectInfo = { "path": path, "format": format }
+
+    prefix = comfy.model_detection.unet_prefix_from_state_dict(sd)
+    if any(k.startswith(prefix) for k in sd.keys()):
+        info["type"] = "checkpoint"
+    else:
+        prefix = ""
+        info["type"] = "diffusion_model"
+
+    # model_config_from_unet removes some keys.
+    detection_sd = { k: sd[k] for k in sd.keys() }
+    model_config = comfy.model_detection.model_config_from_unet(detection_sd, prefix, metadata=metadata)
+    if model_config is None:
+        info["type"] = "unknown"
+        return info
+
+    unet_config = model_config.unet_config
+    model_type = model_config.model_type(detection_sd, prefix)
+
+    info["architecture"] = model_config.__class__.__name__
+    if "image_model" in unet_config:
+        info["image_model"] = unet_config["image_model"]
+    info["latent_type"] = latent_type_from_config(unet_config, model_type)
+
+    parameters = 0
+    dtypes = {}
+    for k in detection_sd.keys():
+        if k.startswith(prefix):
+            t = detection_sd[k]
+            # Quantized GGUF tensors keep their original shape separately.
+            count = math.prod(getattr(t, "tensor_shape", t.shape))
+            parameters += count
+            dtypes[str(t.dtype)] = dtypes.get(str(t.dtype), 0) + count
+    info["parameters"] = parameters
+    if len(dtypes) > 0:
+        info["dtype"] = max(dtypes, key=dtypes.get)
+
+    if info["type"] == "checkpoint":
+        info["has_vae"] = any(k.startswith(vae_prefix) for k in sd.keys() for vae_prefix in model_config.vae_key_prefix)
+
+    return info
+
+class ModelIndex:
+    """
+    Remembers inspection results by path, mtime and size.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def get_path(self) -> str | None:
+        cache_dir = state_cache.get_cache_dir()
+        if cache_dir is None:
+            return None
+        return os.path.join(cache_dir, "model_index.json")
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        self.entries = {}
+        path = self.get_path()
+        if path is None:
+            return
+
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        path = self.get_path()
+        if path is None:
+            return
+
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({ "version": VERSION, "entries": self.entries }, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning("Unable to save model index: {}".format(e))
+
+    def inspect(self, paths: list[str]) -> list[ModelInspectInfo]:
+        results = []
+        changed = False
+
+        with self.lock:
+            self.load()
+
+            for path in paths:
+                key = os.path.abspath(path)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    results.append({ "path": path, "format": "unknown", "error": str(e) })
+                    continue
+
+                entry = self.entries.get(key)
+                if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    results.append({ **entry["info"], "path": path })
+                    continue
+
+                try:
+                    info = detect(path)
+                except Exception as e:
+                    info = { "path": path, "format": "unknown", "error": str(e) }
+
+                self.entries[key] = { "mtime": stat.st_mtime, "size": stat.st_size, "info": info }
+                changed = True
+                results.append(info)
+
+            if changed:
+                self.save()
+
+        return results
+
+model_index = ModelIndex()
@@ -0,0 +1,97 @@
+import math
+import torch
+import comfy.sample
+
+# Same noise as ComfyUI, drawn on the CPU from a single generator.
+NOISE_MODE_CPU = "cpu"
+# Counter-based noise drawn on the sampling device.
+NOISE_MODE_PHILOX = "philox"
+NOISE_MODES = (NOISE_MODE_CPU, NOISE_MODE_PHILOX)
+
+PHILOX_M0 = 0xD2511F53
+PHILOX_M1 = 0xCD9E8D57
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+MASK = 0xFFFFFFFF
+
+def mulhilo(a: int, b):
+    """
+    High and low 32 bits of a * b, split so int64 tensors never overflow.
+    """
+
+    hi_part = a * (b >> 16)
+    mid = a * (b & 0xFFFF) + ((hi_part & 0xFFFF) << 16)
+    return (hi_part >> 16) + (mid >> 32), mid & MASK
+
+def philox4x32(counter: list, key: tuple[int, int]) -> list:
+    """
+    Philox4x32-10 of four 32-bit counter words, given as int64 tensors
+    (or ints), with a 64-bit key.
+    """
+
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for _ in range(PHILOX_ROUNDS):
+        hi0, lo0 = mulhilo(PHILOX_M0, c0)
+        hi1, lo1 = mulhilo(PHILOX_M1, c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+        k0 = (k0 + PHILOX_W0) & MASK
+        k1 = (k1 + PHILOX_W1) & MASK
+    return [c0, c1, c2, c3]
+
+def uniform(x):
+    # 23 bits so that adding half a step stays exact in float32, never 0 or 1.
+    return ((x >> 9).to(torch.float32) + 0.5) * (2.0 ** -23)
+
+def randn(shape, seed: int, indices: list[int], dtype=torch.float32, device="cpu") -> torch.Tensor:
+    """
+    Standard normal noise for every batch index in indices, shape[1:] each.
+    Noise for an index only depends on the seed and the index itself, so it
+    doesn't change with the batch size and no samples are thrown away.
+    """
+
+    count = math.prod(shape[1:])
+    blocks = (count + 3) // 4
+    seed = seed & 0xFFFFFFFFFFFFFFFF
+
+    block = torch.arange(blocks, dtype=torch.int64, device=device).unsqueeze(0)
+    index = torch.tensor(indices, dtype=torch.int64, device=device).unsqueeze(1)
+    counter = [
+        (block & MASK).expand(len(indices), -1),
+        (block >> 32).expand(len(indices), -1),
+        (index & MASK).expand(-1, blocks),
+        torch.zeros_like(index).expand(-1, blocks),
+    ]
+    x0, x1, x2, x3 = philox4x32(counter, (seed & MASK, seed >> 32))
+
+    # Box-Muller, two normals out of each pair of words.
+    normals = []
+    for a, b in ((x0, x1), (x2, x3)):
+        radius = torch.sqrt(-2.0 * torch.log(uniform(a)))
+        theta = (2.0 * math.pi) * uniform(b)
+        normals.append(radius * torch.cos(theta))
+        normals.append(radius * torch.sin(theta))
+
+    noise = torch.stack(normals, dim=-1).reshape(len(indices), blocks * 4)[:, :count]
+    return noise.reshape([len(indices)] + list(shape[1:])).to(dtype)
+
+def prepare_noise(latent_image, seed: int, noise_inds=None, mode: str = NOISE_MODE_CPU, device=None) -> torch.Tensor:
+    """
+    Same as comfy.sample.prepare_noise in the cpu mode, bit for bit.
+    The philox mode generates noise directly on device instead.
+    """
+
+    if mode == NOISE_MODE_CPU:
+        return comfy.sample.prepare_noise(latent_image, seed, noise_inds)
+    elif mode != NOISE_MODE_PHILOX:
+        raise ValueError(f"Unsupported noise mode: {mode}.")
+
+    if noise_inds is None:
+        indices = list(range(latent_image.shape[0]))
+    else:
+        indices = [int(i) for i in noise_inds]
+
+    if device is None:
+        device = latent_image.device
+    return randn(latent_image.shape, seed, indices, dtype=latent_image.dtype, device=device)
@@ -0,0 +1,172 @@
+import threading
+from typing import TypedDict
+
+import torch
+import comfy.model_patcher
+
+# Polynomials mapping the relative change of each model's modulated input to
+# the relative change of its output, fitted by TeaCache. Highest power first.
+RESCALE_COEFFICIENTS = {
+    "flux": [4.98651651e+02, -2.83781631e+02, 5.58554382e+01, -3.82021401e+00, 2.64230861e-01],
+    "hunyuan_video": [7.33226126e+02, -4.01131952e+02, 6.75869174e+01, -3.14987800e+00, 9.61237896e-02],
+    "ltxv": [2.14700694e+01, -1.28016453e+01, 2.31279151e+00, 7.92487521e-01, 9.69274326e-03],
+    "wan_t2v_1.3b": [-5.21862437e+04, 9.23041404e+03, -5.28275948e+02, 1.36987616e+01, -4.99875664e-02],
+    "wan_t2v_14b": [-3.03318725e+05, 4.90537029e+04, -2.65530556e+03, 5.87365115e+01, -3.15583525e-01],
+    "wan_i2v": [2.57151496e+05, -3.54229917e+04, 1.40286849e+03, -1.35890334e+01, 1.32517977e-01],
+}
+
+# Accumulated change below which steps are skipped, when not set explicitly.
+DEFAULT_THRESHOLDS = {
+    "flux": 0.4,
+    "hunyuan_video": 0.15,
+    "ltxv": 0.05,
+    "wan_t2v_1.3b": 0.05,
+    "wan_t2v_14b": 0.14,
+    "wan_i2v": 0.13,
+}
+
+class StepCacheStats(TypedDict):
+    model: str | None
+    calls: int
+    skipped: int
+
+class Slot:
+    def __init__(self):
+        self.previous = None
+        self.accumulated = 0.0
+        self.residual = None
+        self.input = None
+
+def rescale(model: str, distance: float) -> float:
+    result = 0.0
+    for coefficient in RESCALE_COEFFICIENTS[model]:
+        result = result * distance + coefficient
+    return result
+
+def is_last_step(transformer_options: dict) -> bool:
+    sigmas = transformer_options.get("sigmas")
+    sample_sigmas = transformer_options.get("sample_sigmas")
+    if not isinstance(sigmas, torch.Tensor) or not isinstance(sample_sigmas, torch.Tensor):
+        return False
+
+    remaining = sample_sigmas[sample_sigmas > 0]
+    return len(remaining) > 0 and sigmas.max().item() <= remaining.min().item()
+
+class StepCache:
+    """
+    Skips the transformer blocks of a DiT model on steps where its input
+    barely changed, reusing the residual (output minus input of the blocks)
+    of the last step that ran them. The change is estimated from the
+    modulated input of the first block, rescaled per model and accumulated
+    over skipped steps, the blocks run again once it reaches the threshold.
+
+    Models call check before their blocks and store after them. Each cond/
+    uncond layout is tracked on its own, the first and last step always run.
+    A cache is used by one sampling run at a time.
+    """
+
+    def __init__(self, threshold: float | None = None):
+        self.threshold = threshold
+        self.slots: dict[tuple, Slot] = {}
+        self.current: Slot | None = None
+        self.model = None
+        self.calls = 0
+        self.skipped = 0
+        self.busy = False
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.slots = {}
+            self.current = None
+            self.model = None
+            self.calls = 0
+            self.skipped = 0
+
+    def acquire(self):
+        """
+        Starts a sampling run with an empty cache. Runs sharing a cache would
+        reset it and store residuals into each other's slots, so a cache that
+        is still in use is refused.
+        """
+
+        with self.lock:
+            if self.busy:
+                raise Exception("Step cache is already used by another sampling run.")
+            self.busy = True
+
+        self.reset()
+
+    def release(self):
+        """
+        Drops the tensors kept between steps once a run is over, the stats
+        of the run stay available.
+        """
+
+        with self.lock:
+            self.slots = {}
+            self.current = None
+            self.busy = False
+
+    def check(self, model: str, modulated: torch.Tensor, x: torch.Tensor, transformer_options: dict) -> torch.Tensor | None:
+        """
+        Returns the output of the blocks for x if they can be skipped,
+        otherwise None and the blocks have to run.
+        """
+
+        key = (tuple(transformer_options.get("cond_or_uncond", [])), tuple(x.shape))
+        threshold = self.threshold if self.threshold is not None else DEFAULT_THRESHOLDS[model]
+
+        with self.lock:
+            self.model = model
+            self.calls += 1
+            slot = self.slots.setdefault(key, Slot())
+
+            skip = False
+            if slot.previous is not None and slot.residual is not None and slot.previous.shape == modulated.shape:
+                distance = ((modulated - slot.previous).abs().mean() / slot.previous.abs().mean()).item()
+                slot.accumulated += rescale(model, distance)
+                skip = slot.accumulated < threshold and not is_last_step(transformer_options)
+            slot.previous = modulated
+
+            if skip:
+                self.skipped += 1
+                self.current = None
+                return x + slot.residual
+
+            slot.accumulated = 0.0
+            # Some models update x in place.
+            slot.input = x.clone()
+            self.current = slot
+            return None
+
+    def store(self, x: torch.Tensor):
+        """
+        Keeps the residual of the blocks that ran after the last check.
+        """
+
+        with self.lock:
+            slot = self.current
+            self.current = None
+            if slot is None or slot.input is None:
+                return
+
+            slot.residual = x - slot.input
+            slot.input = None
+
+    def stats(self) -> StepCacheStats:
+        with self.lock:
+            return {
+                "model": self.model,
+                "calls": self.calls,
+                "skipped": self.skipped,
+            }
+
+def apply(model_options: dict, step_cache: StepCache) -> dict:
+    """
+    Copy of model_options with the step cache enabled.
+    """
+
+    model_options = comfy.model_patcher.create_model_options_clone(model_options)
+    model_options.setdefault("transformer_options", {})["step_cache"] = step_cache
+    return model_options
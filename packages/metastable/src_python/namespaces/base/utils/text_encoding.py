@@ -0,0 +1,126 @@
+import numbers
+import torch
+import comfy.sd1_clip
+import comfy.model_management
+
+# Sections (77 tokens for CLIP, a whole prompt for T5) per forward.
+MAX_BATCH_SECTIONS = 32
+
+class Recorded(Exception):
+    pass
+
+def sections_key(to_encode) -> tuple | None:
+    """
+    Hashable key of the token sections passed to an encoder, None if they
+    contain embeddings or have different lengths and can't be batched.
+    """
+
+    if len(to_encode) == 0 or any(len(section) != len(to_encode[0]) for section in to_encode):
+        return None
+    if not all(isinstance(token, numbers.Integral) for section in to_encode for token in section):
+        return None
+    return tuple(tuple(section) for section in to_encode)
+
+def clone_output(output):
+    if isinstance(output, torch.Tensor):
+        return output.clone()
+    elif isinstance(output, tuple):
+        return tuple(clone_output(value) for value in output)
+    elif isinstance(output, dict):
+        return { key: clone_output(value) for key, value in output.items() }
+    return output
+
+def slice_output(output, start: int, end: int, rows: int):
+    if isinstance(output, torch.Tensor):
+        return output[start:end] if output.ndim > 0 and output.shape[0] == rows else output
+    elif isinstance(output, tuple):
+        return tuple(slice_output(value, start, end, rows) for value in output)
+    elif isinstance(output, dict):
+        return { key: slice_output(value, start, end, rows) for key, value in output.items() }
+    return output
+
+def run_batched(encoder, requests: list[tuple[tuple, list]], memo: dict, index: int, max_batch: int):
+    # Only sections of the same length can be stacked without padding.
+    by_length = {}
+    for key, to_encode in requests:
+        by_length.setdefault(len(to_encode[0]), []).append((key, to_encode))
+
+    for group in by_length.values():
+        batch = []
+        batch_rows = 0
+        for i, (key, to_encode) in enumerate(group):
+            batch.append((key, to_encode))
+            batch_rows += len(to_encode)
+            if batch_rows < max_batch and i < len(group) - 1:
+                continue
+
+            comfy.model_management.throw_exception_if_processing_interrupted()
+            rows = [section for _, sections in batch for section in sections]
+            output = type(encoder).encode(encoder, rows)
+            start = 0
+            for key, sections in batch:
+                memo[(index, key)] = slice_output(output, start, start + len(sections), len(rows))
+                start += len(sections)
+
+            batch = []
+            batch_rows = 0
+
+def encode_from_tokens_batch(text_encoder, tokens_list: list, max_batch: int = MAX_BATCH_SECTIONS) -> list[tuple]:
+    """
+    Same as text_encoder.encode_from_tokens(tokens, return_pooled=True) for
+    every item of tokens_list, with the encoder forwards batched.
+
+    Text encoders combine their sub-encoders in model specific ways, so the
+    combining code runs once per prompt. Sub-encoder calls are recorded
+    instead of run: each pass stops every prompt at its first call that has
+    no result yet, then runs all recorded calls of each sub-encoder batched.
+    Passes repeat until every prompt is done, one per sub-encoder at most.
+    """
+
+    model = text_encoder.cond_stage_model
+    model.reset_clip_options()
+    if text_encoder.layer_idx is not None:
+        model.set_clip_options({"layer": text_encoder.layer_idx})
+    text_encoder.load_model()
+
+    encoders = [module for module in model.modules() if isinstance(module, comfy.sd1_clip.ClipTokenWeightEncoder)]
+    memo = {}
+    recorded = {}
+
+    def intercept(index, encoder):
+        def encode(to_encode):
+            key = sections_key(to_encode)
+            if key is None:
+                return type(encoder).encode(encoder, to_encode)
+
+            if (index, key) in memo:
+                # Token weights are applied to the output in place.
+                return clone_output(memo[(index, key)])
+
+            recorded.setdefault(index, {})[key] = to_encode
+            raise Recorded()
+        return encode
+
+    results = [None] * len(tokens_list)
+    remaining = list(range(len(tokens_list)))
+    try:
+        for index, encoder in enumerate(encoders):
+            encoder.encode = intercept(index, encoder)
+
+        while len(remaining) > 0:
+            comfy.model_management.throw_exception_if_processing_interrupted()
+            recorded.clear()
+            for i in remaining:
+                try:
+                    results[i] = model.encode_token_weights(tokens_list[i])
+                except Recorded:
+                    pass
+
+            for index, requests in recorded.items():
+                run_batched(encoders[index], list(requests.items()), memo, index, max_batch)
+            remaining = [i for i in remaining if results[i] is None]
+    finally:
+        for encoder in encoders:
+            encoder.__dict__.pop("encode", None)
+
+    return [(result[0], result[1]) for result in results]
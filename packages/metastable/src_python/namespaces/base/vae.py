@@ -1,11 +1,12 @@
 import torch
 import math
+from typing import Iterator
 
 import comfy.sd
 import comfy.utils
 import rpc_types
 
-from rpc import RPC
+from rpc import RPC, RPCContext, is_streamed
 from model_cache import cache
 
 def vae_decode_circular(vae, samples):
@@ -79,23 +80,31 @@ def load_vae(path: str):
     
     return cache().load_cached(info, load)
 
+cache().register_loader("vae", lambda info: load_vae(info["path"]))
+
 class VAENamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.VAE:
         return load_vae(path)
     
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
-    def decode(vae: rpc_types.VAE, samples: rpc_types.LatentTensor, is_circular: bool = False) -> list[rpc_types.ImageTensor]:
-        images = vae.decode(samples) if not is_circular else vae_decode_circular(vae, samples)
-        
-        if len(images.shape) == 5: #Combine batches
-            images = images.reshape(-1, images.shape[-3], images.shape[-2], images.shape[-1])
-        
-        # So we can iterate over this.
-        return [value for value in images]
-
+    def decode(_ctx: RPCContext, vae: rpc_types.VAE, samples: rpc_types.LatentTensor, is_circular: bool = False) -> Iterator[rpc_types.ImageTensor]:
+        # Decode one batch item at a time when streamed, so images are sent as they're ready.
+        batch_size = 1 if is_streamed(_ctx) else max(samples.shape[0], 1)
+        for i in range(0, samples.shape[0], batch_size):
+            sample = samples[i:i + batch_size]
+            images = vae.decode(sample) if not is_circular else vae_decode_circular(vae, sample)
+            
+            if len(images.shape) == 5: #Combine batches
+                images = images.reshape(-1, images.shape[-3], images.shape[-2], images.shape[-1])
+            
+            yield from images
+
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def encode(vae: rpc_types.VAE, image: rpc_types.ImageTensor, mask: rpc_types.ImageTensor = None) -> rpc_types.Latent:
@@ -108,9 +117,10 @@ class VAENamespace:
 
         return vae_encode(vae, image)
     
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
-    def decode_tiled(vae: rpc_types.VAE, samples: rpc_types.LatentTensor, tile_size: int, overlap: int, temporal_size: int, temporal_overlap: int) -> list[rpc_types.ImageTensor]:
+    def decode_tiled(_ctx: RPCContext, vae: rpc_types.VAE, samples: rpc_types.LatentTensor, tile_size: int, overlap: int, temporal_size: int, temporal_overlap: int) -> Iterator[rpc_types.ImageTensor]:
         if tile_size < overlap * 4:
             overlap = tile_size // 4
         if temporal_size < temporal_overlap * 2:
@@ -124,7 +134,9 @@ class VAENamespace:
             temporal_overlap = None
 
         compression = vae.spacial_compression_decode()
-        images = vae.decode_tiled(samples, tile_x=tile_size // compression, tile_y=tile_size // compression, overlap=overlap // compression, tile_t=temporal_size, overlap_t=temporal_overlap)
-        if len(images.shape) == 5: #Combine batches
-            images = images.reshape(-1, images.shape[-3], images.shape[-2], images.shape[-1])
-        return [value for value in images]
\ No newline at end of file
+        batch_size = 1 if is_streamed(_ctx) else max(samples.shape[0], 1)
+        for i in range(0, samples.shape[0], batch_size):
+            images = vae.decode_tiled(samples[i:i + batch_size], tile_x=tile_size // compression, tile_y=tile_size // compression, overlap=overlap // compression, tile_t=temporal_size, overlap_t=temporal_overlap)
+            if len(images.shape) == 5: #Combine batches
+                images = images.reshape(-1, images.shape[-3], images.shape[-2], images.shape[-1])
+            yield from images
\ No newline at end of file
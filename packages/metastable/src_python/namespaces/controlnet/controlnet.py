@@ -14,12 +14,16 @@ def load_controlnet(path: str):
     
     return cache().load_cached(info, load)
 
+cache().register_loader("controlnet", lambda info: load_controlnet(info["path"]))
+
 class ControlnetNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.ControlNet:
         return load_controlnet(path)
     
+    @RPC.lane("trivial")
     @RPC.autoref
     @RPC.method
     def apply(controlnet: rpc_types.ControlNet, positive: rpc_types.Conditioning, negative: rpc_types.Conditioning, image: rpc_types.ImageTensor, strength: float) -> rpc_types.ConditioningPair:
@@ -4,11 +4,13 @@ from rpc import RPC
 import rpc_types
 
 class IPAdapterNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.IpAdapter:
         return load(path)
 
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def apply(diffusion_model: rpc_types.DiffusionModel, ipadapter: rpc_types.IpAdapter, clip_vision: rpc_types.ClipVisionModel, image: rpc_types.ImageTensor, strength: float) -> rpc_types.DiffusionModel:
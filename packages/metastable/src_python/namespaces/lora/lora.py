@@ -6,6 +6,8 @@ import comfy.utils
 from rpc import RPC
 import rpc_types
 from model_cache import cache
+import conditioning_cache
+import state_cache
 
 def load_lora(path: str):
     info = {
@@ -17,21 +19,30 @@ def load_lora(path: str):
     
     return cache().load_cached(info, load)
 
+cache().register_loader("lora", lambda info: load_lora(info["path"]))
+
 class LoraApplyResult(TypedDict):
     diffusion_model: rpc_types.DiffusionModel
     text_encoder: rpc_types.TextEncoder
 
 class LORANamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.LORA:
         return load_lora(path)
 
+    @RPC.lane("trivial")
     @RPC.autoref
     @RPC.method
     def apply(diffusion_model: rpc_types.DiffusionModel, text_encoder: rpc_types.TextEncoder, lora: rpc_types.LORA, strength: float) -> LoraApplyResult:
-        (diffusion_model, text_encoder) = comfy.sd.load_lora_for_models(diffusion_model, text_encoder, lora, strength, strength)
+        (new_diffusion_model, new_text_encoder) = comfy.sd.load_lora_for_models(diffusion_model, text_encoder, lora, strength, strength)
+
+        path = cache().find_path(lora)
+        if new_text_encoder is not None and path is not None:
+            conditioning_cache.cache().register_patch(text_encoder, new_text_encoder, f"lora:{state_cache.file_key(path)}:{strength}")
+
         return {
-            "diffusion_model": diffusion_model,
-            "text_encoder": text_encoder
+            "diffusion_model": new_diffusion_model,
+            "text_encoder": new_text_encoder
         }
\ No newline at end of file
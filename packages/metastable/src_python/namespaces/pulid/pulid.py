@@ -184,6 +184,7 @@ def to_gray(img):
     return x
 
 class PulidNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.PULID:
@@ -201,6 +202,7 @@ class PulidNamespace:
         # Also initialize the model, takes longer to load but then it doesn't have to be done every time you change parameters in the apply node
         return PulidModel(model)
 
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load_insightface(root: str) -> rpc_types.FaceAnalysis:
@@ -210,6 +212,7 @@ class PulidNamespace:
         model.prepare(ctx_id=0, det_size=(640, 640))
         return model
 
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load_eva_clip() -> rpc_types.EvaClip:
@@ -227,6 +230,7 @@ class PulidNamespace:
             model["image_std"] = (eva_transform_std,) * 3
         return model
     
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def apply(diffusion_model: rpc_types.DiffusionModel, pulid: rpc_types.PULID, eva_clip: rpc_types.EvaClip, face_analysis: rpc_types.FaceAnalysis, image: rpc_types.ImageTensor, projection: str = "ortho_v2", strength: float = 1.0, fidelity: int = 8, noise: float = 0.0, start_at: float = 0.0, end_at: float = 1.0, attn_mask=None) -> rpc_types.DiffusionModel:
@@ -11,6 +11,7 @@ import rpc_types
 script_directory = os.path.dirname(os.path.abspath(__file__))
 
 class SegmentNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.SegmentModel:
@@ -38,6 +39,7 @@ class SegmentNamespace:
 
         return load_model(path, model_cfg_path, "automaskgenerator", torch.float32, "cpu")
 
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def segment(model: rpc_types.SegmentModel, image: rpc_types.ImageTensor) -> rpc_types.ImageTensor:
@@ -1,5 +1,6 @@
 import numpy as np
 import csv
+from typing import Generator
 import torch
 from PIL import Image
 import onnx
@@ -49,9 +50,10 @@ class ImageLoadingPrepDataset(torch.utils.data.Dataset):
             return None
 
 class TaggerNamespace:
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
-    def tag(_ctx: RPCContext, model_path, images, general_threshold, character_threshold, remove_underscore=True, undesired_tags=[], caption_separator=", ", csv_path=None) -> dict[str, str]:
+    def tag(_ctx: RPCContext, model_path, images, general_threshold, character_threshold, remove_underscore=True, undesired_tags=[], caption_separator=", ", csv_path=None) -> Generator[dict[str, str], None, dict[str, str]]:
         csv_path = csv_path if csv_path is not None else model_path + '.csv'
 
         batch_size = 1
@@ -87,7 +89,7 @@ class TaggerNamespace:
         result = {}
 
         def run_batch(path_imgs):
-            nonlocal result
+            batch_result = {}
 
             imgs = np.array([im for _, im in path_imgs])
 
@@ -129,13 +131,18 @@ class TaggerNamespace:
                 if len(character_tag_text) > 0:
                     character_tag_text = character_tag_text[len(caption_separator) :]
 
-                result[image_path] = caption_separator.join(combined_tags)
+                batch_result[image_path] = caption_separator.join(combined_tags)
+
+            result.update(batch_result)
+            return batch_result
         
         b_imgs = []
         progress = 0
         
         _ctx.progress(0, len(image_paths))
         for image_path in image_paths:
+            _ctx.throw_if_cancelled()
+            batch_result = None
             try:
                 image = Image.open(image_path)
                 if image.mode != "RGB":
@@ -146,17 +153,21 @@ class TaggerNamespace:
 
                 if len(b_imgs) >= batch_size:
                     b_imgs = [(str(image_path), image) for image_path, image in b_imgs]  # Convert image_path to string
-                    run_batch(b_imgs)
+                    batch_result = run_batch(b_imgs)
                     progress += len(b_imgs)
                     _ctx.progress(progress, len(image_paths))
                     b_imgs.clear()
             except:
                 continue
 
+            if batch_result is not None:
+                yield batch_result
+
         if len(b_imgs) > 0:
             b_imgs = [(str(image_path), image) for image_path, image in b_imgs]  # Convert image_path to string
-            run_batch(b_imgs)
+            batch_result = run_batch(b_imgs)
             progress += len(b_imgs)
             _ctx.progress(progress, len(image_paths))
+            yield batch_result
 
         return result
\ No newline at end of file
@@ -2,6 +2,7 @@ from rpc import RPC
 import rpc_types
 
 class TrainingNamespace:
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def get_optimizer(diffusion_model: rpc_types.DiffusionModel, text_encoder: rpc_types.TextEncoder) -> rpc_types.Optimizer:
@@ -39,6 +40,7 @@ class TrainingNamespace:
             slice_p=1,
         )
 
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
     def train(optimizer: rpc_types.Optimizer, diffusion_model: rpc_types.DiffusionModel, text_encoder: rpc_types.TextEncoder, inputs: list[rpc_types.TrainingInput]) -> None:
@@ -1,13 +1,15 @@
 import torch
+from typing import Iterator
 
 import comfy.utils
 import comfy.model_management
 from spandrel import ModelLoader, ImageModelDescriptor
 
-from rpc import RPC
+from rpc import RPC, RPCContext, is_streamed
 import rpc_types
 
 class UpscaleModelNamespace:
+    @RPC.lane("cpu")
     @RPC.autoref
     @RPC.method
     def load(path: str) -> rpc_types.UpscaleModel:
@@ -21,30 +23,34 @@ class UpscaleModelNamespace:
         
         return out
 
+    @RPC.lane("gpu")
     @RPC.autoref
     @RPC.method
-    def apply(upscale_model: rpc_types.UpscaleModel, images: list[rpc_types.ImageTensor]) -> list[rpc_types.ImageTensor]:
+    def apply(_ctx: RPCContext, upscale_model: rpc_types.UpscaleModel, images: list[rpc_types.ImageTensor]) -> Iterator[rpc_types.ImageTensor]:
         device = comfy.model_management.get_torch_device()
         upscale_model.to(device)
-        images = torch.stack(images)
-
-        in_img = images.movedim(-1,-3).to(device)
 
         tile = 512
         overlap = 32
 
-        oom = True
-        while oom:
-            try:
-                steps = in_img.shape[0] * comfy.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
-                pbar = comfy.utils.ProgressBar(steps)
-                s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
-                oom = False
-            except comfy.model_management.OOM_EXCEPTION as e:
-                tile //= 2
-                if tile < 128:
-                    raise e
-
-        upscale_model.to("cpu")
-        s = torch.clamp(s.movedim(-3,-1), min=0, max=1.0)
-        return [value for value in s]
\ No newline at end of file
+        try:
+            # Upscale one image at a time when streamed, so results are sent as they're ready.
+            batch_size = 1 if is_streamed(_ctx) else max(len(images), 1)
+            for i in range(0, len(images), batch_size):
+                in_img = torch.stack(images[i:i + batch_size]).movedim(-1,-3).to(device)
+
+                oom = True
+                while oom:
+                    try:
+                        steps = in_img.shape[0] * comfy.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
+                        pbar = comfy.utils.ProgressBar(steps)
+                        s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                        oom = False
+                    except comfy.model_management.OOM_EXCEPTION as e:
+                        tile //= 2
+                        if tile < 128:
+                            raise e
+
+                yield from torch.clamp(s.movedim(-3,-1), min=0, max=1.0)
+        finally:
+            upscale_model.to("cpu")
\ No newline at end of file
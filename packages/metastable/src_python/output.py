@@ -1,20 +1,22 @@
-import json
 import os
+import threading
+import frame
 
 out = None
+lock = threading.Lock()
 
 def configure(fd):
     global out
     out = os.fdopen(fd, 'bw')
 
-def write(data):
+def write_frame(header: bytes, buffers=[]):
     global out
-    out.write(data.encode('utf-8'))
-    out.write(b'\x1e')
-    out.flush()
+    with lock:
+        frame.write(out, header, buffers)
+        out.flush()
 
 def write_json(data=None):
-    write(json.dumps(data))
+    write_frame(*frame.encode(data))
 
 def write_event(event_name, data=None):
-    write_json({ "type": "event", "event": event_name, "data": data })
\ No newline at end of file
+    write_json({ "type": "event", "event": event_name, "data": data })
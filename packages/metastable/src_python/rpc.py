@@ -3,10 +3,15 @@ import base64
 import torch
 import inspect
 import output
+import threading
+import time
 import traceback
+from typing import NotRequired, TypedDict
 from uuid import uuid4
 
 import rpc_hook
+from shm import SharedMemoryStore
+from model_cache import model_size
 import comfy.model_management
 
 PRIMITIVES = (bool, str, int, float, type(None))
@@ -14,14 +19,37 @@ PRIMITIVES = (bool, str, int, float, type(None))
 def is_key(obj, key, type):
     return key in obj and isinstance(obj[key], type)
 
+def resolve_results(obj, results: list):
+    """
+    Replaces { "$result": index, "path": [...] } with the result of an earlier
+    call in the same batch.
+    """
+    if isinstance(obj, dict):
+        if is_key(obj, "$result", int):
+            value = results[obj["$result"]]
+            for key in obj.get("path", []):
+                value = value[key]
+            return value
+
+        return { key: resolve_results(value, results) for key, value in obj.items() }
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+        return [resolve_results(value, results) for value in obj]
+    else:
+        return obj
+
 class RPCContext:
     request_id: str
     session_id: str | None
     
-    def __init__(self, request_id, session_id, rpc):
+    def __init__(self, request_id, session_id, rpc, token: rpc_hook.CancellationToken = None, stream: bool = False):
         self.request_id = request_id
         self.session_id = session_id
         self.rpc = rpc
+        self.token = token if token is not None else rpc_hook.CancellationToken(session_id)
+        self.stream = stream
+
+    def throw_if_cancelled(self):
+        self.token.throw_if_cancelled()
 
     def progress(self, value, total):
         output.write_event("rpc.progress", {
@@ -31,56 +59,192 @@ class RPCContext:
             "max": total
         })
 
+    def chunk(self, index, result):
+        output.write_json({
+            "type": "rpc.chunk",
+            "id": self.request_id,
+            "index": index,
+            "result": result
+        })
+
+def is_streamed(ctx: RPCContext | None) -> bool:
+    """
+    Whether the items of a generator-returning method are sent as they're
+    ready. Methods can work in larger batches when they aren't.
+    """
+    return ctx is not None and ctx.stream
+
+def reference_size(obj) -> tuple[int, str | None]:
+    if isinstance(obj, torch.Tensor):
+        return obj.nelement() * obj.element_size(), str(obj.device)
+
+    try:
+        size = model_size(obj)
+    except Exception:
+        size = 0
+
+    device = None
+    patcher = getattr(obj, "patcher", obj)
+    if hasattr(patcher, "current_loaded_device"):
+        device = str(patcher.current_loaded_device())
+
+    return size, device
+
+class RPCReference:
+    def __init__(self, obj):
+        self.obj = obj
+        self.count = 1
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+class ReferenceStats(TypedDict):
+    ref: int
+    type: str
+    size: int
+    device: NotRequired[str]
+    count: int
+    idle: float
+
+class SessionStats(TypedDict):
+    references: list[ReferenceStats]
+    size: int
+
 class RPCSession:
-    def __init__(self):
-        self.references = {}
+    def __init__(self, ttl: float | None = None):
+        self.references: dict[int, RPCReference] = {}
+        self.keys: dict[int, int] = {}
         self.current = 0
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.shared = SharedMemoryStore()
+
+    def alloc(self, obj, shared: bool = False):
+        if shared and isinstance(obj, (BytesIO, torch.Tensor)):
+            return self.shared.put(obj)
 
-    def alloc(self, obj):
         if isinstance(obj, BytesIO):
-            return { "$bytes": base64.b64encode(obj.getvalue()).decode() }
-        
-        key = self.current
-        self.references[key] = obj
-        self.current += 1
-        return { "$ref": key }
+            # Binary values are sent as raw buffers alongside the frame header.
+            return obj
+
+        with self.lock:
+            # The same object returned again (e.g. a cached model) shares its reference.
+            key = self.keys.get(id(obj))
+            if key is not None:
+                reference = self.references[key]
+                reference.count += 1
+                reference.touch()
+                return { "$ref": key }
+
+            key = self.current
+            self.references[key] = RPCReference(obj)
+            self.keys[id(obj)] = key
+            self.current += 1
+            return { "$ref": key }
+
+    def get(self, key: int):
+        with self.lock:
+            if key not in self.references:
+                raise Exception(f"Reference {key} not found")
+
+            reference = self.references[key]
+            reference.touch()
+            return reference.obj
+
+    def release(self, key: int, force: bool = False) -> bool:
+        with self.lock:
+            reference = self.references.get(key)
+            if reference is None:
+                return False
 
-    def autoalloc(self, obj):
+            reference.count -= 1
+            if reference.count > 0 and not force:
+                return False
+
+            del self.references[key]
+            self.keys.pop(id(reference.obj), None)
+            return True
+
+    def collect(self) -> int:
+        """
+        Drops references that haven't been used for longer than the session TTL.
+        """
+        if self.ttl is None:
+            return 0
+
+        now = time.monotonic()
+        with self.lock:
+            expired = [key for key, reference in self.references.items() if now - reference.last_used > self.ttl]
+            for key in expired:
+                self.release(key, force=True)
+
+        return len(expired)
+
+    def stats(self) -> SessionStats:
+        now = time.monotonic()
+        with self.lock:
+            references = list(self.references.items())
+
+        items = []
+        for key, reference in references:
+            size, device = reference_size(reference.obj)
+            item = {
+                "ref": key,
+                "type": type(reference.obj).__name__,
+                "size": size,
+                "count": reference.count,
+                "idle": now - reference.last_used,
+            }
+            if device is not None:
+                item["device"] = device
+            items.append(item)
+
+        return {
+            "references": items,
+            "size": sum(item["size"] for item in items),
+        }
+
+    def autoalloc(self, obj, shared: bool = False):
         if isinstance(obj, PRIMITIVES):
             return obj
         elif isinstance(obj, dict):
-            return { key: self.autoalloc(value) for key, value in obj.items() }
+            return { key: self.autoalloc(value, shared) for key, value in obj.items() }
         elif isinstance(obj, list) or isinstance(obj, tuple):
-            return [self.autoalloc(value) for value in obj]
+            return [self.autoalloc(value, shared) for value in obj]
         else:
-            return self.alloc(obj)
+            return self.alloc(obj, shared)
     
     def autoexpand(self, obj):
-        if isinstance(obj, PRIMITIVES):
+        if isinstance(obj, PRIMITIVES) or isinstance(obj, BytesIO):
             return obj
         elif isinstance(obj, dict):
             if is_key(obj, "$ref", int):
-                return self.references[obj["$ref"]]
+                return self.get(obj["$ref"])
             elif is_key(obj, "$bytes", str):
                 return BytesIO(base64.b64decode(obj["$bytes"]))
+            elif is_key(obj, "$shm", str):
+                return self.shared.get(obj)
             
             return { key: self.autoexpand(value) for key, value in obj.items() }
         elif isinstance(obj, list) or isinstance(obj, tuple):
             return [self.autoexpand(value) for value in obj]
         else:
-            return self.autoexpand(obj)
+            return obj
 
 class RPCMethod:
     func: callable
     is_autoref: bool
+    lane: str | None
     args: inspect.FullArgSpec
     
     def __init__(self, func):
         self.func = func
         self.is_autoref = getattr(func, "_rpc_autoref", False)
+        self.lane = getattr(func, "_rpc_lane", None)
         self.args = inspect.getfullargspec(func)
 
-    def invoke(self, params: dict, context: RPCContext = None, session: RPCSession = None):
+    def invoke(self, params: dict, context: RPCContext = None, session: RPCSession = None, shared: bool = False):
         if self.is_autoref:
             if session is None:
                 raise Exception("Method requires a session to be open")
@@ -95,8 +259,44 @@ class RPCMethod:
             
             result = self.func(**params)
 
+            if inspect.isgenerator(result):
+                return self.drain(result, context, session, shared)
+
         if self.is_autoref:
-            result = session.autoalloc(result)
+            result = session.autoalloc(result, shared)
+
+        return result
+
+    def drain(self, generator, context: RPCContext = None, session: RPCSession = None, shared: bool = False):
+        """
+        Consumes a generator-returning method, sending each item as an rpc.chunk
+        message when streaming was requested. The result is the generator's
+        return value or, if it returns nothing, the list of all items.
+        """
+        items = []
+        index = 0
+
+        while True:
+            try:
+                item = next(generator)
+            except StopIteration as e:
+                result = e.value
+                break
+
+            if self.is_autoref:
+                item = session.autoalloc(item, shared)
+
+            if context is not None and context.stream:
+                context.chunk(index, item)
+
+            items.append(item)
+            index += 1
+
+        if result is None:
+            return items
+
+        if self.is_autoref:
+            result = session.autoalloc(result, shared)
 
         return result
 
@@ -120,9 +320,27 @@ class RPCNamespace:
         
         return self.methods[method_name]
 
+class RPCLazyMethod:
+    lane: str | None
+
+    def __init__(self, lane: str | None):
+        self.lane = lane
+
+class RPCLazyNamespace:
+    """
+    Namespace whose module is imported on the first call, until then only the
+    method lanes from its manifest are known.
+    """
+
+    methods: dict[str, RPCLazyMethod]
+
+    def __init__(self, methods: dict[str, str | None], load: callable):
+        self.methods = { name: RPCLazyMethod(lane) for name, lane in methods.items() }
+        self.load = load
+
 class RPC:
     sessions: dict[str, RPCSession]
-    namespaces: dict[str, RPCNamespace]
+    namespaces: dict[str, RPCNamespace | RPCLazyNamespace]
 
     def method(name_or_function = None):
         def decorator(func):
@@ -142,52 +360,152 @@ class RPC:
         func._rpc_autoref = True
         return func
 
+    def lane(name: str):
+        """
+        Scheduler lane for the method: "gpu" (exclusive GPU work),
+        "sampling" (GPU work batched across requests), "cpu" (disk and
+        CPU-bound work) or "trivial" (cheap bookkeeping).
+        """
+        def decorator(func):
+            func._rpc_lane = name
+            return func
+
+        return decorator
+
     def __init__(self):
         self.sessions = {}
         self.namespaces = {}
+        self.tokens = {}
+        self.tokens_lock = threading.Lock()
 
         self.add_namespace("session", SessionNamespace)
+        self.add_namespace("rpc", RequestNamespace)
 
     def add_namespace(self, name, obj):
         self.namespaces[name] = RPCNamespace(obj)
 
-    def handle(self, request):
-        if (not isinstance(request, dict) or "id" not in request
-            or "type" not in request or request["type"] != "rpc"
-            or "method" not in request):
-            raise Exception("Invalid request")
+    def add_lazy_namespace(self, name, methods: dict[str, str | None], load: callable):
+        self.namespaces[name] = RPCLazyNamespace(methods, load)
 
-        request_id = request["id"]
-        try:
-            method = request["method"]
-            session_id = request["session"] if "session" in request else None
-            session = None
+    def get_namespace(self, name: str) -> RPCNamespace:
+        namespace = self.namespaces[name]
+        if isinstance(namespace, RPCLazyNamespace):
+            # Replaces itself with the real namespace.
+            namespace.load(self)
+            namespace = self.namespaces[name]
+            if isinstance(namespace, RPCLazyNamespace):
+                raise Exception("Namespace not found")
+        return namespace
+
+    def track(self, request) -> rpc_hook.CancellationToken:
+        """
+        Registers a cancellation token for a request, so it can be cancelled
+        while it's still queued.
+        """
+        with self.tokens_lock:
+            request_id = request["id"]
+            if request_id not in self.tokens:
+                self.tokens[request_id] = rpc_hook.CancellationToken(request.get("session"))
+            return self.tokens[request_id]
+
+    def untrack(self, request_id):
+        with self.tokens_lock:
+            self.tokens.pop(request_id, None)
 
+    def cancel(self, request_id=None, session_id=None):
+        with self.tokens_lock:
+            for key, token in self.tokens.items():
+                if key == request_id or (session_id is not None and token.session_id == session_id):
+                    token.cancel()
+
+    def get_method_lane(self, method: str) -> str | None:
+        try:
             method_namespace, method_name = method.split(":")
-            
-            if method_namespace not in self.namespaces:
-                raise Exception("Namespace not found")
+            return self.namespaces[method_namespace].methods[method_name].lane
+        except Exception:
+            return None
+
+    def get_lane(self, request) -> str | None:
+        if request.get("type") == "batch":
+            lanes = [self.get_method_lane(call.get("method", "")) for call in request.get("calls", [])]
+            if "gpu" in lanes:
+                return "gpu"
+            elif "sampling" in lanes:
+                return "sampling"
+            elif all(lane == "trivial" for lane in lanes):
+                return "trivial"
+            return "cpu"
+
+        return self.get_method_lane(request.get("method", ""))
+
+    def call(self, method: str, params: dict, request_id, session_id, token: rpc_hook.CancellationToken, shared: bool = False, stream: bool = False):
+        session = None
+        method_namespace, method_name = method.split(":")
+        
+        if method_namespace not in self.namespaces:
+            raise Exception("Namespace not found")
 
-            if session_id is not None:
-                if session_id in self.sessions:
-                    session = self.sessions[session_id]
-                elif method_namespace != 'session':
-                    raise Exception("Session not found")
-                
-            namespace = self.namespaces[method_namespace]
-            params = {}
+        if session_id is not None:
+            if session_id in self.sessions:
+                session = self.sessions[session_id]
+            elif method_namespace != 'session':
+                raise Exception("Session not found")
+
+        if session is not None:
+            session.collect()
             
-            if "params" in request:
-                params = request["params"]
-
-            with rpc_hook.use(request_id, session_id):
-                ctx = RPCContext(
-                    request_id=request_id,
-                    session_id=session_id,
-                    rpc=self
-                )
-                method = namespace.get_method(method_name)
-                result = method.invoke(params, ctx, session)
+        namespace = self.get_namespace(method_namespace)
+
+        with rpc_hook.use(request_id, session_id, token):
+            ctx = RPCContext(
+                request_id=request_id,
+                session_id=session_id,
+                rpc=self,
+                token=token,
+                stream=stream
+            )
+            method = namespace.get_method(method_name)
+            return method.invoke(params, ctx, session, shared)
+
+    def call_batch(self, calls: list[dict], request_id, session_id, token: rpc_hook.CancellationToken, shared: bool = False):
+        results = []
+
+        for index, call in enumerate(calls):
+            token.throw_if_cancelled()
+            params = resolve_results(call["params"] if "params" in call else {}, results)
+
+            try:
+                results.append(self.call(call["method"], params, request_id, session_id, token, shared))
+            except Exception as e:
+                raise Exception(f"Batch call {index} ({call.get('method')}) failed") from e
+
+        return results
+
+    @staticmethod
+    def is_valid_request(request) -> bool:
+        return (isinstance(request, dict) and "id" in request
+            and "type" in request and request["type"] in ("rpc", "batch")
+            and (request["type"] != "rpc" or is_key(request, "method", str))
+            and (request["type"] != "batch" or (is_key(request, "calls", list) and all(isinstance(call, dict) for call in request["calls"]))))
+
+    def handle(self, request):
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not self.is_valid_request(request):
+                raise Exception("Invalid request")
+
+            token = self.track(request)
+            token.throw_if_cancelled()
+
+            session_id = request["session"] if "session" in request else None
+            shared = request["shm"] if "shm" in request else False
+
+            if request["type"] == "batch":
+                result = self.call_batch(request["calls"], request_id, session_id, token, shared)
+            else:
+                params = request["params"] if "params" in request else {}
+                stream = request["stream"] if "stream" in request else False
+                result = self.call(request["method"], params, request_id, session_id, token, shared, stream)
 
             return {
                 "type": "rpc",
@@ -202,16 +520,47 @@ class RPC:
                     "message": traceback.format_exc(),
                 }
             }
+        finally:
+            self.untrack(request_id)
 
 class SessionNamespace:
+    @RPC.lane("trivial")
     @RPC.method
-    def start(_ctx: RPCContext) -> str:
+    def start(_ctx: RPCContext, ttl: float = None) -> str:
         session_id = str(uuid4())
-        comfy.model_management.interrupt_current_processing(False)
-        _ctx.rpc.sessions[session_id] = RPCSession()
+        _ctx.rpc.sessions[session_id] = RPCSession(ttl)
         return session_id
     
+    @RPC.lane("trivial")
     @RPC.method
     def destroy(_ctx: RPCContext) -> None:
-        comfy.model_management.interrupt_current_processing(True)
-        del _ctx.rpc.sessions[_ctx.session_id]
+        _ctx.rpc.cancel(session_id=_ctx.session_id)
+        session = _ctx.rpc.sessions.pop(_ctx.session_id)
+        session.shared.release_all()
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def release(_ctx: RPCContext, refs: list[int], force: bool = False) -> int:
+        session = _ctx.rpc.sessions[_ctx.session_id]
+        released = sum(1 for ref in refs if session.release(ref, force))
+        if released > 0:
+            comfy.model_management.soft_empty_cache()
+        return released
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def stats(_ctx: RPCContext) -> SessionStats:
+        return _ctx.rpc.sessions[_ctx.session_id].stats()
+
+    @RPC.lane("trivial")
+    @RPC.method
+    def release_shared(_ctx: RPCContext, names: list[str]) -> None:
+        session = _ctx.rpc.sessions[_ctx.session_id]
+        for name in names:
+            session.shared.release(name)
+
+class RequestNamespace:
+    @RPC.lane("trivial")
+    @RPC.method
+    def cancel(_ctx: RPCContext, request_id: str) -> None:
+        _ctx.rpc.cancel(request_id=request_id)
@@ -1,4 +1,5 @@
 import inspect
+from collections.abc import Generator, Iterator
 from io import BytesIO
 from types import UnionType
 from typing import NotRequired, get_origin, get_args, is_typeddict
@@ -10,21 +11,15 @@ import os
 import comfy_patch
 from rpc import RPC
 from inspect import signature
-import importlib.util
+import namespace_loader
 import json
 
 rpc = RPC()
 
-namespaces_dir = os.path.join(os.path.dirname(__file__), 'namespaces')
-namespaces = os.listdir(namespaces_dir)
+namespaces = os.listdir(namespace_loader.NAMESPACES_DIR)
 
 for namespace in namespaces:
-    name = f'namespaces.{namespace}'
-    spec = importlib.util.spec_from_file_location(name, os.path.join(namespaces_dir, namespace, '__init__.py'))
-    mod = importlib.util.module_from_spec(spec)
-    sys.modules[name] = mod
-    spec.loader.exec_module(mod)
-    mod.insert_all(rpc)
+    namespace_loader.register(rpc, namespace, lazy=False)
 
 def annotation_to_js_type(annotation):
     if annotation == int or annotation == float:
@@ -70,6 +65,20 @@ def annotation_to_js_type(annotation):
         if len(args) == 1:
             type_def["items"] = annotation_to_js_type(args[0])
 
+        return type_def
+    elif get_origin(annotation) == Iterator or get_origin(annotation) == Generator:
+        # Generator methods return the generator's return value or a list of the yielded items.
+        args = get_args(annotation)
+        if len(args) == 3 and args[2] is not type(None) and args[2] is not None:
+            return annotation_to_js_type(args[2])
+
+        type_def = {
+            "type": "array",
+        }
+
+        if len(args) > 0:
+            type_def["items"] = annotation_to_js_type(args[0])
+
         return type_def
     elif get_origin(annotation) == tuple:
         args = get_args(annotation)
@@ -1,5 +1,7 @@
 from contextlib import contextmanager
+from contextvars import ContextVar
 import sys
+import threading
 import comfy
 import output
 from io import BytesIO
@@ -7,50 +9,171 @@ import base64
 from PIL import Image
 
 PREVIEW_SIZE = (512, 512)
+PREVIEW_QUALITY = 70
+PREVIEW_FORMATS = ("jpeg", "webp", "raw")
 
-def reset_progress():
-    def hook(value, total, preview_image):
-        comfy.model_management.throw_exception_if_processing_interrupted()
-        output.write_event("comfy.progress", { "value": value, "max": total })
-    comfy.utils.set_progress_bar_global_hook(hook)
+def encode_preview(preview_image, format="jpeg"):
+    preview_image.thumbnail(PREVIEW_SIZE, Image.Resampling.BILINEAR)
+
+    if format == "raw":
+        # Sent as a binary buffer alongside the frame header.
+        image = preview_image.convert("RGB")
+        return { "format": "raw", "width": image.width, "height": image.height, "data": BytesIO(image.tobytes()) }
+
+    buffered = BytesIO()
+    if format == "webp":
+        preview_image.save(buffered, format="webp", quality=PREVIEW_QUALITY, method=0)
+    else:
+        format = "jpeg"
+        preview_image.save(buffered, format="jpeg", quality=PREVIEW_QUALITY)
+    return f"data:image/{format};base64," + base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+class PreviewEncoder:
+    """
+    Encodes previews on a background thread, so the sampler doesn't wait for
+    them. Only the latest pending preview of each request is kept. Previews
+    are sent without a progress value, which is sent right away and would
+    otherwise go backwards when a preview lags behind.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, ctx, preview_image):
+        with self.condition:
+            # Replaces an older preview that wasn't encoded yet.
+            self.pending.pop(ctx.request_id, None)
+            self.pending[ctx.request_id] = (ctx, preview_image)
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="preview-encoder", daemon=True)
+                self.thread.start()
+
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
 
-def hook_progress(request_id, session_id=None):
-    def hook(value, total, preview_image):
-        comfy.model_management.throw_exception_if_processing_interrupted()
-        preview = None
+                request_id = next(iter(self.pending))
+                ctx, preview_image = self.pending.pop(request_id)
+
+            try:
+                preview = encode_preview(preview_image, ctx.preview_format)
+                ctx.write_preview(preview)
+            except Exception:
+                pass
+
+preview_encoder = PreviewEncoder()
+
+class CancellationToken:
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self):
+        self.event.set()
+
+    def throw_if_cancelled(self):
+        if self.event.is_set():
+            raise comfy.model_management.InterruptProcessingException()
+
+class RequestContext:
+    def __init__(self, request_id, session_id=None, token: CancellationToken | None = None):
+        self.request_id = request_id
+        self.session_id = session_id
+        self.token = token if token is not None else CancellationToken(session_id)
+        self.preview_format = "jpeg"
+
+    def progress(self, value, total, preview_image=None):
+        self.write_progress(value, total)
 
         if preview_image is not None:
-            buffered = BytesIO()
-            preview_image.thumbnail(PREVIEW_SIZE, Image.Resampling.LANCZOS)
-            preview_image.save(buffered, format="jpeg", quality=70)
-            preview = "data:image/jpeg;base64," + base64.b64encode(buffered.getvalue()).decode('utf-8')
+            preview_encoder.submit(self, preview_image)
 
-        output.write_event("rpc.progress", { "requestId": request_id, "sessionId": session_id, "value": value, "max": total, "preview": preview })
-        
-    comfy.utils.set_progress_bar_global_hook(hook)
+    def write_progress(self, value, total):
+        output.write_event("rpc.progress", { "requestId": self.request_id, "sessionId": self.session_id, "value": value, "max": total })
+
+    def write_preview(self, preview):
+        output.write_event("rpc.progress", { "requestId": self.request_id, "sessionId": self.session_id, "preview": preview })
+
+    def log(self, type, text):
+        output.write_event("rpc.log", { "requestId": self.request_id, "sessionId": self.session_id, "type": type, "text": text })
+
+# Each executor thread runs its own request, so the context is resolved
+# per thread instead of swapping process-wide hooks.
+request_context: ContextVar[RequestContext | None] = ContextVar("request_context", default=None)
+
+def current() -> RequestContext | None:
+    return request_context.get()
+
+def configure_preview(format: str | None = None):
+    ctx = current()
+    if ctx is not None and format in PREVIEW_FORMATS:
+        ctx.preview_format = format
+
+def throw_if_cancelled():
+    ctx = current()
+    if ctx is not None:
+        ctx.token.throw_if_cancelled()
+
+def hook(value, total, preview_image):
+    comfy.model_management.throw_exception_if_processing_interrupted()
+    ctx = current()
+
+    if ctx is None:
+        output.write_event("comfy.progress", { "value": value, "max": total })
+    else:
+        ctx.progress(value, total, preview_image)
 
 class Rewriter(object):
-    def __init__(self, type, orig, request_id, session_id):
+    def __init__(self, type, orig):
         self.type = type
         self.orig = orig
-        self.request_id = request_id
-        self.session_id = session_id
     def write(self, text):
-        output.write_event("rpc.log", { "requestId": self.request_id, "sessionId": self.session_id, "type": self.type, "text": text })
+        ctx = current()
+        if ctx is None:
+            return self.orig.write(text)
+        ctx.log(self.type, text)
     def __getattr__(self, attr):
-        return getattr(self.orig, attr)     
+        return getattr(self.orig, attr)
+
+def patch_interrupt():
+    throw_exception_if_processing_interrupted = comfy.model_management.throw_exception_if_processing_interrupted
+
+    def throw_exception_if_interrupted_or_cancelled():
+        throw_exception_if_processing_interrupted()
+        throw_if_cancelled()
+
+    comfy.model_management.throw_exception_if_processing_interrupted = throw_exception_if_interrupted_or_cancelled
+
+def transfer_hook(stats):
+    ctx = current()
+    output.write_event("model_transfer", { **stats, "requestId": ctx.request_id if ctx is not None else None })
+
+def install():
+    patch_interrupt()
+    comfy.utils.set_progress_bar_global_hook(hook)
+    if transfer_hook not in comfy.model_management.transfer_callbacks:
+        comfy.model_management.transfer_callbacks.append(transfer_hook)
+    if not isinstance(sys.stdout, Rewriter):
+        sys.stdout = Rewriter("stdout", sys.stdout)
+    if not isinstance(sys.stderr, Rewriter):
+        sys.stderr = Rewriter("stderr", sys.stderr)
 
 @contextmanager
-def use(request_id, session_id=None):
-    current_out = sys.stdout
-    current_err = sys.stderr
+def use(request_id, session_id=None, cancellation_token: CancellationToken | None = None):
+    token = request_context.set(RequestContext(request_id, session_id, cancellation_token))
 
     try:
-        hook_progress(request_id, session_id)
-        sys.stdout = Rewriter("stdout", current_out, request_id, session_id)
-        sys.stderr = Rewriter("stderr", current_err, request_id, session_id)
         yield
     finally:
-        reset_progress()
-        sys.stdout = current_out
-        sys.stderr = current_err
+        request_context.reset(token)
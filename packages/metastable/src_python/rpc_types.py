@@ -17,6 +17,7 @@ Guider = NewType('Guider', comfy.samplers.CFGGuider)
 Noise = NewType('Noise', any)
 Sampler = NewType('Sampler', any)
 Sigmas = NewType('Sigmas', any)
+StepCache = NewType('StepCache', any)
 Conditioning = NewType('Conditioning', any)
 ControlNet = NewType('ControlNet', comfy.controlnet.ControlNet)
 IpAdapter = NewType('IpAdapter', any)
@@ -39,6 +40,8 @@ class ConditioningPair(TypedDict):
 class PreviewSettings(TypedDict):
     method: str
     taesd: NotRequired[dict[str, str]]
+    format: NotRequired[str]
+    max_fps: NotRequired[float]
 
 class CachedModelInfo(TypedDict):
     path: str
@@ -46,6 +49,9 @@ class CachedModelInfo(TypedDict):
     config_path: NotRequired[str]
     model_type: NotRequired[str]
 
+class PrefetchModelInfo(CachedModelInfo):
+    loader: str
+
 class TrainingInput(TypedDict):
     latent: Latent
     prompt: str
@@ -0,0 +1,137 @@
+import threading
+import time
+import itertools
+import heapq
+import traceback
+from typing import Callable
+
+import output
+
+class Lane:
+    name: str
+    priority: int
+    concurrency: int
+    excludes: tuple[str, ...]
+
+    def __init__(self, name: str, priority: int, concurrency: int, excludes: tuple[str, ...] = ()):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.excludes = excludes
+        self.running = 0
+        self.queued = 0
+
+# Lower priority values are dispatched first. Lanes never run at the same
+# time as the lanes they exclude, sampling jobs run concurrently so their
+# model calls can be batched together, but never next to other GPU work.
+DEFAULT_LANES = [
+    Lane("trivial", priority=0, concurrency=2),
+    Lane("gpu", priority=1, concurrency=1, excludes=("sampling",)),
+    Lane("sampling", priority=1, concurrency=4, excludes=("gpu",)),
+    Lane("cpu", priority=2, concurrency=2),
+]
+
+DEFAULT_LANE = "cpu"
+
+class Job:
+    def __init__(self, lane: Lane, func: Callable, args: tuple, request_id=None):
+        self.lane = lane
+        self.func = func
+        self.args = args
+        self.request_id = request_id
+        self.submitted_at = time.perf_counter()
+
+class Scheduler:
+    """
+    Dispatches jobs onto a fixed set of worker threads. Each lane has its own
+    concurrency limit; when several lanes have work ready, the lane with the
+    lowest priority value goes first, FIFO within a lane.
+    """
+
+    def __init__(self, lanes: list[Lane] = DEFAULT_LANES):
+        self.lanes = { lane.name: Lane(lane.name, lane.priority, lane.concurrency, lane.excludes) for lane in lanes }
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.workers = []
+
+        for i in range(sum(lane.concurrency for lane in self.lanes.values())):
+            worker = threading.Thread(target=self.work, name=f"rpc-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def get_lane(self, name: str | None) -> Lane:
+        if name in self.lanes:
+            return self.lanes[name]
+        return self.lanes[DEFAULT_LANE]
+
+    def submit(self, lane_name: str | None, func: Callable, *args, request_id=None):
+        lane = self.get_lane(lane_name)
+        job = Job(lane, func, args, request_id)
+
+        with self.condition:
+            lane.queued += 1
+            heapq.heappush(self.queue, (lane.priority, next(self.counter), job))
+            self.condition.notify()
+
+    def next_job(self) -> Job | None:
+        skipped = []
+        blocked = set()
+        job = None
+
+        while self.queue:
+            item = heapq.heappop(self.queue)
+            lane = item[2].lane
+            excluded = any(self.lanes[name].running > 0 for name in lane.excludes if name in self.lanes)
+            if lane.running < lane.concurrency and not excluded and lane.name not in blocked:
+                job = item[2]
+                break
+            if excluded:
+                # Jobs submitted later to the lanes blocking this one wait,
+                # so a stream of them can't starve it.
+                blocked.update(lane.excludes)
+            skipped.append(item)
+
+        for item in skipped:
+            heapq.heappush(self.queue, item)
+
+        return job
+
+    def work(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self.next_job()
+
+                job.lane.queued -= 1
+                job.lane.running += 1
+                stats = self.stats()
+
+            self.emit_stats(job, stats)
+
+            try:
+                job.func(*job.args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    job.lane.running -= 1
+                    self.condition.notify_all()
+
+    def stats(self):
+        return {
+            name: {
+                "queued": lane.queued,
+                "running": lane.running,
+            } for name, lane in self.lanes.items()
+        }
+
+    def emit_stats(self, job: Job, stats: dict):
+        output.write_event("rpc.queue", {
+            "requestId": job.request_id,
+            "lane": job.lane.name,
+            "waitTime": time.perf_counter() - job.submitted_at,
+            "lanes": stats,
+        })
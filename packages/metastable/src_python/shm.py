@@ -0,0 +1,138 @@
+import os
+import mmap
+import tempfile
+import threading
+from io import BytesIO
+from uuid import uuid4
+import torch
+
+DTYPES = {
+    "float64": torch.float64,
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "int64": torch.int64,
+    "int32": torch.int32,
+    "int16": torch.int16,
+    "int8": torch.int8,
+    "uint8": torch.uint8,
+    "bool": torch.bool,
+}
+
+DTYPE_NAMES = { value: key for key, value in DTYPES.items() }
+
+def get_shared_dir() -> str:
+    path = os.environ.get("METASTABLE_SHM_DIR")
+    if not path:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        path = os.path.join(base, "metastable")
+
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class SharedBuffer:
+    def __init__(self, name: str, size: int = 0, create: bool = False):
+        self.name = name
+        self.path = os.path.join(get_shared_dir(), os.path.basename(name))
+        # Only the process that created a segment removes its file.
+        self.created = create
+
+        with open(self.path, "w+b" if create else "r+b") as f:
+            if create:
+                # Empty files can't be mapped.
+                f.truncate(max(size, 1))
+            self.mmap = mmap.mmap(f.fileno(), 0)
+
+    def close(self, unlink: bool | None = None):
+        try:
+            self.mmap.close()
+        except BufferError:
+            # Tensors still point at this buffer, the mapping will be freed with them.
+            pass
+
+        if unlink is None:
+            unlink = self.created
+        if unlink:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+class SharedMemoryStore:
+    """
+    Keeps track of memory-mapped buffers shared with the host, referenced as
+    { "$shm": name, "offset": int, "size": int, "dtype": str, "shape": list[int] }.
+    Buffers created here are unlinked on release, buffers opened by name are
+    owned by the host and only unmapped.
+    """
+
+    def __init__(self):
+        self.buffers: dict[str, SharedBuffer] = {}
+        self.lock = threading.Lock()
+
+    def open(self, name: str) -> SharedBuffer:
+        with self.lock:
+            if name not in self.buffers:
+                self.buffers[name] = SharedBuffer(name)
+            return self.buffers[name]
+
+    def create(self, size: int) -> SharedBuffer:
+        buffer = SharedBuffer(str(uuid4()), size, create=True)
+        with self.lock:
+            self.buffers[buffer.name] = buffer
+        return buffer
+
+    def put(self, obj):
+        if isinstance(obj, BytesIO):
+            data = obj.getbuffer()
+            buffer = self.create(data.nbytes)
+            buffer.mmap[:data.nbytes] = data
+            return { "$shm": buffer.name, "offset": 0, "size": data.nbytes }
+
+        tensor = obj.detach().cpu().contiguous()
+        size = tensor.numel() * tensor.element_size()
+        buffer = self.create(size)
+        if size > 0:
+            target = torch.frombuffer(buffer.mmap, dtype=tensor.dtype, count=tensor.numel())
+            target.copy_(tensor.reshape(-1))
+            del target
+
+        return {
+            "$shm": buffer.name,
+            "offset": 0,
+            "size": size,
+            "dtype": DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+        }
+
+    def get(self, ref: dict):
+        buffer = self.open(ref["$shm"])
+        offset = ref.get("offset", 0)
+        size = ref.get("size", len(buffer.mmap) - offset)
+
+        if "dtype" not in ref:
+            return BytesIO(buffer.mmap[offset:offset + size])
+
+        dtype = DTYPES[ref["dtype"]]
+        shape = ref.get("shape", [-1])
+        count = size // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            return torch.empty(shape, dtype=dtype)
+
+        # Views the mapped memory directly, without copying.
+        return torch.frombuffer(buffer.mmap, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    def release(self, name: str):
+        with self.lock:
+            buffer = self.buffers.pop(name, None)
+
+        if buffer is not None:
+            buffer.close()
+
+    def release_all(self):
+        with self.lock:
+            buffers = list(self.buffers.values())
+            self.buffers = {}
+
+        for buffer in buffers:
+            buffer.close()
@@ -0,0 +1,479 @@
+import os
+import json
+import queue
+import hashlib
+import logging
+import threading
+from typing import TypedDict
+import torch
+
+import comfy.sd
+import comfy.utils
+import comfy.model_base
+import comfy.model_patcher
+import comfy.model_detection
+import comfy.model_management
+from comfy.cli_args import args
+
+# Bump when the stored layout changes, so older entries are ignored.
+VERSION = 2
+SUPPORTED_EXTENSIONS = (".safetensors", ".sft", ".ckpt", ".pt", ".pth", ".bin")
+MODELS_DIR = "models"
+
+# Flags that change the dtypes of the stored tensors.
+PRECISION_ARGS = (
+    "cpu", "force_fp32", "force_fp16",
+    "fp32_unet", "fp64_unet", "bf16_unet", "fp16_unet", "fp8_e4m3fn_unet", "fp8_e5m2_unet",
+    "fp16_vae", "fp32_vae", "bf16_vae", "cpu_vae",
+    "fp8_e4m3fn_text_enc", "fp8_e5m2_text_enc", "fp16_text_enc", "fp32_text_enc",
+)
+
+# Each component of a cached entry is stored under its own prefix, in the
+# layout it has once loaded.
+MODEL_PREFIX = "model."
+CLIP_PREFIX = "clip."
+VAE_PREFIX = "vae."
+
+UNET_CONFIG_KEY = "metastable.unet_config"
+MODEL_TYPE_KEY = "metastable.model_type"
+UNET_DTYPE_KEY = "metastable.unet_dtype"
+MANUAL_CAST_DTYPE_KEY = "metastable.manual_cast_dtype"
+
+index_lock = threading.Lock()
+
+class StateCacheStats(TypedDict):
+    entries: int
+    size: int
+    budget: int | None
+    hits: int
+    misses: int
+    writes: int
+
+stats_lock = threading.Lock()
+counters = { "hits": 0, "misses": 0, "writes": 0 }
+
+def count(name: str):
+    with stats_lock:
+        counters[name] += 1
+
+def get_cache_dir() -> str | None:
+    path = os.environ.get("METASTABLE_STATE_CACHE_DIR")
+    if not path:
+        return None
+
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_budget() -> int | None:
+    try:
+        budget = int(os.environ.get("METASTABLE_STATE_CACHE_BUDGET", ""))
+    except ValueError:
+        return None
+    return budget if budget > 0 else None
+
+def get_models_dir() -> str | None:
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+
+    path = os.path.join(cache_dir, MODELS_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def is_cacheable(path: str) -> bool:
+    """
+    Converted model state is only cached with a disk budget set.
+    """
+
+    return get_budget() is not None and get_cache_dir() is not None and path.lower().endswith(SUPPORTED_EXTENSIONS)
+
+def read_index(name: str) -> dict:
+    try:
+        with open(os.path.join(get_cache_dir(), name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_index(name: str, index: dict):
+    index_path = os.path.join(get_cache_dir(), name)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+# Fallback for when there is no cache directory.
+memory_indexes: dict[str, dict] = {}
+
+def remember(index_name: str, path: str, key: str, compute) -> str:
+    """
+    Returns a value computed from the file at path, remembered by path, key,
+    mtime and size so it's only computed once.
+    """
+
+    stat = os.stat(path)
+    index_key = os.path.abspath(path) + "|" + key
+    persistent = get_cache_dir() is not None
+
+    with index_lock:
+        index = read_index(index_name) if persistent else memory_indexes.setdefault(index_name, {})
+        entry = index.get(index_key)
+        if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return entry["hash"]
+
+    value = compute()
+
+    with index_lock:
+        index = read_index(index_name) if persistent else memory_indexes.setdefault(index_name, {})
+        index[index_key] = { "mtime": stat.st_mtime, "size": stat.st_size, "hash": value }
+        if persistent:
+            write_index(index_name, index)
+
+    return value
+
+def file_key(path: str) -> str:
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_mtime}|{stat.st_size}"
+
+def state_dict_hash(sd: dict) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    for k in sorted(sd.keys()):
+        t = sd[k]
+        if not isinstance(t, torch.Tensor):
+            continue
+
+        digest.update(k.encode("utf-8"))
+        digest.update(str(t.dtype).encode("utf-8"))
+        digest.update(str(tuple(t.shape)).encode("utf-8"))
+        data = t.detach().to("cpu").contiguous().reshape(-1).view(torch.uint8)
+        digest.update(memoryview(data.numpy()))
+
+    return digest.hexdigest()
+
+def component_hash(path: str, kind: str, sd: dict) -> str:
+    """
+    Fingerprint of a sub-model (text encoder, VAE) stored in the file at path.
+    """
+
+    return remember("components.json", path, kind, lambda: state_dict_hash(sd))
+
+def cache_key(path: str, options: dict) -> str:
+    # Files are identified by path, mtime and size, so nothing is read to look up an entry.
+    device = comfy.model_management.get_torch_device()
+    environment = {
+        "version": VERSION,
+        "device": comfy.model_management.get_torch_device_name(device),
+        "args": { name: getattr(args, name, None) for name in PRECISION_ARGS },
+    }
+
+    data = json.dumps([file_key(path), options, environment], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def prepare_state_dict(sd: dict) -> dict:
+    # safetensors doesn't store tensors sharing memory or non-contiguous tensors.
+    out = {}
+    seen = set()
+    for k, t in sd.items():
+        if not isinstance(t, torch.Tensor):
+            continue
+
+        t = t.detach().to("cpu")
+        ptr = t.untyped_storage().data_ptr() if t.nelement() > 0 else None
+        if ptr is not None and ptr in seen:
+            t = t.clone()
+        elif ptr is not None:
+            seen.add(ptr)
+
+        out[k] = t.contiguous()
+    return out
+
+def with_prefix(sd: dict, prefix: str) -> dict:
+    return { prefix + k: v for k, v in sd.items() }
+
+def without_prefix(sd, prefix: str) -> dict:
+    return { k[len(prefix):]: sd[k] for k in sd.keys() if k.startswith(prefix) }
+
+def parse_dtype(value: str | None) -> torch.dtype | None:
+    if value is None or value == "None":
+        return None
+    return getattr(torch, value.removeprefix("torch."))
+
+def model_metadata(model) -> dict | None:
+    """
+    What's needed to build the model without detecting it again, None if the
+    config can't be stored.
+    """
+
+    model_config = model.model.model_config
+    if model_config.scaled_fp8 is not None:
+        # Detected from a marker key the loaded weights don't have.
+        return None
+
+    # The inference dtype is set on the config once detected, it's stored on its own.
+    unet_config = { k: v for k, v in model_config.unet_config.items() if k != "dtype" }
+    try:
+        unet_config = json.dumps(unet_config)
+    except (TypeError, ValueError):
+        return None
+
+    # Stored configs go through JSON, which may not match the same model.
+    restored = comfy.model_detection.model_config_from_unet_config(json.loads(unet_config))
+    if type(restored) is not type(model_config):
+        return None
+
+    return {
+        UNET_CONFIG_KEY: unet_config,
+        MODEL_TYPE_KEY: model.model.model_type.name,
+        UNET_DTYPE_KEY: str(model_config.unet_config.get("dtype")),
+        MANUAL_CAST_DTYPE_KEY: str(model_config.manual_cast_dtype),
+    }
+
+def prune(directory: str, budget: int):
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith(".safetensors"):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= budget:
+            break
+        remove_file(path)
+        total -= size
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning("Unable to remove state cache file {}: {}".format(path, e))
+
+class Writer:
+    """
+    Writes cache entries on a background thread, so the first load of a
+    model doesn't wait for its copy to reach the disk.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, cached_path: str, sd: dict, metadata: dict):
+        with self.lock:
+            if cached_path in self.pending:
+                return
+            self.pending.add(cached_path)
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="state-cache-writer", daemon=True)
+                self.thread.start()
+
+        self.queue.put((cached_path, sd, metadata))
+
+    def run(self):
+        while True:
+            cached_path, sd, metadata = self.queue.get()
+            try:
+                write(cached_path, sd, metadata)
+            finally:
+                with self.lock:
+                    self.pending.discard(cached_path)
+
+writer = Writer()
+
+def write(cached_path: str, sd: dict, metadata: dict):
+    tmp_path = cached_path + ".tmp"
+    try:
+        comfy.utils.save_torch_file(sd, tmp_path, metadata=metadata)
+        os.replace(tmp_path, cached_path)
+        count("writes")
+    except Exception as e:
+        logging.warning("Unable to write state cache entry: {}".format(e))
+        remove_file(tmp_path)
+        return
+
+    budget = get_budget()
+    if budget is not None:
+        prune(os.path.dirname(cached_path), budget)
+
+def save(cached_path: str, model, clip=None, vae=None, metadata: dict | None = None):
+    extra = model_metadata(model)
+    if extra is None:
+        return
+
+    metadata = { k: str(v) for k, v in (metadata or {}).items() }
+    metadata.update(extra)
+
+    sd = with_prefix(model.model.state_dict(), MODEL_PREFIX)
+    if clip is not None:
+        sd.update(with_prefix(clip.get_sd(), CLIP_PREFIX))
+    if vae is not None:
+        sd.update(with_prefix(vae.get_sd(), VAE_PREFIX))
+
+    # Copied off the GPU here, so the writer doesn't keep VRAM alive.
+    writer.submit(cached_path, prepare_state_dict(sd), metadata)
+
+def load_model(sd: dict, metadata: dict):
+    """
+    Builds the model patcher straight from a stored entry, skipping detection
+    and the conversion of the weights.
+    """
+
+    model_config = comfy.model_detection.model_config_from_unet_config(json.loads(metadata[UNET_CONFIG_KEY]))
+    if model_config is None:
+        raise RuntimeError("Unknown model config.")
+
+    model_config.set_inference_dtype(parse_dtype(metadata[UNET_DTYPE_KEY]), parse_dtype(metadata[MANUAL_CAST_DTYPE_KEY]))
+    # Detected from the original weights, which stored ones don't have the layout of.
+    model_type = comfy.model_base.ModelType[metadata[MODEL_TYPE_KEY]]
+    model_config.model_type = lambda state_dict, prefix="": model_type
+
+    model_sd = without_prefix(sd, MODEL_PREFIX)
+    parameters = comfy.utils.calculate_parameters(model_sd, "diffusion_model.")
+    load_device = comfy.model_management.get_torch_device()
+    inital_load_device = comfy.model_management.unet_inital_load_device(parameters, model_config.unet_config.get("dtype"))
+
+    with comfy.utils.span("construct"):
+        model = model_config.get_model(model_sd, "diffusion_model.", device=inital_load_device)
+    with comfy.utils.span("cast"):
+        m, u = model.load_state_dict(model_sd, strict=False)
+    if len(m) > 0:
+        logging.warning("unet missing: {}".format(m))
+    if len(u) > 0:
+        logging.warning("unet unexpected: {}".format(u))
+
+    model_patcher = comfy.model_patcher.ModelPatcher(model, load_device=load_device, offload_device=comfy.model_management.unet_offload_device())
+    if inital_load_device != torch.device("cpu"):
+        comfy.model_management.load_models_gpu([model_patcher], force_full_load=True)
+    return model_patcher
+
+def load_clip(model_config, clip_sd: dict, embedding_directory=None):
+    # Text encoders are detected from keys in checkpoint layout.
+    clip_target = model_config.clip_target(state_dict=model_config.process_clip_state_dict_for_saving(dict(clip_sd)))
+    if clip_target is None:
+        return None
+
+    parameters = comfy.utils.calculate_parameters(clip_sd)
+    with comfy.utils.span("construct"):
+        clip = comfy.sd.CLIP(clip_target, embedding_directory=embedding_directory, tokenizer_data=clip_sd, parameters=parameters)
+    with comfy.utils.span("cast"):
+        clip.load_sd(clip_sd, full_model=True)
+    return clip
+
+def load_vae(vae_sd: dict, metadata: dict):
+    with comfy.utils.span("construct"):
+        return comfy.sd.VAE(sd=vae_sd, metadata=metadata)
+
+def load_from_cache(cached_path: str, load_function):
+    if not os.path.exists(cached_path):
+        count("misses")
+        return None
+
+    try:
+        sd, metadata = comfy.utils.load_torch_file(cached_path, return_metadata=True)
+        out = load_function(sd, metadata)
+    except Exception as e:
+        logging.warning("Invalid state cache entry, removing: {}".format(e))
+        remove_file(cached_path)
+        count("misses")
+        return None
+
+    # Entries are evicted least recently used first.
+    os.utime(cached_path)
+    count("hits")
+    return out
+
+def load_checkpoint(path: str, embedding_directory=None, load_component=None):
+    """
+    Loads a checkpoint through the state cache. The cached copy holds the
+    diffusion model, text encoder and VAE state dicts as loaded, already
+    converted and cast, with what's needed to build them in its metadata.
+    """
+
+    if load_component is None:
+        load_component = lambda kind, component_sd, load: load()
+
+    def load(sd, metadata):
+        model = load_model(sd, metadata)
+        model_config = model.model.model_config
+
+        clip_sd = without_prefix(sd, CLIP_PREFIX)
+        clip = load_component("clip", clip_sd, lambda: load_clip(model_config, clip_sd, embedding_directory)) if len(clip_sd) > 0 else None
+
+        vae_sd = without_prefix(sd, VAE_PREFIX)
+        vae = load_component("vae", vae_sd, lambda: load_vae(vae_sd, metadata)) if len(vae_sd) > 0 else None
+        return (model, clip, vae, None)
+
+    def load_original():
+        sd, metadata = comfy.utils.load_torch_file(path, return_metadata=True)
+        out = comfy.sd.load_state_dict_guess_config(sd, output_vae=True, output_clip=True, embedding_directory=embedding_directory, metadata=metadata, load_component=load_component)
+        if out is None:
+            raise RuntimeError("ERROR: Could not detect model type of: {}".format(path))
+        return out, metadata
+
+    if not is_cacheable(path):
+        return load_original()[0]
+
+    cached_path = os.path.join(get_models_dir(), cache_key(path, { "type": "checkpoint" }) + ".safetensors")
+    out = load_from_cache(cached_path, load)
+    if out is not None:
+        return out
+
+    out, metadata = load_original()
+    (model, clip, vae, _) = out
+    save(cached_path, model, clip, vae, metadata)
+    return out
+
+def load_diffusion_model(path: str, model_options={}):
+    if not is_cacheable(path) or len(model_options) > 0:
+        return comfy.sd.load_diffusion_model(path, model_options=model_options)
+
+    cached_path = os.path.join(get_models_dir(), cache_key(path, { "type": "diffusion_model" }) + ".safetensors")
+    model = load_from_cache(cached_path, load_model)
+    if model is not None:
+        return model
+
+    sd, metadata = comfy.utils.load_torch_file(path, return_metadata=True)
+    model = comfy.sd.load_diffusion_model_state_dict(sd, model_options=model_options)
+    if model is None:
+        raise RuntimeError("ERROR: Could not detect model type of: {}".format(path))
+    del sd
+
+    save(cached_path, model, metadata=metadata)
+    return model
+
+def stats() -> StateCacheStats:
+    entries = 0
+    size = 0
+    directory = get_models_dir() if get_budget() is not None else None
+    if directory is not None:
+        for name in os.listdir(directory):
+            if name.endswith(".safetensors"):
+                try:
+                    size += os.path.getsize(os.path.join(directory, name))
+                    entries += 1
+                except OSError:
+                    pass
+
+    with stats_lock:
+        return {
+            "entries": entries,
+            "size": size,
+            "budget": get_budget(),
+            **counters,
+        }
+
+def clear():
+    directory = get_models_dir()
+    if directory is None:
+        return
+
+    for name in os.listdir(directory):
+        remove_file(os.path.join(directory, name))
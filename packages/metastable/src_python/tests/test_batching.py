@@ -0,0 +1,167 @@
+import threading
+import time
+import unittest
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+def import_batching():
+    import comfy.cli_args
+    # Tests run without a GPU.
+    comfy.cli_args.args.cpu = True
+    from namespaces.base.utils import batching
+    return batching
+
+class FakeModel:
+    def __init__(self, fail_merged=False, fail=False):
+        self.fail_merged = fail_merged
+        self.fail = fail
+        self.calls = []
+
+    def memory_required(self, input_shape):
+        return 0
+
+    def apply_model(self, x, t, **kwargs):
+        self.calls.append(x.shape[0])
+        if self.fail or (self.fail_merged and x.shape[0] > 1):
+            raise ValueError("apply_model failed")
+        return x * 2
+
+def forward_request(batching, model, value):
+    args = {"input": torch.full((1, 4), float(value)), "timestep": torch.zeros(1), "c": {"transformer_options": {}}}
+    return batching.ForwardRequest(model.apply_model, args)
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class BatchEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.batching = import_batching()
+        self.engine = self.batching.BatchEngine()
+
+    def test_merged(self):
+        model = FakeModel()
+        requests = [forward_request(self.batching, model, i) for i in range(3)]
+
+        self.engine.execute(requests)
+
+        self.assertEqual(model.calls, [3])
+        for i, request in enumerate(requests):
+            self.assertTrue(request.done)
+            self.assertIsNone(request.error)
+            self.assertTrue(torch.equal(request.output, torch.full((1, 4), 2.0 * i)))
+
+    def test_merged_failure_retries_one_by_one(self):
+        model = FakeModel(fail_merged=True)
+        requests = [forward_request(self.batching, model, i) for i in range(2)]
+
+        self.engine.execute(requests)
+
+        self.assertEqual(model.calls, [2, 1, 1])
+        for request in requests:
+            self.assertTrue(request.done)
+            self.assertIsNone(request.error)
+            self.assertIsNotNone(request.output)
+
+    def test_failure_sets_error_on_every_request(self):
+        model = FakeModel(fail=True)
+        requests = [forward_request(self.batching, model, i) for i in range(2)]
+
+        self.engine.execute(requests)
+
+        for request in requests:
+            self.assertTrue(request.done)
+            self.assertIsInstance(request.error, ValueError)
+
+    def test_done_when_batching_fails(self):
+        model = FakeModel()
+        model.memory_required = None
+        requests = [forward_request(self.batching, model, i) for i in range(2)]
+
+        self.engine.execute(requests)
+
+        for request in requests:
+            self.assertTrue(request.done)
+            self.assertIsInstance(request.error, TypeError)
+
+class TinyModel(torch.nn.Module if torch is not None else object):
+    """
+    Small real model with the apply_model signature, conditioned on the
+    timestep and a batch-aligned cross attention tensor.
+    """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.proj = torch.nn.Linear(4, 4).double()
+        self.context = torch.nn.Linear(3, 4).double()
+        self.batch_sizes = []
+
+    def memory_required(self, input_shape):
+        return 0
+
+    def apply_model(self, x, t, c_crossattn=None, transformer_options={}):
+        self.batch_sizes.append(x.shape[0])
+        h = self.proj(x) * t.reshape(-1, 1)
+        return torch.tanh(h + self.context(c_crossattn).mean(dim=1))
+
+def model_args(seed, step):
+    generator = torch.Generator().manual_seed(seed * 100 + step)
+    return {
+        "input": torch.randn((2, 4), generator=generator, dtype=torch.float64),
+        "timestep": torch.full((2,), 1.0 - step / 10, dtype=torch.float64),
+        "c": {
+            "c_crossattn": torch.randn((2, 5, 3), generator=generator, dtype=torch.float64),
+            "transformer_options": {"cond_or_uncond": [0, 1]},
+        },
+    }
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class BatchEngineModelTest(unittest.TestCase):
+    steps = 3
+
+    def setUp(self):
+        self.batching = import_batching()
+
+    def run_job(self, engine, model, seed, outputs, jobs):
+        with engine.job(model):
+            # Start stepping once every job has joined, so their calls merge.
+            while engine.active < jobs:
+                time.sleep(0.001)
+            for step in range(self.steps):
+                outputs.append(engine.forward(model.apply_model, model_args(seed, step)))
+
+    def test_merged_outputs_match_single_job(self):
+        model = TinyModel()
+        expected = {}
+        for seed in (1, 2):
+            expected[seed] = [model.apply_model(a["input"], a["timestep"], **a["c"]) for a in (model_args(seed, step) for step in range(self.steps))]
+        model.batch_sizes = []
+
+        engine = self.batching.BatchEngine(max_wait=5)
+        outputs = {1: [], 2: []}
+        threads = [threading.Thread(target=self.run_job, args=(engine, model, seed, outputs[seed], 2)) for seed in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        # Both jobs ran every step in one merged call.
+        self.assertEqual(model.batch_sizes, [4] * self.steps)
+        for seed in (1, 2):
+            self.assertEqual(len(outputs[seed]), self.steps)
+            for output, reference in zip(outputs[seed], expected[seed]):
+                self.assertEqual(output.shape, reference.shape)
+                self.assertTrue(torch.allclose(output, reference, rtol=1e-12, atol=1e-12))
+
+    def test_single_job_is_not_batched(self):
+        model = TinyModel()
+        engine = self.batching.BatchEngine(max_wait=5)
+        outputs = []
+
+        self.run_job(engine, model, 1, outputs, 1)
+
+        self.assertEqual(model.batch_sizes, [2] * self.steps)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import threading
+import unittest
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+def import_model_cache():
+    import comfy.cli_args
+    # Tests run without a GPU.
+    comfy.cli_args.args.cpu = True
+    import model_cache
+    return model_cache
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class LoadComponentTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = import_model_cache().ModelCache()
+
+    def test_concurrent_loads_build_once(self):
+        started = threading.Event()
+        finish = threading.Event()
+        builds = []
+
+        def load():
+            builds.append(1)
+            started.set()
+            finish.wait(5)
+            return object()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.load_component("vae", load))) for _ in range(2)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+        finish.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(builds), 1)
+        self.assertIs(results[0], results[1])
+        self.assertEqual(self.cache.components["vae"].refs, 2)
+
+    def test_released_with_last_ref(self):
+        obj = self.cache.load_component("vae", object)
+        self.assertIs(self.cache.load_component("vae", object), obj)
+
+        self.cache.release_components(["vae"])
+        self.assertIn("vae", self.cache.components)
+        self.cache.release_components(["vae"])
+        self.assertNotIn("vae", self.cache.components)
+
+    def test_failed_load_is_retried(self):
+        def fail():
+            raise ValueError("load failed")
+
+        with self.assertRaises(ValueError):
+            self.cache.load_component("vae", fail)
+
+        self.assertNotIn("vae", self.cache.component_loads)
+        self.assertIsNotNone(self.cache.load_component("vae", object))
+
+if __name__ == "__main__":
+    unittest.main()
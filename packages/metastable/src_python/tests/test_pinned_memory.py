@@ -0,0 +1,85 @@
+import gc
+import unittest
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class PinnedMemoryPoolTest(unittest.TestCase):
+    def create_pool(self, budget, allocate=None):
+        from comfy.pinned_memory import PinnedMemoryPool
+        # Regular memory stands in for pinned memory on machines without a GPU.
+        if allocate is None:
+            allocate = lambda tensor: torch.empty(tensor.shape, dtype=tensor.dtype)
+        return PinnedMemoryPool(budget, supported=True, allocate=allocate)
+
+    def test_pin_within_budget(self):
+        pool = self.create_pool(1024)
+        tensor = torch.arange(64, dtype=torch.float32)
+
+        out = pool.pin(tensor)
+
+        self.assertTrue(torch.equal(out, tensor))
+        self.assertEqual(pool.stats(), {"budget": 1024, "used": 256, "pinned": 1, "fallbacks": 0})
+
+    def test_fallback_over_budget(self):
+        pool = self.create_pool(300)
+        first = pool.pin(torch.zeros(64))
+
+        self.assertIsNotNone(first)
+        self.assertIsNone(pool.pin(torch.zeros(64)))
+        self.assertEqual(pool.stats(), {"budget": 300, "used": 256, "pinned": 1, "fallbacks": 1})
+
+    def test_fallback_when_allocation_fails(self):
+        def allocate(tensor):
+            raise RuntimeError("out of pinned memory")
+
+        pool = self.create_pool(1024, allocate)
+
+        self.assertIsNone(pool.pin(torch.zeros(64)))
+        self.assertEqual(pool.stats(), {"budget": 1024, "used": 0, "pinned": 0, "fallbacks": 1})
+
+    def test_release_when_storage_is_freed(self):
+        pool = self.create_pool(1024)
+        out = pool.pin(torch.zeros(64))
+        self.assertTrue(pool.has_pinned())
+
+        del out
+        gc.collect()
+
+        self.assertFalse(pool.has_pinned())
+        self.assertEqual(pool.stats()["used"], 0)
+
+    def test_storage_kept_alive_by_parameter(self):
+        pool = self.create_pool(1024)
+        param = torch.nn.Parameter(torch.ones(64))
+        param.data = pool.pin(param.data)
+        gc.collect()
+
+        self.assertEqual(pool.stats()["used"], 256)
+
+        del param
+        gc.collect()
+
+        self.assertEqual(pool.stats()["used"], 0)
+
+    def test_freed_storage_makes_room(self):
+        pool = self.create_pool(300)
+        out = pool.pin(torch.zeros(64))
+        del out
+        gc.collect()
+
+        self.assertIsNotNone(pool.pin(torch.zeros(64)))
+        self.assertEqual(pool.stats()["fallbacks"], 0)
+
+    def test_disabled_without_budget(self):
+        pool = self.create_pool(0)
+        tensor = torch.zeros(4)
+
+        self.assertFalse(pool.enabled())
+        self.assertIs(pool.to_host(tensor), tensor)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -82,6 +82,7 @@ export interface ConfigType {
     env?: Record<string, string>;
     cpuVae?: boolean;
     fast?: boolean;
+    stateCacheSize?: number;
   };
   downloader: {
     apiKeys: Record<string, string>;